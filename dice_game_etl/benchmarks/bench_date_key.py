@@ -0,0 +1,39 @@
+# benchmarks/bench_date_key.py
+"""
+Micro-benchmark: date keys via strftime round-trip vs. to_date_key arithmetic.
+
+Run from the project root:
+    python -m benchmarks.bench_date_key [rows]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.date_keys import to_date_key
+
+
+def _best_of(fn, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(rows: int = 1_000_000):
+    rng = np.random.default_rng(0)
+    seconds = rng.integers(0, 366 * 24 * 3600, size=rows)
+    values = pd.Series(pd.Timestamp("2024-01-01", tz="UTC-06:00") + pd.to_timedelta(seconds, unit="s"))
+
+    strftime_time = _best_of(lambda: values.dt.strftime("%Y%m%d").astype(int))
+    arithmetic_time = _best_of(lambda: to_date_key(values))
+
+    print(f"rows: {rows:,}")
+    print(f"  strftime round-trip: {strftime_time:.3f}s")
+    print(f"  to_date_key:         {arithmetic_time:.3f}s")
+    print(f"  speedup:             {strftime_time / arithmetic_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
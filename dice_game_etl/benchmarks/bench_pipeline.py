@@ -0,0 +1,181 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end benchmark: runs the pipeline on synthetic data at several scales
+and compares the stage timings against a stored baseline.
+
+Each scale's sources are generated once (benchmarks.synthetic_data) and
+cached under the work directory. Every run is a fresh interpreter, so peak
+memory is measured per run, and its stage figures are read from the run
+manifest (src.instrumentation). The best of --repeat runs is kept.
+
+Run from the project root:
+    python -m benchmarks.bench_pipeline --scales 1 10 100 --save-baseline
+    python -m benchmarks.bench_pipeline --scales 1 10 100
+
+The second command exits with status 1 if any stage got slower (or used
+more memory) than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+import pandas as pd
+import src.config as config
+from benchmarks.synthetic_data import generate
+
+BENCHMARK_DIR = config.PROCESSED_DATA_DIR / "_benchmark"
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+# Benchmark metrics and the manifest stages summed into each
+METRIC_STAGES = {
+    "load": ["load"],
+    # Play sessions are parsed while they are checked, in the dq.play_session stage
+    "dq": ["dq", "dq.play_session"],
+    "dimensions": ["transform.dim_"],
+    "facts": ["transform.fact_", "transform.rollups"],
+    "insights": ["insights"],
+    "total": ["load", "dq", "dq.play_session", "transform", "insights"],
+}
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.05
+MIN_RSS_DELTA_MB = 20
+
+
+def _stage_metrics(manifest: dict) -> dict:
+    """Wall seconds per METRIC_STAGES entry, plus the run's peak RSS."""
+    metrics = {}
+    for metric, prefixes in METRIC_STAGES.items():
+        # Whole-name match for top-level stages, prefix match for "transform.dim_" etc.
+        stages = [s for s in manifest["stages"] if any(
+            s["name"] == p or (p.endswith("_") and s["name"].startswith(p)) for p in prefixes
+        )]
+        metrics[metric] = round(sum(s["wall_seconds"] for s in stages), 4)
+    peaks = [s["peak_rss_mb"] for s in manifest["stages"] if s["peak_rss_mb"] is not None]
+    metrics["peak_rss_mb"] = round(max(peaks), 1) if peaks else None
+    return metrics
+
+
+def _run_child(scale_dir: Path, backend: str, stream: bool, fact_processes: int):
+    """Runs the pipeline on scale_dir/raw with every output redirected under scale_dir."""
+    processed = scale_dir / "processed"
+    config.RAW_DATA_DIR = scale_dir / "raw"
+    config.PROCESSED_DATA_DIR = processed
+    config.DIM_DIR = processed / "dimensions"
+    config.FACT_DIR = processed / "facts"
+    config.AGG_DIR = processed / "aggregates"
+    config.STATE_DIR = processed / "_state"
+    config.RUN_MANIFEST_DIR = processed / "_runs"
+    config.DUCKDB_TEMP_DIR = processed / "_duckdb_tmp"
+    config.REPORT_PATH = scale_dir / "analysis_report.md"
+    # Every run measures a full build, not a reuse of the previous one
+    config.STAGE_CACHE_ENABLED = False
+    config.STAGE_CACHE_DIR = processed / "_cache"
+    # Imported only now, so every module picks up the paths above
+    from main import run_pipeline
+    run_pipeline(stream_play_sessions=stream, incremental=False, backend=backend, fact_processes=fact_processes)
+
+
+def run_scale(scale: float, work_dir: Path, backend: str, stream: bool, fact_processes: int,
+              repeat: int, seed: int) -> dict:
+    scale_dir = work_dir / f"scale_{scale:g}"
+    raw_dir = scale_dir / "raw"
+    marker = raw_dir / "_generated.json"
+    if not marker.exists() or json.loads(marker.read_text()).get("seed") != seed:
+        shutil.rmtree(raw_dir, ignore_errors=True)
+        print(f"Generating synthetic sources at scale {scale:g}...")
+        rows = generate(raw_dir, scale=scale, seed=seed)
+        marker.write_text(json.dumps({"scale": scale, "seed": seed, "rows": rows}))
+
+    runs = []
+    for _ in range(repeat):
+        shutil.rmtree(scale_dir / "processed", ignore_errors=True)
+        command = [sys.executable, "-m", "benchmarks.bench_pipeline", "--child", str(scale_dir),
+                   "--backend", backend, "--fact-processes", str(fact_processes)]
+        if stream:
+            command.append("--stream")
+        completed = subprocess.run(command, cwd=config.BASE_DIR, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stdout[-3000:], completed.stderr[-3000:])
+            raise RuntimeError(f"Pipeline run at scale {scale:g} failed (exit code {completed.returncode}).")
+        manifest_path = next((scale_dir / "processed" / "_runs").glob("run_*.json"))
+        runs.append(_stage_metrics(json.loads(manifest_path.read_text())))
+    # Best of the repeats, per metric
+    return {metric: min(run[metric] for run in runs) if runs[0][metric] is not None else None for metric in runs[0]}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a message per metric that regressed by more than tolerance against the baseline."""
+    regressions = []
+    for scale, metrics in results.items():
+        for metric, value in metrics.items():
+            before = baseline.get(scale, {}).get(metric)
+            if value is None or before is None:
+                continue
+            min_delta = MIN_RSS_DELTA_MB if metric == "peak_rss_mb" else MIN_SECONDS_DELTA
+            if value > before * (1 + tolerance) and value - before > min_delta:
+                regressions.append(f"scale {scale} {metric}: {before} -> {value} (+{(value / before - 1):.0%})")
+    return regressions
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100],
+                        help="Scale factors relative to data/raw (1 to 1000).")
+    parser.add_argument("--backend", default=config.EXECUTION_BACKEND, choices=["pandas", "duckdb"])
+    parser.add_argument("--stream", action="store_true", help="Stream play sessions (STREAM_PLAY_SESSIONS).")
+    parser.add_argument("--fact-processes", type=int, default=config.FACT_BUILD_PROCESSES,
+                        help="Worker processes building fact_play_session (FACT_BUILD_PROCESSES).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scale; the best is kept.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, default=BENCHMARK_DIR)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline before failing (0.25 = 25%%).")
+    parser.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        _run_child(args.child, args.backend, args.stream, args.fact_processes)
+        return
+
+    run_config = {"backend": args.backend, "stream": args.stream, "fact_processes": args.fact_processes,
+                  "seed": args.seed}
+    results = {}
+    for scale in args.scales:
+        results[f"{scale:g}"] = run_scale(scale, args.work_dir, args.backend, args.stream, args.fact_processes,
+                                          args.repeat, args.seed)
+        print(f"  scale {scale:g}: {results[f'{scale:g}']}")
+
+    print("\n--- Pipeline Benchmark (wall seconds) ---")
+    print(pd.DataFrame(results).T.rename_axis("scale").to_string())
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({
+            "config": run_config,
+            "environment": {"python": platform.python_version(), "pandas": pd.__version__,
+                            "platform": platform.platform()},
+            "results": results,
+        }, indent=2))
+        print(f"\nBaseline saved to: {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to store one.")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["config"] != run_config:
+        print(f"\nWARNING: baseline was recorded with {baseline['config']}, this run used {run_config}.")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    if regressions:
+        print(f"\nPERFORMANCE REGRESSION against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
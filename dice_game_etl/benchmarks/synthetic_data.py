@@ -0,0 +1,188 @@
+# benchmarks/synthetic_data.py
+"""
+Synthetic source data at a multiple of the size of data/raw.
+
+Writes every file in SOURCE_FILES with the real schemas and relationships:
+registrations, plans and payment details all point at existing rows, about
+85% of plans are open-ended (end date 9999-01-01) and some registrations
+switch plans once. Play sessions per user follow a power law, so a few
+heavy players account for a large share of the sessions, as in real game
+data. The lookup tables (channels, plans, statuses, payment frequencies)
+are reference data and are copied unscaled from data/raw.
+
+Run from the project root:
+    python -m benchmarks.synthetic_data <out_dir> [scale] [seed]
+"""
+import shutil
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.config import RAW_DATA_DIR, SOURCE_FILES
+
+# Row counts of data/raw, i.e. scale 1
+BASE_USERS = 500
+BASE_SESSIONS = 1872
+# Shares observed in data/raw
+REGISTERED_SHARE = 0.4
+PLAN_SWITCH_SHARE = 0.08
+OPEN_ENDED_SHARE = 0.85
+HANDLE_NULL_SHARE = 0.4
+# Pareto shape of the sessions-per-user weights; lower is more skewed
+SESSION_SKEW = 2.0
+
+LOOKUP_SOURCES = ["channel", "plan", "payment_frequency", "status"]
+OPEN_END_DATE = "9999-01-01T00:00:00.000-06:00"
+UTC_OFFSET = "-06:00"
+YEAR_START = np.datetime64("2024-01-01T00:00:00.000")
+FIRST_NAMES = np.array(["James", "Mary", "Jason", "Linda", "Michael", "Eileen", "David", "Deborah",
+                        "Robert", "Susan", "Daniel", "Karen", "Brian", "Nancy", "Kevin", "Laura"])
+LAST_NAMES = np.array(["Smith", "Rodriguez", "Wallace", "Hayes", "Roberson", "Johnson", "Brown",
+                       "Garcia", "Miller", "Davis", "Martinez", "Wilson", "Taylor", "Clark"])
+MOBILE_PLATFORMS = np.array(["ApplePay", "GooglePay", "SamsungPay"])
+EMAIL_DOMAINS = np.array(["example.com", "example.net", "example.org"])
+
+
+def _timestamps(local_times: np.ndarray) -> pd.Series:
+    """ISO-8601 strings in the sources' format (milliseconds, -06:00 offset)."""
+    return pd.Series(np.datetime_as_string(local_times.astype("datetime64[ms]"), unit="ms")) + UTC_OFFSET
+
+
+def _pick(rng, values: np.ndarray, size: int) -> np.ndarray:
+    return values[rng.integers(0, len(values), size)]
+
+
+def _users(rng, n_users: int) -> pd.DataFrame:
+    user_ids = np.arange(1, n_users + 1)
+    first = pd.Series(_pick(rng, FIRST_NAMES, n_users)).str[0].str.lower()
+    last = pd.Series(_pick(rng, LAST_NAMES, n_users)).str.lower()
+    handles = first + last + pd.Series(user_ids).astype(str)
+    domains = pd.Series(_pick(rng, EMAIL_DOMAINS, n_users))
+    octets = rng.integers(0, 256, (n_users, 2)).astype(str)
+    return pd.DataFrame({
+        "user_id": user_ids,
+        "ip_address": "192.168." + pd.Series(octets[:, 0]) + "." + pd.Series(octets[:, 1]),
+        "social_media_handle": handles.where(rng.random(n_users) >= HANDLE_NULL_SHARE),
+        "email": handles + "@" + domains,
+    })
+
+
+def _registrations(rng, users: pd.DataFrame) -> pd.DataFrame:
+    n_users = len(users)
+    n_registrations = max(1, round(n_users * REGISTERED_SHARE))
+    registered = users.iloc[np.sort(rng.choice(n_users, n_registrations, replace=False))]
+    names = registered["email"].str.split("@").str[0]
+    return pd.DataFrame({
+        "user_registration_id": np.arange(1, n_registrations + 1),
+        "user_id": registered["user_id"].to_numpy(),
+        "username": names.to_numpy(),
+        "email": registered["email"].to_numpy(),
+        "first_name": _pick(rng, FIRST_NAMES, n_registrations),
+        "last_name": _pick(rng, LAST_NAMES, n_registrations),
+    })
+
+
+def _user_plans(rng, registrations: pd.DataFrame, plan_ids: np.ndarray) -> pd.DataFrame:
+    """One plan per registration; PLAN_SWITCH_SHARE of them later switch to a second plan."""
+    n_registrations = len(registrations)
+    registration_ids = registrations["user_registration_id"].to_numpy()
+    start_days = rng.integers(0, 360, n_registrations)
+    # Closed plans (and the plans switched to) still start within the year
+    end_days = np.minimum(start_days + rng.integers(30, 300, n_registrations), 364)
+    switched = rng.random(n_registrations) < PLAN_SWITCH_SHARE
+    closed = switched | (rng.random(n_registrations) >= OPEN_ENDED_SHARE)
+
+    first = pd.DataFrame({
+        "user_registration_id": registration_ids,
+        "payment_detail_id": registration_ids,
+        "plan_id": _pick(rng, plan_ids, n_registrations),
+        "start_date": _timestamps(YEAR_START + start_days.astype("timedelta64[D]")),
+        "end_date": np.where(closed, _timestamps(YEAR_START + end_days.astype("timedelta64[D]")), OPEN_END_DATE),
+    })
+    second = first[switched].copy()
+    second["payment_detail_id"] = np.arange(n_registrations + 1, n_registrations + 1 + len(second))
+    second["plan_id"] = _pick(rng, plan_ids, len(second))
+    second["start_date"] = second["end_date"]
+    second["end_date"] = OPEN_END_DATE
+    return pd.concat([first, second], ignore_index=True)
+
+
+def _payment_details(rng, user_plans: pd.DataFrame, registrations: pd.DataFrame) -> pd.DataFrame:
+    n = len(user_plans)
+    emails = user_plans["user_registration_id"].map(registrations.set_index("user_registration_id")["email"])
+    card_numbers = pd.Series(rng.integers(10 ** 12, 10 ** 16, n)).astype(str)
+    method = rng.choice(["MOBILE_PHONE_PLATFORM", "CREDIT_CARD", "PAYPAL"], n, p=[0.68, 0.12, 0.2])
+    value = np.where(method == "MOBILE_PHONE_PLATFORM", _pick(rng, MOBILE_PLATFORMS, n),
+                     np.where(method == "CREDIT_CARD", card_numbers, emails))
+    expiry = (pd.Series(rng.integers(1, 13, n)).astype(str).str.zfill(2) + "/"
+              + pd.Series(rng.integers(25, 29, n)).astype(str))
+    details = pd.DataFrame({
+        "payment_detail_id": user_plans["payment_detail_id"].to_numpy(),
+        "payment_method_code": method,
+        "payment_method_value": value,
+        "payment_method_expiry": expiry.to_numpy(),
+    })
+    # The source file is not in id order
+    return details.iloc[rng.permutation(n)]
+
+
+def _play_sessions(rng, users: pd.DataFrame, n_sessions: int, channels: np.ndarray,
+                   statuses: np.ndarray) -> pd.DataFrame:
+    weights = rng.pareto(SESSION_SKEW, len(users)) + 1
+    user_ids = rng.choice(users["user_id"].to_numpy(), n_sessions, p=weights / weights.sum())
+    start = YEAR_START + rng.integers(0, 366 * 24 * 3600 * 1000, n_sessions).astype("timedelta64[ms]")
+    duration = (rng.integers(5, 601, n_sessions) * 60_000).astype("timedelta64[ms]")
+    return pd.DataFrame({
+        "play_session_id": np.arange(n_sessions),
+        "user_id": user_ids,
+        "start_datetime": _timestamps(start),
+        "end_datetime": _timestamps(start + duration),
+        "channel_code": _pick(rng, channels, n_sessions),
+        "status_code": _pick(rng, statuses, n_sessions),
+        "total_score": rng.integers(101, 5000, n_sessions),
+    })
+
+
+def generate(out_dir: Path, scale: float = 1, seed: int = 0, lookup_dir: Path = RAW_DATA_DIR) -> dict:
+    """
+    Writes a synthetic copy of every source file to out_dir.
+
+    Args:
+        out_dir (Path): Directory to write the CSVs to (created if needed).
+        scale (float): Size relative to data/raw (1 = ~500 users and ~1.9k sessions).
+        seed (int): Seed of the generator; the same seed and scale give identical files.
+        lookup_dir (Path): Where to copy the unscaled lookup tables from.
+
+    Returns:
+        dict: {source name: rows written}
+    """
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for source in LOOKUP_SOURCES:
+        shutil.copy(lookup_dir / SOURCE_FILES[source], out_dir / SOURCE_FILES[source])
+
+    lookups = {source: pd.read_csv(lookup_dir / SOURCE_FILES[source]) for source in LOOKUP_SOURCES}
+    users = _users(rng, max(1, round(BASE_USERS * scale)))
+    registrations = _registrations(rng, users)
+    user_plans = _user_plans(rng, registrations, lookups["plan"]["plan_id"].to_numpy())
+    tables = {
+        "user": users,
+        "registration": registrations,
+        "user_plan": user_plans,
+        "payment_detail": _payment_details(rng, user_plans, registrations),
+        "play_session": _play_sessions(
+            rng, users, max(1, round(BASE_SESSIONS * scale)),
+            lookups["channel"]["play_session_channel_code"].to_numpy(),
+            lookups["status"]["play_session_status_code"].to_numpy(),
+        ),
+    }
+    for source, df in tables.items():
+        df.to_csv(out_dir / SOURCE_FILES[source], index=False)
+    return {source: len(df) for source, df in tables.items()}
+
+
+if __name__ == "__main__":
+    out = Path(sys.argv[1])
+    rows = generate(out, float(sys.argv[2]) if len(sys.argv) > 2 else 1, int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"Wrote synthetic sources to {out}: {rows}")
@@ -1,46 +1,172 @@
 # main.py
 import sys
+from functools import partial
 from src.data_loader import DataLoader
-from src.data_quality import DataQualityValidator
+from src.data_quality import DataQualityValidator, DataQualityError, TableRules
 from src.transformations import StarSchemaBuilder
 from src.insights import InsightGenerator
-from src.config import BASE_DIR
+from src.pipeline_state import PipelineState
+from src.instrumentation import RunRecorder, stage
+from src.stage_cache import StageCache
+from src.config import (
+    BASE_DIR, STREAM_PLAY_SESSIONS, INCREMENTAL_RUN, EXECUTION_BACKEND, DQ_MODE, DQ_RULES,
+    FACT_BUILD_PROCESSES, STAGE_CACHE_ENABLED
+)
 
-def run_pipeline():
-    """Main function to orchestrate the ETL and analysis pipeline."""
-    
+def get_builder_class(backend: str):
+    """StarSchemaBuilder implementation for an execution backend ("pandas" or "duckdb")."""
+    if backend == "pandas":
+        return StarSchemaBuilder
+    if backend == "duckdb":
+        # Optional dependency, only imported when selected
+        from src.duckdb_backend import DuckDBStarSchemaBuilder
+        return DuckDBStarSchemaBuilder
+    raise ValueError(f"Unknown execution backend '{backend}'.")
+
+def run_pipeline(stream_play_sessions: bool = STREAM_PLAY_SESSIONS, incremental: bool = INCREMENTAL_RUN,
+                 backend: str = EXECUTION_BACKEND, dq_mode: str = DQ_MODE,
+                 fact_processes: int = FACT_BUILD_PROCESSES):
+    """
+    Main function to orchestrate the ETL and analysis pipeline.
+
+    Args:
+        stream_play_sessions (bool): Build fact_play_session from bounded-size
+                                     chunks of user_play_session.csv instead of
+                                     loading the whole file into memory.
+        incremental (bool): Append only play sessions newer than the last
+                            run's watermark instead of rebuilding the fact.
+        backend (str): "pandas", or "duckdb" to check and build the facts out
+                       of core straight from the CSVs (play sessions and user
+                       plans are then never loaded into pandas).
+        dq_mode (str): "exact", or "approximate"/"sample" to screen the sources
+                       with sketches first and check only flagged tables exactly.
+                       Play sessions are screened while they are read and
+                       re-read to check their flagged rules exactly.
+        fact_processes (int): With more than 1 (pandas backend only), build
+                              fact_play_session on this many worker processes
+                              that each parse part of user_play_session.csv.
+
+    Every run writes a manifest of per-stage wall/CPU time, peak memory growth
+    and row counts to config.RUN_MANIFEST_DIR, even when it aborts.
+    """
+    recorder = RunRecorder(run_info={
+        "backend": backend, "stream_play_sessions": stream_play_sessions,
+        "incremental": incremental, "dq_mode": dq_mode, "fact_processes": fact_processes,
+    })
+    try:
+        with recorder.activate():
+            _run_stages(stream_play_sessions, incremental, backend, dq_mode, fact_processes)
+    finally:
+        recorder.print_summary()
+        recorder.write_manifest()
+
+def _data_quality_gate(dq: DataQualityValidator):
+    """Prints the DQ summary and aborts the pipeline if any check failed."""
+    dq.print_summary()
+    if len(dq.results["failed"]) > 0:
+        print("Critical data quality checks failed. Aborting pipeline.")
+        sys.exit(1)
+    print("Data quality checks passed.")
+
+def _run_stages(stream_play_sessions: bool, incremental: bool, backend: str, dq_mode: str, fact_processes: int):
     print("Starting Dice Game ETL Pipeline...")
+    builder_class = get_builder_class(backend)
+    parallel_facts = backend == "pandas" and fact_processes > 1
+    play_sessions_in_memory = not stream_play_sessions and backend == "pandas" and not parallel_facts
     
     # 1. Load Data
+    # Play sessions, by far the largest source, are read in chunks during the DQ step.
+    # The DuckDB backend reads both fact sources from the CSVs in SQL instead.
+    fact_sources = ["play_session", "user_plan"] if backend == "duckdb" else ["play_session"]
     loader = DataLoader()
-    raw_data = loader.load_all_sources()
+    with stage("load"):
+        raw_data = loader.load_all_sources(exclude=fact_sources)
+    if loader.load_errors:
+        print(f"Could not load sources {sorted(loader.load_errors)}. Aborting pipeline.")
+        sys.exit(1)
     
     # 2. Data Quality Checks (on raw data)
+    # Each table's rules (config.DQ_RULES) run in one pass
     dq = DataQualityValidator()
-    dq.check_uniqueness(raw_data["user"], ["user_id"], "user")
-    dq.check_uniqueness(raw_data["registration"], ["user_registration_id"], "registration")
-    dq.check_uniqueness(raw_data["plan"], ["plan_id"], "plan")
-    dq.check_referential_integrity(raw_data["user"], raw_data["registration"], "user_id", "user_id", "user->registration")
-    dq.check_referential_integrity(raw_data["user"], raw_data["play_session"], "user_id", "user_id", "user->play_session")
-    dq.check_referential_integrity(raw_data["plan"], raw_data["user_plan"], "plan_id", "plan_id", "plan->user_plan")
-    
-    dq.print_summary()
-    if len(dq.results["failed"]) > 0:
-        print("Critical data quality checks failed. Aborting pipeline.")
-        sys.exit(1)
-        
-    print("Data quality checks passed.")
+    loaded_rules = {name: rules for name, rules in DQ_RULES.items() if name in raw_data}
+    with stage("dq"):
+        if dq_mode == "exact":
+            dq.check_tables(raw_data, loaded_rules)
+        else:
+            # Screen every table approximately, then check only the flagged ones exactly;
+            # their exact results replace the screening ones in the summary
+            flagged = dq.screen_tables(raw_data, loaded_rules, mode=dq_mode)
+            dq.check_tables(raw_data, {name: DQ_RULES[name] for name in flagged})
+        if backend == "duckdb":
+            # Exact checks as SQL over the fact sources' CSVs, in any dq_mode
+            from src.duckdb_backend import DuckDBQualityChecker
+            checker = DuckDBQualityChecker(raw_data)
+            for name in fact_sources:
+                with stage(f"dq.{name}"):
+                    dq.record_results(checker.check(name, TableRules(**DQ_RULES[name])))
+
+    # With pandas, play sessions are checked as each chunk is parsed: exactly, stopping as soon
+    # as a rule fails on more than DQ_MAX_FAILED_ROWS rows, or screened like the
+    # other tables, with the file re-read for the exact check of flagged rules.
+    # Streamed and parallel builds check them while building fact_play_session,
+    # so the file is parsed once; a failure then discards the fact being written.
+    checked_while_building = backend == "pandas" and not play_sessions_in_memory
+    if dq_mode == "exact":
+        play_session_check = partial(dq.checked_chunks, table_name="play_session", parents=raw_data,
+                                     raise_on_failure=checked_while_building)
+    else:
+        play_session_check = partial(dq.screened_chunks, table_name="play_session", mode=dq_mode,
+                                     parents=raw_data, recheck=lambda: loader.iter_source_chunks("play_session"),
+                                     raise_on_failure=checked_while_building)
+    if play_sessions_in_memory and not dq.results["failed"]:
+        try:
+            with stage("dq.play_session") as record:
+                play_session_chunks = play_session_check(loader.iter_source_chunks("play_session"))
+                raw_data["play_session"] = loader.concat_chunks(play_session_chunks, "play_session")
+                if record is not None:
+                    record.add_rows(rows_in=len(raw_data["play_session"]))
+        except DataQualityError as e:
+            print(f"  {e}")
+        except Exception as e:
+            print(f"Could not load user_play_session.csv. Reason: {e}. Aborting pipeline.")
+            sys.exit(1)
+
+    if checked_while_building and not dq.results["failed"]:
+        print("Play sessions are checked while fact_play_session is built.")
+    else:
+        _data_quality_gate(dq)
 
     # 3. Transformations (Build Star Schema)
-    builder = StarSchemaBuilder(raw_data)
-    builder.create_dimensions()
-    builder.create_facts()
+    # Surrogate keys come from the persisted registry in every run so they stay stable
+    state = PipelineState()
+    # Builds and insights whose inputs are unchanged since an earlier run are reused
+    cache = StageCache() if STAGE_CACHE_ENABLED else None
+    builder_options = {"fact_processes": fact_processes} if backend == "pandas" else {}
+    if parallel_facts:
+        # The workers send back the columns the play-session rules read
+        builder_options.update(check_play_sessions=play_session_check,
+                               check_columns=TableRules(**DQ_RULES["play_session"]).columns())
+    builder = builder_class(raw_data, state=state, incremental=incremental, cache=cache, **builder_options)
+    try:
+        with stage("transform"):
+            play_session_chunks = None
+            if stream_play_sessions and backend == "pandas" and not parallel_facts:
+                play_session_chunks = play_session_check(loader.iter_source_chunks("play_session"))
+            # Dimensions and facts run as one task graph (independent builds in parallel)
+            builder.build(play_session_chunks)
+            state.save()
+    except DataQualityError as e:
+        print(f"  {e}")
+    if checked_while_building:
+        _data_quality_gate(dq)
     
     print("ETL transformation complete. Data warehouse built.")
 
     # 4. Generate Insights
-    analyzer = InsightGenerator()
-    analyzer.generate_all_insights()
+    # Seed the insights with the tables still in memory instead of re-reading them
+    analyzer = InsightGenerator(tables=builder.in_memory_tables(), cache=cache, fingerprints=builder.fingerprints)
+    with stage("insights"):
+        analyzer.generate_all_insights()
     
     print("Dice Game ETL Pipeline finished successfully.")
 
@@ -0,0 +1,243 @@
+# src/aggregation.py
+import pandas as pd
+from src.config import UNKNOWN_KEY
+
+# Measure functions an Aggregate may use, passed straight to DataFrame.groupby().agg
+MEASURE_FUNCTIONS = {"count", "sum", "mean", "min", "max", "nunique"}
+# Rollups only hold measures whose partial results combine by summing
+ROLLUP_FUNCTIONS = {"count", "sum"}
+
+
+def _month_key(date_keys: pd.Series) -> pd.Series:
+    """YYYYMM month key from a YYYYMMDD date key."""
+    return date_keys // 100
+
+
+class Aggregate:
+    """
+    Declares one grouped aggregate over a fact table.
+
+    Args:
+        name (str): Name the result is returned under.
+        table (str): Fact table to aggregate (e.g. "fact_play_session").
+        group_by (list): Columns to group on, normally integer surrogate keys.
+        measures (dict): {output_column: (source_column, function)} with
+                         function one of MEASURE_FUNCTIONS.
+        derive (dict): Optional {column: (source_column, fn)} computed from
+                       the fact before grouping, e.g. a month key from a date key.
+        top_k (tuple): Optional (measure, k): keep only the k groups with the
+                       largest value of that measure. Groups whose key is
+                       UNKNOWN_KEY are not ranked.
+    """
+    def __init__(self, name: str, table: str, group_by: list, measures: dict,
+                 derive: dict = None, top_k: tuple = None):
+        for column, function in measures.values():
+            if function not in MEASURE_FUNCTIONS:
+                raise ValueError(f"Unsupported measure function '{function}' in aggregate {name}.")
+        self.name = name
+        self.table = table
+        self.group_by = list(group_by)
+        self.measures = measures
+        self.derive = derive or {}
+        self.top_k = top_k
+
+    def source_columns(self) -> list:
+        """Fact columns this aggregate reads."""
+        columns = [c for c in self.group_by if c not in self.derive]
+        columns += [source for source, _ in self.derive.values()]
+        columns += [source for source, _ in self.measures.values()]
+        return list(dict.fromkeys(columns))
+
+
+class Rollup(Aggregate):
+    """
+    An aggregate materialized in the warehouse during ETL (agg_* tables).
+
+    Only count and sum measures are allowed, so partial rollups (per chunk, or
+    the stored rollup plus this run's new fact rows) combine by grouping the
+    concatenated partials and summing again. Fact measure columns are never
+    null in this warehouse, so any count measure is also the row count.
+    """
+    def __init__(self, name: str, table: str, group_by: list, measures: dict, derive: dict = None):
+        super().__init__(name, table, group_by, measures, derive)
+        for column, function in measures.values():
+            if function not in ROLLUP_FUNCTIONS:
+                raise ValueError(f"Rollup {name} can only use {sorted(ROLLUP_FUNCTIONS)} measures.")
+        self.row_count = next((m for m, (_, f) in measures.items() if f == "count"), None)
+        if self.row_count is None:
+            raise ValueError(f"Rollup {name} needs a count measure.")
+
+    def aggregate(self, fact_df: pd.DataFrame) -> pd.DataFrame:
+        """Rolls up a fact frame (or one chunk of it)."""
+        derived = {column: fn(fact_df[source]) for column, (source, fn) in self.derive.items()}
+        if derived:
+            fact_df = fact_df.assign(**derived)
+        rollup = fact_df.groupby(self.group_by, observed=True).agg(**self.measures)
+        # Integer sums keep the fact column's width unless they overflow it; widen
+        # them up front so every partial (and the stored rollup) has one schema
+        integer_measures = [m for m in self.measures if pd.api.types.is_integer_dtype(rollup[m])]
+        return rollup.astype({m: "int64" for m in integer_measures}).reset_index()
+
+    def combine(self, partials: list) -> pd.DataFrame:
+        """Merges partial rollups into one."""
+        partials = [p for p in partials if not p.empty]
+        if not partials:
+            return pd.DataFrame(columns=[*self.group_by, *self.measures])
+        combined = pd.concat(partials, ignore_index=True)
+        return combined.groupby(self.group_by, observed=True)[list(self.measures)].sum().reset_index()
+
+    def _measure(self, column: str, function: str):
+        return next((m for m, measure in self.measures.items() if measure == (column, function)), None)
+
+    def can_answer(self, aggregate: Aggregate) -> bool:
+        """Whether the aggregate can be computed from this rollup instead of the fact."""
+        if aggregate.table != self.table:
+            return False
+        for key in aggregate.group_by:
+            if key in aggregate.derive:
+                source = aggregate.derive[key][0]
+                same_derived_key = key in self.derive and self.derive[key][0] == source
+                if not (same_derived_key or source in self.group_by):
+                    return False
+            elif key not in self.group_by or key in self.derive:
+                return False
+        for column, function in aggregate.measures.values():
+            if function in ("sum", "mean") and self._measure(column, "sum") is None:
+                return False
+            if function == "nunique" and column not in self.group_by:
+                return False
+            if function in ("min", "max"):
+                return False
+        return True
+
+    def answer(self, rollup_df: pd.DataFrame, aggregate: Aggregate) -> pd.DataFrame:
+        """Computes an aggregate (see can_answer) from the rollup's rows."""
+        derived = {
+            column: fn(rollup_df[source]) for column, (source, fn) in aggregate.derive.items()
+            if column not in rollup_df.columns
+        }
+        if derived:
+            rollup_df = rollup_df.assign(**derived)
+        grouped = rollup_df.groupby(aggregate.group_by, observed=True)
+
+        sums = grouped[list(self.measures)].sum()
+        result = pd.DataFrame(index=sums.index)
+        for output, (column, function) in aggregate.measures.items():
+            if function == "count":
+                result[output] = sums[self.row_count]
+            elif function == "sum":
+                result[output] = sums[self._measure(column, "sum")]
+            elif function == "mean":
+                result[output] = sums[self._measure(column, "sum")] / sums[self.row_count]
+            else:
+                result[output] = grouped[column].nunique()
+        return _apply_top_k(result.reset_index(), aggregate)
+
+
+# Rollups kept in AGG_DIR and maintained by StarSchemaBuilder on every run
+ROLLUPS = [
+    Rollup("agg_play_session_daily", "fact_play_session", ["start_date_key", "channel_key", "status_key"],
+           {"session_count": ("play_session_id", "count"), "score_sum": ("total_score", "sum"),
+            "duration_sum": ("duration_minutes", "sum")}),
+    Rollup("agg_play_session_user", "fact_play_session", ["user_key"],
+           {"session_count": ("play_session_id", "count"), "score_sum": ("total_score", "sum")}),
+    Rollup("agg_revenue_monthly", "fact_subscription", ["start_month_key", "plan_key"],
+           {"subscription_count": ("cost_amount", "count"), "revenue_sum": ("cost_amount", "sum")},
+           derive={"start_month_key": ("start_date_key", _month_key)}),
+    Rollup("agg_billing_monthly", "fact_subscription_period", ["period_month_key", "plan_key"],
+           {"period_count": ("billed_amount", "count"), "billed_sum": ("billed_amount", "sum")},
+           derive={"period_month_key": ("period_start_date_key", _month_key)}),
+    # Per user and day; fact_user_engagement is derived from it
+    Rollup("agg_play_session_user_daily", "fact_play_session", ["user_key", "start_date_key"],
+           {"session_count": ("play_session_id", "count"), "score_sum": ("total_score", "sum"),
+            "duration_sum": ("duration_minutes", "sum")}),
+]
+
+
+def _apply_top_k(result: pd.DataFrame, aggregate: Aggregate) -> pd.DataFrame:
+    if aggregate.top_k is None:
+        return result
+    measure, k = aggregate.top_k
+    known = (result[aggregate.group_by] != UNKNOWN_KEY).all(axis=1)
+    return result[known].nlargest(k, measure)
+
+
+class AggregationEngine:
+    """
+    Computes registered aggregates with one read per fact table.
+
+    Aggregates that a rollup can answer are computed from the (small) rollup
+    table instead of the fact. The rest share one load of the union of their
+    columns per fact table, and aggregates with the same grouping keys share
+    one groupby. Results are keyed on surrogate keys; dimension labels are
+    meant to be joined onto these small results, never onto the fact rows.
+    """
+    def __init__(self, rollups: list = None):
+        self.aggregates = {}
+        self.rollups = rollups or []
+        # {aggregate name: table it was computed from}, filled by run()
+        self.sources = {}
+
+    def register(self, aggregate: Aggregate):
+        if aggregate.name in self.aggregates:
+            raise ValueError(f"Aggregate {aggregate.name} is already registered.")
+        self.aggregates[aggregate.name] = aggregate
+
+    def run(self, load_table) -> dict:
+        """
+        Args:
+            load_table: Callable (table_name, columns) -> DataFrame, used for
+                        facts and rollups alike (columns=None loads all).
+
+        Returns:
+            dict: {aggregate name: result DataFrame} (empty when the fact is).
+        """
+        results = {}
+        by_table = {}
+        rollup_tables = {}
+        for aggregate in self.aggregates.values():
+            rollup = next((r for r in self.rollups if r.can_answer(aggregate)), None)
+            if rollup is not None:
+                if rollup.name not in rollup_tables:
+                    rollup_tables[rollup.name] = load_table(rollup.name, None)
+                rollup_df = rollup_tables[rollup.name]
+                # A missing or empty rollup (e.g. an older warehouse) falls back to the fact
+                if not rollup_df.empty:
+                    results[aggregate.name] = rollup.answer(rollup_df, aggregate)
+                    self.sources[aggregate.name] = rollup.name
+                    continue
+            by_table.setdefault(aggregate.table, []).append(aggregate)
+            self.sources[aggregate.name] = aggregate.table
+
+        for table, aggregates in by_table.items():
+            columns = list(dict.fromkeys(c for a in aggregates for c in a.source_columns()))
+            fact_df = load_table(table, columns)
+            if fact_df.empty:
+                results.update({a.name: pd.DataFrame() for a in aggregates})
+                continue
+            results.update(self._aggregate_table(fact_df, aggregates))
+        return results
+
+    def _aggregate_table(self, fact_df: pd.DataFrame, aggregates: list) -> dict:
+        derived = {
+            column: fn(fact_df[source])
+            for a in aggregates for column, (source, fn) in a.derive.items()
+        }
+        if derived:
+            fact_df = fact_df.assign(**derived)
+
+        by_keys = {}
+        for aggregate in aggregates:
+            by_keys.setdefault(tuple(aggregate.group_by), []).append(aggregate)
+
+        results = {}
+        for keys, group in by_keys.items():
+            named_measures = {
+                f"{a.name}.{output}": measure for a in group for output, measure in a.measures.items()
+            }
+            grouped = fact_df.groupby(list(keys), observed=True).agg(**named_measures).reset_index()
+            for aggregate in group:
+                result = grouped[list(keys) + [f"{aggregate.name}.{m}" for m in aggregate.measures]]
+                result = result.rename(columns=lambda c: c.split(".", 1)[-1])
+                results[aggregate.name] = _apply_top_k(result, aggregate)
+        return results
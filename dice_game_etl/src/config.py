@@ -10,6 +10,12 @@ RAW_DATA_DIR = DATA_DIR / "raw"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
 DIM_DIR = PROCESSED_DATA_DIR / "dimensions"
 FACT_DIR = PROCESSED_DATA_DIR / "facts"
+AGG_DIR = PROCESSED_DATA_DIR / "aggregates"
+# Markdown report written by InsightGenerator
+REPORT_PATH = BASE_DIR / "analysis_report.md"
+# Surrogate-key registries and watermarks persisted between runs
+STATE_DIR = PROCESSED_DATA_DIR / "_state"
+RUN_MANIFEST_DIR = PROCESSED_DATA_DIR / "_runs"
 
 # --- Source File Mappings ---
 # Maps a simple name to its corresponding CSV file
@@ -25,9 +31,204 @@ SOURCE_FILES = {
     "registration": "user_registration.csv",
 }
 
+# --- Source Schemas ---
+# Declared dtypes per source, enforced by DataLoader on every read. Code
+# columns are categoricals, IDs use the smallest integer width that fits
+# them, and datetime columns are parsed at load time with DATETIME_FORMAT.
+# Columns not listed here keep pandas' inferred dtype.
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+SOURCE_SCHEMAS = {
+    "channel": {
+        "dtype": {"play_session_channel_code": "category"},
+    },
+    "plan": {
+        "dtype": {"plan_id": "int16", "payment_frequency_code": "category", "cost_amount": "float64"},
+    },
+    "payment_frequency": {
+        "dtype": {"payment_frequency_code": "category"},
+    },
+    "status": {
+        "dtype": {"play_session_status_code": "category"},
+    },
+    "user": {
+        "dtype": {"user_id": "int32"},
+    },
+    "payment_detail": {
+        "dtype": {"payment_detail_id": "int32", "payment_method_code": "category"},
+    },
+    "user_plan": {
+        "dtype": {"user_registration_id": "int32", "payment_detail_id": "int32", "plan_id": "int16"},
+        "parse_dates": ["start_date", "end_date"],
+    },
+    "play_session": {
+        # Session ids grow without bound, so they keep the full 64-bit width
+        "dtype": {
+            "play_session_id": "int64",
+            "user_id": "int32",
+            "channel_code": "category",
+            "status_code": "category",
+            "total_score": "int32",
+        },
+        "parse_dates": ["start_datetime", "end_datetime"],
+    },
+    "registration": {
+        "dtype": {"user_registration_id": "int32", "user_id": "int32"},
+    },
+}
+
+# --- Data Quality Rules ---
+# Rules per raw source, checked together in one pass by
+# DataQualityValidator.check_tables: unique keys, NOT NULL columns and
+# references {column: (parent source, parent key)}.
+DQ_RULES = {
+    "user": {"unique": [["user_id"]], "not_null": ["user_id"]},
+    "registration": {
+        "unique": [["user_registration_id"]],
+        "not_null": ["user_registration_id"],
+        "references": {"user_id": ("user", "user_id")},
+    },
+    "plan": {"unique": [["plan_id"]], "not_null": ["plan_id"]},
+    "play_session": {"unique": [["play_session_id"]], "references": {"user_id": ("user", "user_id")}},
+    "user_plan": {"references": {"plan_id": ("plan", "plan_id")}},
+}
+# Failing rows kept per check for reporting
+DQ_SAMPLE_ROWS = 5
+# Distinct failing values a streamed check counts exactly; past this many
+# it stops tracking them and reports their number as unknown
+DQ_MAX_FAILED_VALUES = 100_000
+# "exact" checks every rule exactly. "approximate" (Bloom filter / HyperLogLog)
+# and "sample" (reservoir sample) first screen all tables in bounded memory,
+# then run the exact checks only on the tables they flag.
+DQ_MODE = "exact"
+DQ_BLOOM_FALSE_POSITIVE_RATE = 0.01
+# 2**14 HyperLogLog registers: ~0.8% relative error on distinct counts
+DQ_HLL_PRECISION = 14
+DQ_SAMPLE_SIZE = 100_000
+DQ_CONFIDENCE = 0.95
+# Play sessions are read in chunks and checked as each chunk is parsed. Reading
+# stops as soon as a rule has more failed rows than this (None = read it all).
+DQ_MAX_FAILED_ROWS = 0
+
+# --- Source Loading ---
+# Number of source files read concurrently by DataLoader.load_all_sources (1 = sequential)
+LOADER_MAX_WORKERS = 4
+
+# --- Build Scheduling ---
+# Dimension and fact builds run as a task graph (src.scheduler); builds whose
+# inputs are ready run concurrently on this many threads (1 = one after another)
+BUILD_MAX_WORKERS = 4
+# With more than 1, fact_play_session is built by this many worker processes,
+# each parsing its own byte range of user_play_session.csv (about
+# FACT_SHARD_BYTES per task) and writing its own Parquet part files
+FACT_BUILD_PROCESSES = 1
+FACT_SHARD_BYTES = 64 * 1024 ** 2
+
+# --- Output Writing ---
+# Tables are written by background threads (0 = write inline); builders block
+# once OUTPUT_QUEUE_SIZE tables are waiting to be written
+OUTPUT_WRITER_THREADS = 2
+OUTPUT_QUEUE_SIZE = 2
+
+# --- Stage Cache ---
+# Dimensions, facts, rollups and insight sections are cached under
+# STAGE_CACHE_DIR, keyed on a fingerprint of their inputs, the code and the
+# output settings; a stage whose fingerprint has not changed since an earlier
+# run reuses that run's result instead of rebuilding and rewriting it.
+STAGE_CACHE_ENABLED = True
+STAGE_CACHE_DIR = PROCESSED_DATA_DIR / "_cache"
+# Least recently used entries are evicted beyond either limit
+STAGE_CACHE_MAX_BYTES = 1024 ** 3
+STAGE_CACHE_MAX_ENTRIES = 256
+
+# --- Streaming Ingestion ---
+# Rows per chunk when a source is streamed instead of loaded whole
+CHUNK_SIZE = 250_000
+# Stream user_play_session.csv through the fact build instead of loading it whole
+STREAM_PLAY_SESSIONS = False
+
+# --- Execution Backend ---
+# "pandas" builds the facts from DataFrames in memory. "duckdb" (optional
+# dependency) reads the fact source CSVs directly with an embedded DuckDB
+# engine that spills to DUCKDB_TEMP_DIR once DUCKDB_MEMORY_LIMIT is reached.
+EXECUTION_BACKEND = "pandas"
+DUCKDB_MEMORY_LIMIT = "2GB"
+DUCKDB_TEMP_DIR = PROCESSED_DATA_DIR / "_duckdb_tmp"
+
+# --- Incremental Runs ---
+# Only process play sessions newer than the last run and append them to the facts
+INCREMENTAL_RUN = False
+
+# --- As-Of Date ---
+# Date the warehouse describes: fact_subscription.is_active is evaluated on
+# it and fact_subscription_period bills no period starting after it, so
+# reruns give the same tables whatever day they run on
+AS_OF_DATE = "2024-12-31"
+
+# --- Subscription Billing ---
+# Months per billing period of each payment frequency; plans with any other
+# frequency (ONETIME) are billed once, at the start of the subscription
+BILLING_PERIOD_MONTHS = {"MONTHLY": 1, "ANNUALLY": 12}
+
+# --- User Engagement ---
+# fact_user_engagement: length of the trailing activity window (a week), and
+# how many days without a session after an active day count as churn
+ENGAGEMENT_WINDOW_DAYS = 7
+ENGAGEMENT_CHURN_DAYS = 30
+
 # --- Date Dimension Settings ---
 DATE_DIM_START = "2024-01-01"
 DATE_DIM_END = "2025-12-31" # Forecasting for 2025
 
+# --- Dimension Attributes ---
+# Descriptive columns kept out of these dimensions, in <dim>_attributes side
+# tables keyed on the surrogate key. The dimensions keep only keys and the
+# codes facts are grouped by; attributes are read for the final rows shown.
+DIMENSION_ATTRIBUTES = {
+    "dim_user": ["ip_address", "social_media_handle", "email_account", "username", "email_profile",
+                 "first_name", "last_name"],
+    "dim_payment_method": ["payment_method_value", "payment_method_expiry"],
+}
+# Attribute columns with at most this share of distinct values are stored as
+# categoricals (dictionary-encoded), so each distinct string is held once
+ATTRIBUTE_DICTIONARY_MAX_RATIO = 0.5
+
+# --- Surrogate Keys ---
+# Key stored on fact rows whose natural key has no matching dimension row
+UNKNOWN_KEY = -1
+
+# --- Date Keys ---
+# Dates in or after this year are "no end date" sentinels (e.g. 9999-01-01 in user_plan.csv)
+OPEN_ENDED_YEAR = 9999
+OPEN_ENDED_DATE_KEY = 99991231
+# Key used when a date is missing
+UNKNOWN_DATE_KEY = -1
+
+# --- Instrumentation ---
+# Stages (e.g. "transform", "insights.aggregates") to run under cProfile;
+# their stats are dumped to RUN_MANIFEST_DIR next to the run manifest
+PROFILE_STAGES = []
+
 # --- Output Files ---
-OUTPUT_FORMAT = "parquet" # Use 'csv' or 'parquet' [cite: 11]
\ No newline at end of file
+OUTPUT_FORMAT = "parquet" # Use 'csv', 'parquet' or 'feather' [cite: 11]
+
+# --- Feather Layout ---
+# With OUTPUT_FORMAT = "feather", every table is one Arrow IPC file, which
+# readers memory-map. Uncompressed files are read without copying or
+# decoding; 'lz4' (or 'zstd') files are smaller but decompressed on read.
+FEATHER_COMPRESSION = "uncompressed"
+
+# --- Parquet Layout ---
+# Facts are written as Hive-style datasets partitioned by year=/month= of the
+# listed date key (facts/fact_play_session.parquet/year=2024/month=3/...), so
+# month-scoped reads can skip the rest of the history.
+PARTITION_FACTS = True
+FACT_PARTITION_DATE_KEYS = {
+    "fact_play_session": "start_date_key",
+    "fact_subscription": "start_date_key",
+    "fact_user_engagement": "date_key",
+    "fact_subscription_period": "period_start_date_key",
+}
+PARQUET_COMPRESSION = "zstd" # 'snappy', 'zstd', 'gzip', 'brotli', 'lz4' or 'none'
+# Rows per row group; rows are sorted by date key first, so each group's
+# min/max statistics cover a narrow date range
+PARQUET_ROW_GROUP_SIZE = 1_000_000
\ No newline at end of file
@@ -1,6 +1,97 @@
 # src/data_loader.py
+import io
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from src.config import RAW_DATA_DIR, SOURCE_FILES
+from src.instrumentation import stage
+from src.config import (
+    RAW_DATA_DIR,
+    SOURCE_FILES,
+    SOURCE_SCHEMAS,
+    DATETIME_FORMAT,
+    CHUNK_SIZE,
+    LOADER_MAX_WORKERS
+)
+
+class SchemaError(ValueError):
+    """Raised when a source file does not match its declared schema."""
+
+
+def read_dtypes(source_name: str) -> dict:
+    """
+    Dtypes passed straight to read_csv. Integer columns are left out:
+    read_csv wraps values that overflow a narrow width instead of failing,
+    so they are parsed as int64 and range-checked in apply_schema.
+    """
+    dtypes = SOURCE_SCHEMAS.get(source_name, {}).get("dtype", {})
+    return {
+        column: dtype for column, dtype in dtypes.items()
+        if not pd.api.types.is_integer_dtype(dtype)
+    }
+
+
+def apply_schema(df: pd.DataFrame, source_name: str) -> pd.DataFrame:
+    """Enforces the declared schema of a source on a freshly read frame (or chunk)."""
+    schema = SOURCE_SCHEMAS.get(source_name, {})
+    dtypes = schema.get("dtype", {})
+    date_columns = schema.get("parse_dates", [])
+
+    missing = [column for column in [*dtypes, *date_columns] if column not in df.columns]
+    if missing:
+        raise SchemaError(f"{SOURCE_FILES.get(source_name, source_name)} is missing declared columns {missing}")
+
+    for column, dtype in dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype) and df[column].isna().any():
+            raise SchemaError(f"{SOURCE_FILES.get(source_name, source_name)} has missing values "
+                              f"in integer column {column}")
+        if pd.api.types.is_integer_dtype(dtype) and len(df) > 0:
+            bounds = np.iinfo(dtype)
+            if df[column].min() < bounds.min or df[column].max() > bounds.max:
+                raise SchemaError(f"{source_name}.{column} has values outside the {dtype} range")
+        df[column] = df[column].astype(dtype)
+
+    for column in date_columns:
+        df[column] = pd.to_datetime(df[column], format=DATETIME_FORMAT)
+    return df
+
+
+def csv_byte_ranges(path, max_bytes: int, min_ranges: int = 1) -> list:
+    """
+    Splits a CSV file's data rows (everything after the header line) into
+    (start, end) byte ranges of at most about max_bytes, and at least
+    min_ranges of them when the file is large enough. Every range starts at
+    the beginning of a line and ends after a newline (or at end of file),
+    so each can be parsed on its own with read_csv_range. Quoted values
+    must not contain newlines, which holds for the sources split this way.
+    """
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        f.readline()
+        data_start = f.tell()
+        n_ranges = max(min_ranges, -(-(size - data_start) // max_bytes), 1)
+        step = max(1, (size - data_start) // n_ranges)
+        bounds = [data_start]
+        for i in range(1, n_ranges):
+            f.seek(max(data_start + i * step - 1, bounds[-1]))
+            # Move to the start of the next line
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def read_csv_range(path, start: int, end: int, source_name: str) -> pd.DataFrame:
+    """Reads the rows in a byte range from csv_byte_ranges, with the source's declared schema."""
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(start)
+        data = f.read(end - start)
+    df = pd.read_csv(io.BytesIO(header + data), dtype=read_dtypes(source_name))
+    return apply_schema(df, source_name)
+
 
 class DataLoader:
     """Handles loading of all raw source data files."""
@@ -8,14 +99,32 @@ class DataLoader:
     def __init__(self):
         self.raw_data_path = RAW_DATA_DIR
         self.source_files = SOURCE_FILES
+        self.load_errors = {}
         print("DataLoader initialized.")
 
+    def _read_source(self, source_name: str) -> pd.DataFrame:
+        """Reads a single CSV file, raising on any error."""
+        file_name = self.source_files[source_name]
+        with stage(f"load.{source_name}") as record:
+            df = pd.read_csv(self.raw_data_path / file_name, dtype=read_dtypes(source_name))
+            df = apply_schema(df, source_name)
+            if record is not None:
+                record.add_rows(rows_out=len(df))
+        return df
+
+    def _try_read_source(self, source_name: str):
+        """Returns the source's DataFrame, or the exception raised while reading it."""
+        try:
+            return self._read_source(source_name)
+        except Exception as e:
+            return e
+
     def load_source_file(self, source_name: str):
         """Loads a single CSV file into a DataFrame."""
         try:
             file_name = self.source_files[source_name]
             file_path = self.raw_data_path / file_name
-            df = pd.read_csv(file_path)
+            df = self._read_source(source_name)
             print(f"  Successfully loaded {file_name}")
             return df
         except FileNotFoundError:
@@ -25,18 +134,82 @@ class DataLoader:
             print(f"  ERROR: Could not load {file_name}. Reason: {e}")
             return pd.DataFrame()
 
-    def load_all_sources(self) -> dict:
+    def iter_source_chunks(self, source_name: str, chunksize: int = CHUNK_SIZE):
+        """
+        Streams a single CSV file as DataFrames of at most `chunksize` rows.
+
+        Columns are read with the dtypes declared in config.SOURCE_SCHEMAS and
+        datetime columns are parsed per chunk, so only one chunk is held in
+        memory at a time. Unlike load_source_file, read errors are raised:
+        a consumer that has already written part of the output must not
+        mistake a failed read for an empty source.
+        """
+        file_name = self.source_files[source_name]
+        file_path = self.raw_data_path / file_name
+
+        with pd.read_csv(file_path, dtype=read_dtypes(source_name), chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield apply_schema(chunk, source_name)
+        print(f"  Finished streaming {file_name}")
+
+    def concat_chunks(self, chunks, source_name: str) -> pd.DataFrame:
+        """
+        Joins the chunks of a source back into one DataFrame. Categorical
+        columns get categories from each chunk separately, so they are made
+        categorical again over the whole source.
+        """
+        df = pd.concat(list(chunks), ignore_index=True)
+        for column, dtype in SOURCE_SCHEMAS.get(source_name, {}).get("dtype", {}).items():
+            if dtype == "category" and not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype("category")
+        print(f"  Successfully loaded {self.source_files[source_name]} ({len(df)} rows in chunks)")
+        return df
+
+    def load_all_sources(self, exclude: list = None, max_workers: int = LOADER_MAX_WORKERS) -> dict:
         """
         Loads all source files defined in config into a dictionary of DataFrames.
-        
+
+        With max_workers > 1 the files are read concurrently on a thread pool;
+        the CSV parser spends most of its time in I/O and C code, so threads
+        overlap the reads without pickling frames between processes.
+
+        A source that fails to load is left out of the result and its
+        exception is recorded in self.load_errors, rather than being replaced
+        by an empty DataFrame that downstream steps would silently skip.
+
+        Args:
+            exclude (list): Source names to skip, e.g. sources that will be
+                            streamed with iter_source_chunks instead.
+            max_workers (int): Number of files read at the same time
+                               (1 reads them one after another).
+
         Returns:
-            dict: A dictionary where keys are source names (e.g., 'user') 
+            dict: A dictionary where keys are source names (e.g., 'user')
                   and values are their DataFrames.
         """
         print("Loading all raw data sources...")
+        exclude = exclude or []
+        source_names = [name for name in self.source_files if name not in exclude]
+        self.load_errors = {}
+
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                outcomes = list(pool.map(self._try_read_source, source_names))
+        else:
+            outcomes = [self._try_read_source(name) for name in source_names]
+
         raw_data = {}
-        for source_name in self.source_files.keys():
-            raw_data[source_name] = self.load_source_file(source_name)
-        
-        print("All raw data loaded.")
-        return raw_data
\ No newline at end of file
+        for name, outcome in zip(source_names, outcomes):
+            if isinstance(outcome, Exception):
+                self.load_errors[name] = outcome
+                print(f"  ERROR: Could not load {self.source_files[name]}. Reason: {outcome}")
+            else:
+                # Printed here rather than on the loader threads, so messages come in source order
+                print(f"  Successfully loaded {self.source_files[name]}")
+                raw_data[name] = outcome
+
+        if self.load_errors:
+            print(f"Loaded {len(raw_data)} of {len(source_names)} raw data sources.")
+        else:
+            print("All raw data loaded.")
+        return raw_data
@@ -1,67 +1,586 @@
 # src/data_quality.py
+from statistics import NormalDist
+import numpy as np
 import pandas as pd
+from src.config import (
+    DQ_RULES,
+    DQ_SAMPLE_ROWS,
+    DQ_MAX_FAILED_VALUES,
+    CHUNK_SIZE,
+    DQ_BLOOM_FALSE_POSITIVE_RATE,
+    DQ_HLL_PRECISION,
+    DQ_SAMPLE_SIZE,
+    DQ_CONFIDENCE,
+    DQ_MAX_FAILED_ROWS
+)
+from src.instrumentation import stage
+from src.sketches import BloomFilter, HyperLogLog, ReservoirSample, hash_keys
+
+
+class DataQualityError(ValueError):
+    """Raised when a streamed table exceeds the fail-fast threshold."""
+
+
+class TableRules:
+    """
+    All DQ rules declared for one table. DataQualityValidator.check_table
+    evaluates them together in one pass over the table.
+
+    Args:
+        unique (list): Column lists that must each be a unique key. A row
+                       fails when its key already appeared on an earlier
+                       row, so n copies of a key count as n - 1 failed rows
+                       in every DQ mode.
+        not_null (list): Columns that must not contain NULLs.
+        references (dict): {column: (parent_table, parent_key)}. Every non-null
+                           value of column must exist in the parent's key.
+    """
+    def __init__(self, unique: list = None, not_null: list = None, references: dict = None):
+        self.unique = unique or []
+        self.not_null = not_null or []
+        self.references = references or {}
+
+    def columns(self) -> list:
+        """Every column the rules read, in rule order."""
+        columns = [column for key in self.unique for column in key]
+        return list(dict.fromkeys([*columns, *self.not_null, *self.references]))
+
+
+class CheckResult:
+    """
+    Outcome of one DQ rule: how many rows failed it, and a bounded sample of them.
+    Approximate results (from screen_tables) hold estimates, and `note` says
+    how good they are.
+    """
+    def __init__(self, name: str, columns: list, rows_checked: int, failed_rows: int,
+                 failed_values: int, sample: pd.DataFrame, approximate: bool = False, note: str = None):
+        self.name = name
+        self.columns = columns
+        self.rows_checked = rows_checked
+        self.failed_rows = failed_rows
+        # Distinct values of `columns` among the failed rows (e.g. orphan keys), None if unknown
+        self.failed_values = failed_values
+        self.sample = sample
+        self.approximate = approximate
+        self.note = note
+
+    @property
+    def passed(self) -> bool:
+        return self.failed_rows == 0
+
+    def describe(self) -> str:
+        about = "~" if self.approximate else ""
+        if self.passed:
+            text = f"{self.rows_checked} rows OK"
+        else:
+            text = f"{about}{self.failed_rows} of {self.rows_checked} rows fail"
+            if self.failed_values is not None:
+                text += f" ({self.failed_values} distinct {self.columns} values)"
+            if not self.sample.empty:
+                text += f", e.g. {self.sample[self.columns].drop_duplicates().to_dict('records')}"
+        return f"{text} [{self.note}]" if self.note else text
+
+
+class _SeenKeys:
+    """
+    Exact set of the int64 keys seen so far, kept as sorted runs that are
+    merged LSM-style (a run is merged into the previous one once it is as
+    large), so adding n keys costs O(n log n) overall. Each batch is sorted
+    once, which makes both its own repeats and its lookups in the runs
+    (binary searches with sorted needles) cheap.
+    """
+    def __init__(self):
+        self._runs = []
+
+    def add(self, keys: np.ndarray) -> np.ndarray:
+        """Adds a batch of keys; returns which of them were already seen (earlier in the batch included)."""
+        if len(keys) == 0:
+            # An empty run would break the lookups of later batches
+            return np.zeros(0, dtype=bool)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        repeated = np.zeros(len(keys), dtype=bool)
+        repeated[1:] = sorted_keys[1:] == sorted_keys[:-1]
+        new_keys = sorted_keys[~repeated]
+        for run in self._runs:
+            positions = np.minimum(np.searchsorted(run, sorted_keys), len(run) - 1)
+            repeated |= run[positions] == sorted_keys
+
+        self._runs.append(new_keys)
+        while len(self._runs) > 1 and len(self._runs[-2]) <= len(self._runs[-1]):
+            last = self._runs.pop()
+            merged = np.sort(np.concatenate([self._runs[-1], last]), kind="stable")
+            self._runs[-1] = merged[np.concatenate(([True], merged[1:] != merged[:-1]))]
+
+        seen = np.empty(len(keys), dtype=bool)
+        seen[order] = repeated
+        return seen
+
+
+class _StreamCheck:
+    """
+    Exact check of one table's rules, updated chunk by chunk:
+      * unique keys: keys seen in earlier chunks are kept in a _SeenKeys set
+        (single integer keys as-is, other keys as 64-bit hashes); a row fails
+        when its key already appeared earlier in the stream;
+      * NOT NULL: null rows are counted;
+      * references: child keys are looked up in the parent's key index.
+    Only counts and DQ_SAMPLE_ROWS sample rows per rule are kept from each
+    chunk. Distinct failing values are counted in a _SeenKeys set of up to
+    DQ_MAX_FAILED_VALUES keys, after which the count is dropped (None), so
+    memory stays bounded however many rows fail.
+    """
+    def __init__(self, table_name: str, rules: TableRules, parents: dict):
+        self.rows = 0
+        self._checks = {}
+        self._seen = {}
+        self._parent_keys = {}
+        for columns in rules.unique:
+            self._add_check(f"DQ_UNIQUE: {table_name} on {columns}", columns)
+            self._seen[f"DQ_UNIQUE: {table_name} on {columns}"] = _SeenKeys()
+        if rules.not_null:
+            self._add_check(f"DQ_NULL: {table_name} on {rules.not_null}", rules.not_null)
+        for column, (parent_name, parent_key) in rules.references.items():
+            parent_df = parents.get(parent_name)
+            if parent_df is None or parent_df.empty:
+                continue # Skip check
+            name = f"DQ_REF_INTEGRITY: {parent_name}->{table_name}"
+            self._add_check(name, [column])
+            self._parent_keys[name] = pd.Index(parent_df[parent_key].unique())
+
+    def _add_check(self, name: str, columns: list):
+        self._checks[name] = {"columns": columns, "failed_rows": 0, "failed_values": 0,
+                              "failed_keys": _SeenKeys(), "samples": []}
+
+    def _key_values(self, chunk: pd.DataFrame, columns: list) -> np.ndarray:
+        if len(columns) == 1 and pd.api.types.is_integer_dtype(chunk[columns[0]]) \
+                and not isinstance(chunk[columns[0]].dtype, pd.CategoricalDtype) and not chunk[columns[0]].hasnans:
+            return chunk[columns[0]].to_numpy(dtype=np.int64)
+        keys = chunk[columns] if len(columns) > 1 else chunk[columns[0]]
+        return hash_keys(keys).view(np.int64)
+
+    def add(self, chunk: pd.DataFrame) -> int:
+        """Checks a chunk; returns the largest failed-row count of any rule so far."""
+        self.rows += len(chunk)
+        for name, check in self._checks.items():
+            columns = check["columns"]
+            if name in self._seen:
+                failed = self._seen[name].add(self._key_values(chunk, columns))
+            elif name in self._parent_keys:
+                values = chunk[columns[0]]
+                failed = (self._parent_keys[name].get_indexer(values.to_numpy()) < 0) & values.notna().to_numpy()
+            else:
+                failed = chunk[columns].isna().any(axis=1).to_numpy()
+
+            if failed.any():
+                failed_rows = chunk[failed]
+                check["failed_rows"] += len(failed_rows)
+                self._count_failed_values(check, failed_rows)
+                kept = sum(len(sample) for sample in check["samples"])
+                if kept < DQ_SAMPLE_ROWS:
+                    check["samples"].append(failed_rows.iloc[:DQ_SAMPLE_ROWS - kept])
+        return max((check["failed_rows"] for check in self._checks.values()), default=0)
+
+    def _count_failed_values(self, check: dict, failed_rows: pd.DataFrame):
+        if check["failed_keys"] is None:
+            return
+        repeated = check["failed_keys"].add(self._key_values(failed_rows, check["columns"]))
+        check["failed_values"] += int((~repeated).sum())
+        if check["failed_values"] > DQ_MAX_FAILED_VALUES:
+            check["failed_values"], check["failed_keys"] = None, None
+
+    def results(self, note: str = None) -> list:
+        results = []
+        for name, check in self._checks.items():
+            results.append(CheckResult(
+                name, check["columns"], self.rows, check["failed_rows"], check["failed_values"],
+                pd.concat(check["samples"]) if check["samples"] else pd.DataFrame(), note=note,
+            ))
+        return results
+
+
+class _TableScreen:
+    """
+    Approximate check of one table's rules, fed one chunk at a time so memory
+    stays bounded by the sketches rather than the table:
+      * unique keys: HyperLogLog distinct estimate vs. row count;
+      * references: parent keys in a Bloom filter. A child key the filter
+        rejects is certainly an orphan; false positives can hide orphans, so
+        the orphan count is a lower bound;
+      * NOT NULL: counted exactly ("approximate" mode) or on the sample.
+    In "sample" mode references and NOT NULL rules are checked exactly on a
+    reservoir sample of the table, with a confidence bound on the failure rate.
+    """
+    def __init__(self, table_name: str, rules: TableRules, parents: dict, mode: str):
+        if mode not in ("approximate", "sample"):
+            raise ValueError(f"Unknown DQ screening mode '{mode}'.")
+        self.table_name = table_name
+        self.rules = rules
+        self.mode = mode
+        self.rows = 0
+        self._z = NormalDist().inv_cdf(0.5 + DQ_CONFIDENCE / 2)
+        self._distinct = {tuple(columns): HyperLogLog(DQ_HLL_PRECISION) for columns in rules.unique}
+        self._nulls = 0
+        self._null_sample = []
+
+        # {column: (parent_name, parent keys in a Bloom filter, or their unique values in sample mode)}
+        self._parents = {}
+        for column, (parent_name, parent_key) in rules.references.items():
+            parent_df = parents.get(parent_name)
+            if parent_df is None or parent_df.empty:
+                continue # Skip check
+            if mode == "sample":
+                self._parents[column] = (parent_name, parent_df[parent_key].unique())
+            else:
+                bloom = BloomFilter(len(parent_df), DQ_BLOOM_FALSE_POSITIVE_RATE)
+                for start in range(0, len(parent_df), CHUNK_SIZE):
+                    bloom.add(hash_keys(parent_df[parent_key].iloc[start:start + CHUNK_SIZE]))
+                self._parents[column] = (parent_name, bloom)
+        self._orphans = {column: 0 for column in self._parents}
+        self._orphan_samples = {column: [] for column in self._parents}
+        self._reservoir = ReservoirSample(DQ_SAMPLE_SIZE) if mode == "sample" else None
+
+    def add(self, chunk: pd.DataFrame):
+        self.rows += len(chunk)
+        for columns, hll in self._distinct.items():
+            hll.add(hash_keys(chunk[list(columns)] if len(columns) > 1 else chunk[columns[0]]))
+        if self._reservoir is not None:
+            self._reservoir.add(chunk)
+            return
+        if self.rules.not_null:
+            nulls = chunk[self.rules.not_null].isna().any(axis=1)
+            self._nulls += int(nulls.sum())
+            self._keep_sample(self._null_sample, chunk[nulls])
+        for column, (_, bloom) in self._parents.items():
+            keys = chunk[column]
+            orphans = ~bloom.may_contain(hash_keys(keys)) & keys.notna().to_numpy()
+            self._orphans[column] += int(orphans.sum())
+            self._keep_sample(self._orphan_samples[column], chunk[orphans])
+
+    def flagged_rules(self, results: list) -> TableRules:
+        """The rules behind the failed results, for an exact re-check of just those."""
+        failed = [result for result in results if not result.passed]
+        kinds = {result.name: result.name.split(":")[0] for result in failed}
+        return TableRules(
+            unique=[result.columns for result in failed if kinds[result.name].endswith("UNIQUE")],
+            not_null=self.rules.not_null if any(kind.endswith("NULL") for kind in kinds.values()) else [],
+            references={result.columns[0]: self.rules.references[result.columns[0]]
+                        for result in failed if kinds[result.name].endswith("REF_INTEGRITY")},
+        )
+
+    def _keep_sample(self, samples: list, rows: pd.DataFrame):
+        kept = sum(len(sample) for sample in samples)
+        if kept < DQ_SAMPLE_ROWS and not rows.empty:
+            samples.append(rows.iloc[:DQ_SAMPLE_ROWS - kept])
+
+    def _sample_rate(self, failures: int, sample_size: int):
+        """Estimated failing rows and the upper confidence bound of the failure rate (Wilson score)."""
+        rate = failures / sample_size
+        z2 = self._z ** 2
+        upper = (rate + z2 / (2 * sample_size)
+                 + self._z * np.sqrt(rate * (1 - rate) / sample_size + z2 / (4 * sample_size ** 2))) / (1 + z2 / sample_size)
+        return round(rate * self.rows), f"sampled {sample_size} rows, failure rate <= {upper:.4%} at {DQ_CONFIDENCE:.0%} confidence"
+
+    def results(self) -> list:
+        results = []
+        name = self.table_name
+        for columns, hll in self._distinct.items():
+            # Flag when the distinct estimate is significantly below the row count
+            estimate = hll.estimate()
+            threshold = self.rows * (1 - self._z * hll.relative_error)
+            duplicates = max(round(self.rows - estimate), 1) if estimate < threshold else 0
+            results.append(CheckResult(
+                f"DQ_APPROX_UNIQUE: {name} on {list(columns)}", list(columns), self.rows, duplicates, None,
+                pd.DataFrame(), approximate=True, note=f"~{estimate:,.0f} distinct values (HyperLogLog)",
+            ))
+
+        if self._reservoir is not None:
+            sample = self._reservoir.sample
+            if self.rules.not_null and len(sample):
+                nulls = sample[self.rules.not_null].isna().any(axis=1)
+                failed_rows, note = self._sample_rate(int(nulls.sum()), len(sample))
+                results.append(CheckResult(
+                    f"DQ_SAMPLE_NULL: {name} on {self.rules.not_null}", self.rules.not_null, self.rows,
+                    failed_rows, None, sample[nulls].iloc[:DQ_SAMPLE_ROWS], approximate=True, note=note,
+                ))
+            for column, (parent_name, parent_keys) in self._parents.items():
+                if not len(sample):
+                    continue
+                keys = sample[column]
+                orphans = ~keys.isin(parent_keys) & keys.notna()
+                failed_rows, note = self._sample_rate(int(orphans.sum()), len(sample))
+                results.append(CheckResult(
+                    f"DQ_SAMPLE_REF_INTEGRITY: {parent_name}->{name}", [column], self.rows, failed_rows, None,
+                    sample[orphans].iloc[:DQ_SAMPLE_ROWS], approximate=True, note=note,
+                ))
+            return results
+
+        if self.rules.not_null:
+            results.append(CheckResult(
+                f"DQ_NULL: {name} on {self.rules.not_null}", self.rules.not_null, self.rows, self._nulls, None,
+                pd.concat(self._null_sample) if self._null_sample else pd.DataFrame(),
+            ))
+        for column, (parent_name, _) in self._parents.items():
+            samples = self._orphan_samples[column]
+            results.append(CheckResult(
+                f"DQ_APPROX_REF_INTEGRITY: {parent_name}->{name}", [column], self.rows, self._orphans[column],
+                None, pd.concat(samples) if samples else pd.DataFrame(), approximate=True,
+                note=f"Bloom filter, at least this many orphans ({DQ_BLOOM_FALSE_POSITIVE_RATE:.0%} false positive rate)",
+            ))
+        return results
+
 
 class DataQualityValidator:
     """Performs DQ checks on DataFrames."""
 
     def __init__(self):
-        self.results = {"passed": [], "failed": []}
+        # "flagged" holds approximate checks that suspect a failure (see screen_tables)
+        self.results = {"passed": [], "failed": [], "flagged": []}
+        # {check name: CheckResult} with counts and sample rows for every check run
+        self.check_results = {}
+        # {table name: names of its screening results}, replaced once the table is checked exactly
+        self._screened = {}
         print("DataQualityValidator initialized.")
 
-    def check_uniqueness(self, df: pd.DataFrame, columns: list, table_name: str) -> bool:
-        """Checks if specified columns are a unique key."""
+    def check_tables(self, tables: dict, rule_sets: dict = DQ_RULES) -> bool:
+        """
+        Runs every table's rule set (see config.DQ_RULES). Tables that are
+        not in `tables` (e.g. streamed sources) are skipped. The exact results
+        of a table screened earlier replace its screening results.
+        """
+        passed = True
+        for table_name, rules in rule_sets.items():
+            if table_name not in tables:
+                print(f"  Skipping DQ rules for {table_name}: table is not loaded in memory.")
+                continue
+            self._forget_screen(table_name)
+            rules = rules if isinstance(rules, TableRules) else TableRules(**rules)
+            with stage(f"dq.{table_name}", rows_in=len(tables[table_name])):
+                passed &= self.check_table(tables[table_name], table_name, rules, parents=tables)
+        return passed
+
+    def screen_tables(self, tables: dict, rule_sets: dict = DQ_RULES, mode: str = "approximate") -> list:
+        """
+        Approximate pass over every table's rule set, in bounded memory (see
+        _TableScreen for the "approximate" and "sample" modes). Suspected
+        failures are recorded under results["flagged"], not results["failed"],
+        so a run can be gated on exact checks of just the flagged tables.
+
+        Returns:
+            list: Names of the tables with at least one flagged rule.
+        """
+        flagged = []
+        for table_name, rules in rule_sets.items():
+            if table_name not in tables:
+                print(f"  Skipping DQ rules for {table_name}: table is not loaded in memory.")
+                continue
+            df = tables[table_name]
+            if df.empty:
+                continue # Skip check on empty df
+            rules = rules if isinstance(rules, TableRules) else TableRules(**rules)
+            with stage(f"dq.screen.{table_name}", rows_in=len(df)):
+                screen = _TableScreen(table_name, rules, tables, mode)
+                for start in range(0, len(df), CHUNK_SIZE):
+                    screen.add(df.iloc[start:start + CHUNK_SIZE])
+                results = screen.results()
+            self._screened[table_name] = [result.name for result in results]
+            if not self._record_screen(results):
+                flagged.append(table_name)
+        return flagged
+
+    def _forget_screen(self, table_name: str, names: list = None):
+        """Drops a table's screening results (only `names` of them, if given)."""
+        screened = self._screened.pop(table_name, [])
+        if names is not None:
+            self._screened[table_name] = [name for name in screened if name not in names]
+            screened = [name for name in screened if name in names]
+        for name in screened:
+            del self.check_results[name]
+            for outcome in ("passed", "flagged"):
+                if name in self.results[outcome]:
+                    self.results[outcome].remove(name)
+
+    def _record_screen(self, results: list) -> bool:
+        passed = True
+        for result in results:
+            self.check_results[result.name] = result
+            if result.passed:
+                self.results["passed"].append(result.name)
+            else:
+                passed = False
+                self.results["flagged"].append(result.name)
+                print(f"  FLAGGED: {result.name} - {result.describe()}")
+        return passed
+
+    def checked_chunks(self, chunks, table_name: str, rules: TableRules = None, parents: dict = None,
+                       max_failed_rows: int = DQ_MAX_FAILED_ROWS, raise_on_failure: bool = False):
+        """
+        Passes a stream of chunks through while checking the table's rules on
+        each one, e.g. pd.concat(dq.checked_chunks(loader.iter_source_chunks(...))),
+        or as the chunks a builder writes a fact from.
+
+        Results are recorded when the stream ends. With max_failed_rows set,
+        the stream stops as soon as any rule has more failed rows than that:
+        the results seen so far are recorded and DataQualityError is raised,
+        without reading the rest of the source.
+
+        Args:
+            rules (TableRules): Defaults to the table's entry in DQ_RULES.
+            parents (dict): Tables looked up by reference rules.
+            max_failed_rows (int): Fail-fast threshold (None = read everything).
+            raise_on_failure (bool): Also raise DataQualityError when the
+                                     stream ends with a failed rule, before
+                                     the consumer sees the end of the stream,
+                                     so it can discard what it wrote.
+        """
+        if rules is None:
+            rules = TableRules(**DQ_RULES.get(table_name, {}))
+        stream = _StreamCheck(table_name, rules, parents or {})
+        try:
+            for chunk in chunks:
+                worst = stream.add(chunk)
+                if max_failed_rows is not None and worst > max_failed_rows:
+                    self.record_results(stream.results(note=f"stopped early after {stream.rows} rows"))
+                    stream = None
+                    raise DataQualityError(f"{table_name} failed data quality checks "
+                                           f"(more than {max_failed_rows} failed rows).")
+                yield chunk
+            results, stream = stream.results(), None
+            self.record_results(results)
+            if raise_on_failure and not all(result.passed for result in results):
+                raise DataQualityError(f"{table_name} failed data quality checks.")
+        finally:
+            if stream is not None:
+                self.record_results(stream.results())
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    def screened_chunks(self, chunks, table_name: str, mode: str, rules: TableRules = None, parents: dict = None,
+                        recheck=None, max_failed_rows: int = DQ_MAX_FAILED_ROWS, raise_on_failure: bool = False):
+        """
+        Like checked_chunks, but screens the stream with the bounded-memory
+        sketches of _TableScreen ("approximate" or "sample" mode) instead of
+        keeping every key. When the stream ends, the rules the screen flagged
+        are checked exactly with checked_chunks over recheck() (a function
+        returning a fresh stream of the table), and their exact results
+        replace the screening ones. So the table is read a second time only
+        when something looks wrong. Without recheck, flagged rules stay
+        flagged.
+        """
+        if rules is None:
+            rules = TableRules(**DQ_RULES.get(table_name, {}))
+        screen = _TableScreen(table_name, rules, parents or {}, mode)
+        try:
+            for chunk in chunks:
+                screen.add(chunk)
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+        results = screen.results()
+        self._screened[table_name] = [result.name for result in results]
+        if self._record_screen(results) or recheck is None:
+            return
+        flagged = [result.name for result in results if not result.passed]
+        self._forget_screen(table_name, flagged)
+        print(f"  Checking the flagged rules of {table_name} exactly...")
+        for _ in self.checked_chunks(recheck(), table_name, screen.flagged_rules(results), parents,
+                                     max_failed_rows, raise_on_failure):
+            pass
+
+    def record_results(self, results: list) -> bool:
+        """Records the results of checks run elsewhere (e.g. as SQL); True if they all passed."""
+        for result in results:
+            self._record(result)
+        return all(result.passed for result in results)
+
+    def check_table(self, df: pd.DataFrame, table_name: str, rules: TableRules, parents: dict = None) -> bool:
+        """Checks all of a table's rules in one pass; reference rules look up parents by table name."""
         if df.empty:
             return True # Skip check on empty df
-        is_unique = not df.duplicated(subset=columns).any()
-        test_name = f"DQ_UNIQUE: {table_name} on {columns}"
-        
-        if is_unique:
-            self.results["passed"].append(test_name)
-            return True
+        return self._run_checks(df, self._rule_checks(df, table_name, rules, parents or {}))
+
+    def _rule_checks(self, df: pd.DataFrame, table_name: str, rules: TableRules, parents: dict):
+        """Yields (check name, columns, failing-row mask) for each rule, one mask at a time."""
+        for columns in rules.unique:
+            # Hashed duplicate detection; the first row of each key passes (see TableRules)
+            yield f"DQ_UNIQUE: {table_name} on {columns}", columns, df.duplicated(subset=columns, keep="first")
+        if rules.not_null:
+            yield f"DQ_NULL: {table_name} on {rules.not_null}", rules.not_null, df[rules.not_null].isna().any(axis=1)
+        for column, (parent_name, parent_key) in rules.references.items():
+            parent_df = parents.get(parent_name)
+            if parent_df is None or parent_df.empty:
+                continue # Skip check
+            yield (f"DQ_REF_INTEGRITY: {parent_name}->{table_name}", [column],
+                   self._orphans(df[column], parent_df[parent_key]))
+
+    def _orphans(self, child_keys: pd.Series, parent_keys: pd.Series) -> pd.Series:
+        """Rows whose key is not among the parent keys (NULL keys are left to not_null rules)."""
+        return ~child_keys.isin(parent_keys.unique()) & child_keys.notna()
+
+    def _run_checks(self, df: pd.DataFrame, checks) -> bool:
+        """
+        Folds every check's failing-row mask into one bitmask (bit i = check i),
+        so only one boolean column is alive at a time. Counts and sample rows
+        are then taken from the failing rows alone.
+        """
+        names, column_lists = [], []
+        failures = np.zeros(len(df), dtype=np.uint64)
+        for bit, (name, columns, mask) in enumerate(checks):
+            if bit >= 64:
+                raise ValueError("At most 64 DQ rules can be checked in one pass.")
+            failures |= np.asarray(mask, dtype=np.uint64) << np.uint64(bit)
+            names.append(name)
+            column_lists.append(columns)
+
+        failing_rows = np.flatnonzero(failures)
+        failing_bits = failures[failing_rows]
+        passed = True
+        for bit, (name, columns) in enumerate(zip(names, column_lists)):
+            rows = failing_rows[(failing_bits >> np.uint64(bit)) & np.uint64(1) == 1]
+            result = CheckResult(
+                name, columns, len(df), len(rows),
+                failed_values=len(df[columns].iloc[rows].drop_duplicates()),
+                sample=df.iloc[rows[:DQ_SAMPLE_ROWS]],
+            )
+            self._record(result)
+            passed &= result.passed
+        return passed
+
+    def _record(self, result: CheckResult):
+        self.check_results[result.name] = result
+        if result.passed:
+            self.results["passed"].append(result.name)
         else:
-            self.results["failed"].append(test_name)
-            print(f"  FAILED: {test_name} - Duplicate values found.")
-            return False
+            self.results["failed"].append(result.name)
+            print(f"  FAILED: {result.name} - {result.describe()}")
+
+    def check_uniqueness(self, df: pd.DataFrame, columns: list, table_name: str) -> bool:
+        """Checks if specified columns are a unique key."""
+        return self.check_table(df, table_name, TableRules(unique=[columns]))
 
     def check_nulls(self, df: pd.DataFrame, columns: list, table_name: str) -> bool:
         """Checks for any NULL values in specified columns."""
-        if df.empty:
-            return True # Skip check on empty df
-        has_nulls = df[columns].isnull().any().any()
-        test_name = f"DQ_NULL: {table_name} on {columns}"
-
-        if not has_nulls:
-            self.results["passed"].append(test_name)
-            return True
-        else:
-            self.results["failed"].append(test_name)
-            print(f"  FAILED: {test_name} - NULL values found.")
-            return False
+        return self.check_table(df, table_name, TableRules(not_null=columns))
 
     def check_referential_integrity(self, parent_df: pd.DataFrame, child_df: pd.DataFrame, 
                                       parent_key: str, child_key: str, relationship_name: str) -> bool:
         """Checks if all child keys exist in the parent table."""
         if child_df.empty or parent_df.empty:
             return True # Skip check
-            
-        parent_keys = set(parent_df[parent_key].unique())
-        child_keys = set(child_df[child_key].unique())
-        
-        orphan_keys = child_keys - parent_keys
         test_name = f"DQ_REF_INTEGRITY: {relationship_name}"
-
-        if not orphan_keys:
-            self.results["passed"].append(test_name)
-            return True
-        else:
-            self.results["failed"].append(test_name)
-            print(f"  FAILED: {test_name} - Orphan keys found: {orphan_keys}")
-            return False
+        orphans = self._orphans(child_df[child_key], parent_df[parent_key])
+        return self._run_checks(child_df, [(test_name, [child_key], orphans)])
 
     def print_summary(self):
         print("\n--- Data Quality Check Summary ---")
         print(f"Total Passed: {len(self.results['passed'])}")
         print(f"Total Failed: {len(self.results['failed'])}")
         for failure in self.results["failed"]:
-            print(f"  - {failure}")
-        print("----------------------------------\n")
\ No newline at end of file
+            print(f"  - {failure}: {self.check_results[failure].describe()}")
+        if self.results["flagged"]:
+            print(f"Total Flagged (approximate): {len(self.results['flagged'])}")
+            for flag in self.results["flagged"]:
+                print(f"  - {flag}: {self.check_results[flag].describe()}")
+        print("----------------------------------\n")
@@ -0,0 +1,55 @@
+# src/date_keys.py
+import numpy as np
+import pandas as pd
+from src.config import OPEN_ENDED_YEAR, OPEN_ENDED_DATE_KEY, UNKNOWN_DATE_KEY
+
+
+def to_date_key(values: pd.Series) -> pd.Series:
+    """
+    Converts datetimes to integer YYYYMMDD date keys (e.g. 2024-03-02 -> 20240302).
+
+    The key is computed arithmetically as year*10000 + month*100 + day from the
+    datetime fields, instead of formatting and re-parsing a string per row.
+
+    Time zones: tz-aware values are keyed on their own wall-clock date, i.e.
+    the offset the timestamp carries. Convert the series (e.g. tz_convert("UTC"))
+    before calling this to key on a different calendar.
+
+    Sentinels: dates in or after OPEN_ENDED_YEAR (the 9999-01-01 end dates of
+    open-ended plans) map to OPEN_ENDED_DATE_KEY, and missing values map to
+    UNKNOWN_DATE_KEY, so the result is always a non-null int32 column.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.to_datetime(values)
+
+    fields = values.dt
+    keys = fields.year * 10000 + fields.month * 100 + fields.day
+    keys = keys.mask(fields.year >= OPEN_ENDED_YEAR, OPEN_ENDED_DATE_KEY)
+    return keys.fillna(UNKNOWN_DATE_KEY).astype("int32")
+
+
+def date_key_days(keys) -> np.ndarray:
+    """
+    Day numbers (days since 1970-01-01) of YYYYMMDD date keys, so date keys
+    can be subtracted. Computed arithmetically like to_date_key; sentinel
+    keys must be filtered out first.
+    """
+    keys = np.asarray(keys, dtype="int64")
+    months = (keys // 10000 - 1970) * 12 + keys // 100 % 100 - 1
+    days = months.astype("datetime64[M]").astype("datetime64[D]") + (keys % 100 - 1)
+    return days.astype("int64")
+
+
+def days_to_date_key(days) -> np.ndarray:
+    """YYYYMMDD date keys of day numbers (the inverse of date_key_days)."""
+    dates = np.asarray(days, dtype="int64").astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    month_numbers = months.astype("int64")
+    day = (dates - months.astype("datetime64[D]")).astype("int64") + 1
+    return ((month_numbers // 12 + 1970) * 10000 + (month_numbers % 12 + 1) * 100 + day).astype("int32")
+
+
+def date_string_key(date: str) -> int:
+    """Date key of a date written as text, e.g. AS_OF_DATE."""
+    date = pd.Timestamp(date)
+    return date.year * 10000 + date.month * 100 + date.day
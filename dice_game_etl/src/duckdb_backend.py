@@ -0,0 +1,291 @@
+# src/duckdb_backend.py
+import duckdb
+import pandas as pd
+from src.config import (
+    RAW_DATA_DIR,
+    SOURCE_FILES,
+    SOURCE_SCHEMAS,
+    CHUNK_SIZE,
+    UNKNOWN_KEY,
+    OPEN_ENDED_YEAR,
+    OPEN_ENDED_DATE_KEY,
+    UNKNOWN_DATE_KEY,
+    DUCKDB_MEMORY_LIMIT,
+    DUCKDB_TEMP_DIR,
+    DQ_SAMPLE_ROWS,
+    AS_OF_DATE
+)
+from src.data_quality import CheckResult, TableRules
+from src.date_keys import date_string_key
+from src.transformations import StarSchemaBuilder
+
+# DuckDB column types for the dtypes declared in SOURCE_SCHEMAS. Datetime
+# columns are read as text and cast in the fact queries.
+_DUCKDB_TYPES = {
+    "int16": "SMALLINT",
+    "int32": "INTEGER",
+    "int64": "BIGINT",
+    "float64": "DOUBLE",
+    "category": "VARCHAR",
+}
+
+# Key tables registered with DuckDB: name -> (dimension, natural key, natural key dtype, surrogate key)
+_KEY_TABLES = {
+    "user_keys": ("dim_user", "user_id", "int64", "user_key"),
+    "registration_keys": ("dim_user", "user_registration_id", "int64", "user_key"),
+    "channel_keys": ("dim_channel", "play_session_channel_code", "str", "channel_key"),
+    "status_keys": ("dim_status", "play_session_status_code", "str", "status_key"),
+    "plan_keys": ("dim_plan", "plan_id", "int64", "plan_key"),
+    "payment_detail_keys": ("dim_payment_method", "payment_detail_id", "int64", "payment_detail_key"),
+}
+
+
+def _date_key_sql(column: str, utc: bool = False) -> str:
+    """
+    SQL equivalent of date_keys.to_date_key. The date is taken as written in
+    the source (wall clock), or in UTC when utc=True, like the pandas path.
+    """
+    if utc:
+        date = f"CAST(timezone('UTC', CAST({column} AS TIMESTAMPTZ)) AS DATE)"
+    else:
+        date = f"CAST(left({column}, 10) AS DATE)"
+    return f"""CAST(CASE
+        WHEN {column} IS NULL THEN {UNKNOWN_DATE_KEY}
+        WHEN year({date}) >= {OPEN_ENDED_YEAR} THEN {OPEN_ENDED_DATE_KEY}
+        ELSE year({date}) * 10000 + month({date}) * 100 + day({date})
+    END AS INTEGER)"""
+
+
+def _connect() -> duckdb.DuckDBPyConnection:
+    """DuckDB connection that spills to DUCKDB_TEMP_DIR beyond DUCKDB_MEMORY_LIMIT."""
+    DUCKDB_TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+    con.execute(f"SET temp_directory = '{DUCKDB_TEMP_DIR.as_posix()}'")
+    return con
+
+
+def source_sql(source_name: str, raw_data_dir=RAW_DATA_DIR) -> str:
+    """read_csv() call for a raw source, with the column types declared in SOURCE_SCHEMAS."""
+    schema = SOURCE_SCHEMAS.get(source_name, {})
+    types = {column: _DUCKDB_TYPES[str(dtype)] for column, dtype in schema.get("dtype", {}).items()}
+    types.update({column: "VARCHAR" for column in schema.get("parse_dates", [])})
+    types_sql = ", ".join(f"'{column}': '{duck_type}'" for column, duck_type in types.items())
+    path = (raw_data_dir / SOURCE_FILES[source_name]).as_posix()
+    return f"read_csv('{path}', header = true, types = {{{types_sql}}})"
+
+
+class DuckDBQualityChecker:
+    """
+    Checks a raw source's DQ rules with SQL over its CSV file, so the DuckDB
+    backend checks the fact sources without loading them into pandas. Results
+    and counts are those of DataQualityValidator.check_table: n copies of a
+    unique key are n - 1 failed rows, and NULL child keys are left to not_null
+    rules. The parents of reference rules are in-memory tables.
+
+    Args:
+        parents (dict): Tables looked up by reference rules.
+    """
+    def __init__(self, parents: dict, raw_data_dir=RAW_DATA_DIR):
+        self.parents = parents
+        self.raw_data_dir = raw_data_dir
+
+    def check(self, table_name: str, rules: TableRules) -> list:
+        """CheckResults of every rule, or none for an empty source (as check_table skips empty tables)."""
+        con = _connect()
+        try:
+            source = source_sql(table_name, self.raw_data_dir)
+            results = [self._unique(con, source, table_name, columns) for columns in rules.unique]
+            if rules.not_null:
+                results.append(self._not_null(con, source, table_name, rules.not_null))
+            for column, (parent_name, parent_key) in rules.references.items():
+                parent_df = self.parents.get(parent_name)
+                if parent_df is None or parent_df.empty:
+                    continue # Skip check
+                con.register("parent_keys", parent_df[[parent_key]].drop_duplicates())
+                results.append(self._references(con, source, table_name, column, parent_name, parent_key))
+                con.unregister("parent_keys")
+        finally:
+            con.close()
+        if results and results[0].rows_checked == 0:
+            return []
+        return results
+
+    def _result(self, con, name: str, columns: list, counts: tuple, failing_rows_sql: str) -> CheckResult:
+        """CheckResult from (rows, failed rows, failed values), sampling failing rows only if there are any."""
+        rows, failed_rows, failed_values = (int(count or 0) for count in counts)
+        if failed_rows:
+            sample = con.execute(f"{failing_rows_sql} LIMIT {DQ_SAMPLE_ROWS}").df()
+        else:
+            sample = pd.DataFrame(columns=columns)
+        return CheckResult(name, columns, rows, failed_rows, failed_values, sample)
+
+    def _unique(self, con, source: str, table_name: str, columns: list) -> CheckResult:
+        key = ", ".join(columns)
+        counts = con.execute(f"""
+            SELECT sum(n), sum(n - 1), count(*) FILTER (WHERE n > 1)
+            FROM (SELECT count(*) AS n FROM {source} GROUP BY {key})
+        """).fetchone()
+        # Like check_table, the first row of each key passes
+        return self._result(con, f"DQ_UNIQUE: {table_name} on {columns}", columns, counts,
+                            f"SELECT * FROM {source} QUALIFY row_number() OVER (PARTITION BY {key}) > 1")
+
+    def _not_null(self, con, source: str, table_name: str, columns: list) -> CheckResult:
+        condition = " OR ".join(f"{column} IS NULL" for column in columns)
+        counts = con.execute(f"""
+            SELECT count(*), count(*) FILTER (WHERE {condition}),
+                   count(DISTINCT row({", ".join(columns)})) FILTER (WHERE {condition})
+            FROM {source}
+        """).fetchone()
+        return self._result(con, f"DQ_NULL: {table_name} on {columns}", columns, counts,
+                            f"SELECT * FROM {source} WHERE {condition}")
+
+    def _references(self, con, source: str, table_name: str, column: str, parent_name: str,
+                    parent_key: str) -> CheckResult:
+        orphan = f"s.{column} IS NOT NULL AND p.{parent_key} IS NULL"
+        joined = f"{source} AS s LEFT JOIN parent_keys AS p ON s.{column} = p.{parent_key}"
+        counts = con.execute(f"""
+            SELECT count(*), count(*) FILTER (WHERE {orphan}), count(DISTINCT s.{column}) FILTER (WHERE {orphan})
+            FROM {joined}
+        """).fetchone()
+        return self._result(con, f"DQ_REF_INTEGRITY: {parent_name}->{table_name}", [column], counts,
+                            f"SELECT s.* FROM {joined} WHERE {orphan}")
+
+
+class DuckDBStarSchemaBuilder(StarSchemaBuilder):
+    """
+    StarSchemaBuilder whose facts are built by an embedded DuckDB engine.
+
+    Dimensions are small and are built exactly as in the pandas builder (same
+    surrogate keys, same key registry). The facts are built by SQL that scans
+    user_play_session.csv and user_plan.csv directly, joins them to the
+    dimension key tables and derives the date keys. DuckDB spills to
+    DUCKDB_TEMP_DIR beyond DUCKDB_MEMORY_LIMIT and hands the result over in
+    batches of CHUNK_SIZE rows, which are written and rolled up one at a time,
+    so neither the raw sources nor the facts have to fit in memory. The fact
+    sources therefore do not need to be in raw_data at all.
+
+    Fact rows come out in no particular order (partitioned outputs are sorted
+    by date key per batch, as in streaming mode), and facts are not kept in
+    self.facts.
+    """
+    # Both facts share one DuckDB connection, which is not thread-safe; each
+    # query already runs on all of DuckDB's own threads
+    concurrent_facts = False
+
+    def __init__(self, raw_data: dict, state=None, incremental: bool = False, raw_data_dir=RAW_DATA_DIR,
+                 cache=None):
+        super().__init__(raw_data, state=state, incremental=incremental, fact_processes=1,
+                         raw_data_dir=raw_data_dir, cache=cache)
+        self._con = None
+
+    def build(self, play_session_chunks=None):
+        # The key tables registered with DuckDB need every dimension first
+        self.create_dimensions()
+        return self.create_facts(play_session_chunks)
+
+    def create_facts(self, play_session_chunks=None):
+        if play_session_chunks is not None:
+            raise ValueError("The DuckDB backend reads user_play_session.csv itself; pass no chunks.")
+        if not self.dimensions:
+            print("ERROR: Dimensions must be created before facts.")
+            return
+
+        self._con = _connect()
+        try:
+            self._con.execute("SET preserve_insertion_order = false")
+            for table_name in _KEY_TABLES:
+                self._con.register(table_name, self._key_table(table_name))
+            return super().create_facts()
+        finally:
+            self._con.close()
+            self._con = None
+
+    def _key_table(self, table_name: str) -> pd.DataFrame:
+        """A dimension's (natural_key, surrogate_key[, cost_amount]) rows for joining in SQL."""
+        dim_name, natural_key, natural_dtype, surrogate_key = _KEY_TABLES[table_name]
+        dim_df = self.dimensions[dim_name]
+        columns = ["cost_amount"] if dim_name == "dim_plan" else []
+        if dim_df.empty:
+            return pd.DataFrame({
+                "natural_key": pd.Series([], dtype=natural_dtype),
+                "surrogate_key": pd.Series([], dtype="int32"),
+                **{column: pd.Series([], dtype="float64") for column in columns},
+            })
+        dim_df = dim_df[dim_df[natural_key].notna()]
+        return pd.DataFrame({
+            "natural_key": dim_df[natural_key].astype(natural_dtype).to_numpy(),
+            "surrogate_key": dim_df[surrogate_key].astype("int32").to_numpy(),
+            **{column: dim_df[column].astype("float64").to_numpy() for column in columns},
+        })
+
+    def _source_sql(self, source_name: str) -> str:
+        return source_sql(source_name, self.raw_data_dir)
+
+    def _query_chunks(self, fact_name: str, sql: str, key_columns: list):
+        """Runs a fact query and yields its rows as DataFrames of at most CHUNK_SIZE rows."""
+        reader = self._con.execute(sql).to_arrow_reader(CHUNK_SIZE)
+        rows = 0
+        for batch in reader:
+            fact_chunk = batch.to_pandas()
+            rows += len(fact_chunk)
+            self._tally_unmatched(fact_name, fact_chunk, key_columns)
+            yield fact_chunk
+        if rows == 0:
+            # Still write an empty table with the fact's columns
+            yield reader.schema.empty_table().to_pandas()
+
+    def _tally_unmatched(self, fact_name: str, fact_chunk: pd.DataFrame, key_columns: list):
+        """Counts rows that got UNKNOWN_KEY, like _resolve_key does for the pandas path."""
+        for column in key_columns:
+            unmatched = int((fact_chunk[column] == UNKNOWN_KEY).sum())
+            if unmatched:
+                counter = f"{fact_name}.{column}"
+                self.unmatched_keys[counter] = self.unmatched_keys.get(counter, 0) + unmatched
+
+    def _create_fact_play_session(self, chunks=None):
+        watermark = self.state.get_watermark("play_session") if self.incremental else None
+        where = "" if watermark is None else f"WHERE s.play_session_id > {int(watermark)}"
+        sql = f"""
+            SELECT
+                CAST(s.play_session_id AS BIGINT) AS play_session_id,
+                CAST(coalesce(u.surrogate_key, {UNKNOWN_KEY}) AS INTEGER) AS user_key,
+                CAST(coalesce(c.surrogate_key, {UNKNOWN_KEY}) AS INTEGER) AS channel_key,
+                CAST(coalesce(st.surrogate_key, {UNKNOWN_KEY}) AS INTEGER) AS status_key,
+                {_date_key_sql("s.start_datetime")} AS start_date_key,
+                {_date_key_sql("s.end_datetime")} AS end_date_key,
+                CAST(s.total_score AS INTEGER) AS total_score,
+                (epoch_us(CAST(s.end_datetime AS TIMESTAMPTZ))
+                 - epoch_us(CAST(s.start_datetime AS TIMESTAMPTZ))) / 60e6 AS duration_minutes
+            FROM {self._source_sql("play_session")} AS s
+            LEFT JOIN user_keys AS u ON s.user_id = u.natural_key
+            LEFT JOIN channel_keys AS c ON s.channel_code = c.natural_key
+            LEFT JOIN status_keys AS st ON s.status_code = st.natural_key
+            {where}
+        """
+        fact_chunks = self._query_chunks("fact_play_session", sql, ["user_key", "channel_key", "status_key"])
+        max_session_id = self._write_fact_chunks("fact_play_session", fact_chunks, append=watermark is not None,
+                                                 max_column="play_session_id")
+        self._report_unmatched_keys("fact_play_session")
+        self._advance_watermark(watermark, max_session_id)
+
+    def _create_fact_subscription(self):
+        as_of_key = date_string_key(AS_OF_DATE)
+        sql = f"""
+            SELECT
+                CAST(coalesce(r.surrogate_key, {UNKNOWN_KEY}) AS INTEGER) AS user_key,
+                CAST(coalesce(p.surrogate_key, {UNKNOWN_KEY}) AS INTEGER) AS plan_key,
+                CAST(coalesce(pd.surrogate_key, {UNKNOWN_KEY}) AS INTEGER) AS payment_detail_key,
+                {_date_key_sql("s.start_date", utc=True)} AS start_date_key,
+                {_date_key_sql("s.end_date", utc=True)} AS end_date_key,
+                CAST(p.cost_amount AS DOUBLE) AS cost_amount,
+                ({_date_key_sql("s.start_date", utc=True)} <= {as_of_key}
+                    AND {_date_key_sql("s.end_date", utc=True)} > {as_of_key}) AS is_active
+            FROM {self._source_sql("user_plan")} AS s
+            LEFT JOIN registration_keys AS r ON s.user_registration_id = r.natural_key
+            LEFT JOIN plan_keys AS p ON s.plan_id = p.natural_key
+            LEFT JOIN payment_detail_keys AS pd ON s.payment_detail_id = pd.natural_key
+        """
+        fact_chunks = self._query_chunks("fact_subscription", sql, ["user_key", "plan_key", "payment_detail_key"])
+        self._write_fact_chunks("fact_subscription", fact_chunks)
+        self._report_unmatched_keys("fact_subscription")
@@ -1,26 +1,127 @@
 # src/insights.py
 import pandas as pd
-from src.config import DIM_DIR, FACT_DIR, OUTPUT_FORMAT
+import pyarrow.dataset as ds
+from src.config import DIM_DIR, FACT_DIR, AGG_DIR, REPORT_PATH, AS_OF_DATE
+from src.storage import output_path, read_table
+from src.aggregation import ROLLUPS, Aggregate, AggregationEngine
+from src.instrumentation import stage
+from src.stage_cache import StageCache
+
+# Columns the insights use from each table. A table is read from disk once
+# per run, with just these columns, the first time an insight asks for it.
+INSIGHT_COLUMNS = {
+    "fact_play_session": ["play_session_id", "user_key", "channel_key", "status_key",
+                          "total_score", "duration_minutes"],
+    "fact_subscription": ["user_key", "plan_key", "payment_detail_key", "start_date_key", "cost_amount"],
+    "fact_subscription_period": ["plan_key", "period_start_date_key", "billed_amount"],
+    "dim_channel": ["channel_key", "english_description"],
+    "dim_status": ["status_key", "english_description"],
+    "dim_plan": ["plan_key", "english_description"],
+    "dim_payment_method": ["payment_detail_key", "payment_method_code"],
+    "dim_date": ["date_key", "year", "month", "month_name"],
+}
+
+# Everything the insights need from the fact tables, grouped on surrogate keys.
+# Dimension labels are joined onto these results afterwards. Aggregates that a
+# rollup in ROLLUPS can answer are computed from the rollup, not the fact.
+INSIGHT_AGGREGATES = [
+    # Insights 1 and 8
+    Aggregate("sessions_by_channel", "fact_play_session", ["channel_key"],
+              {"sessions": ("play_session_id", "count"), "avg_duration": ("duration_minutes", "mean")}),
+    # Insight 4
+    Aggregate("sessions_by_status", "fact_play_session", ["status_key"],
+              {"sessions": ("play_session_id", "count")}),
+    # Insight 6
+    Aggregate("top_users_by_score", "fact_play_session", ["user_key"],
+              {"total_score": ("total_score", "sum")}, top_k=("total_score", 10)),
+    # Insight 2
+    Aggregate("subscriptions_by_plan", "fact_subscription", ["plan_key"],
+              {"unique_users": ("user_key", "nunique")}),
+    # Insight 3: revenue billed per plan, so its total matches the months of insight 7
+    Aggregate("billed_by_plan", "fact_subscription_period", ["plan_key"],
+              {"revenue": ("billed_amount", "sum")}),
+    # Insight 5: distinct users per payment type cannot be summed from per-key
+    # counts, so keep the distinct (payment detail, user) pairs
+    Aggregate("payment_detail_users", "fact_subscription", ["payment_detail_key", "user_key"],
+              {"subscriptions": ("cost_amount", "count")}),
+    # Insight 7: revenue billed per month, from every billing period of each subscription
+    Aggregate("revenue_by_month", "fact_subscription_period", ["period_month_key"],
+              {"revenue": ("billed_amount", "sum")},
+              derive={"period_month_key": ("period_start_date_key", lambda date_keys: date_keys // 100)}),
+]
+
+# What each insight reads: (aggregates from INSIGHT_AGGREGATES, dimensions it takes labels from)
+INSIGHT_INPUTS = {
+    "insight_1": (["sessions_by_channel"], ["dim_channel"]),
+    "insight_2": (["subscriptions_by_plan"], ["dim_plan"]),
+    "insight_3": (["billed_by_plan"], ["dim_plan"]),
+    "insight_4_session_outcomes": (["sessions_by_status"], ["dim_status"]),
+    "insight_5_payment_methods": (["payment_detail_users"], ["dim_payment_method"]),
+    "insight_6_top_users": (["top_users_by_score"], ["dim_user_attributes"]),
+    "insight_7_monthly_revenue": (["revenue_by_month"], ["dim_date"]),
+    "insight_8_avg_duration": (["sessions_by_channel"], ["dim_channel"]),
+}
 
 class InsightGenerator:
     """
     Generates key insights from the processed data warehouse.
     """
-    def __init__(self):
+    def __init__(self, tables: dict = None, cache: StageCache = None, fingerprints: dict = None):
+        """
+        Args:
+            tables (dict): Optional tables already in memory, keyed by name
+                           (e.g. StarSchemaBuilder.in_memory_tables()). These
+                           are used as-is instead of being read back from disk.
+            cache (StageCache): Optional cache of report sections. An insight
+                                whose tables (INSIGHT_INPUTS) have the same
+                                fingerprints as in an earlier run reuses that
+                                run's section, and the aggregates only it
+                                needs are not computed.
+            fingerprints (dict): Table fingerprints, e.g. StarSchemaBuilder.fingerprints.
+        """
         self.dim_path = DIM_DIR
         self.fact_path = FACT_DIR
+        self.agg_path = AGG_DIR
+        self.report_path = REPORT_PATH
         self.report_content = []
+        # Per-run table cache: every table is loaded (or seeded) at most once
+        self._tables = dict(tables or {})
+        self._aggregates = {}
+        self.cache = cache
+        self.fingerprints = fingerprints or {}
         print("InsightGenerator initialized.")
 
-    def _load_data(self, name: str, is_fact: bool = False):
-        """Helper to load processed data."""
+    def _load_data(self, name: str, is_fact: bool = False, columns: list = None):
+        """
+        Helper to load processed data through the per-run table cache.
+
+        Args:
+            columns (list): Columns to return (all cached columns if None).
+        """
+        table = self._tables.get(name)
+        if table is None or any(column not in table.columns for column in columns or []):
+            # Not loaded yet, or asked for a column outside INSIGHT_COLUMNS
+            wanted = INSIGHT_COLUMNS.get(name)
+            if wanted is not None and table is not None:
+                wanted = list(dict.fromkeys([*table.columns, *columns]))
+            table = self._read_table(name, is_fact, wanted)
+            self._tables[name] = table
+
+        if table.empty:
+            return table
+        if columns is not None:
+            table = table[columns]
+        return table
+
+    def _read_table(self, name: str, is_fact: bool, columns: list, filters: ds.Expression = None) -> pd.DataFrame:
         dir = self.fact_path if is_fact else self.dim_path
-        file_path = dir / f"{name}.{OUTPUT_FORMAT}"
+        if name.startswith("agg_"):
+            dir = self.agg_path
+            if not output_path(dir, name).exists():
+                # Rollups are optional; the aggregation engine falls back to the fact
+                return pd.DataFrame()
         try:
-            if OUTPUT_FORMAT == "parquet":
-                return pd.read_parquet(file_path)
-            else:
-                return pd.read_csv(file_path)
+            return read_table(dir, name, columns=columns, filters=filters)
         except Exception as e:
             print(f"  ERROR loading processed file {name}: {e}")
             return pd.DataFrame()
@@ -29,30 +130,100 @@ class InsightGenerator:
         """Orchestrates all insight generation."""
         print("Generating insights...")
         self.report_content.append("# 2024 Dice Game Analysis Report\n")
+
+        insights = (self._get_insight_1, self._get_insight_2, self._get_insight_3,
+                    self._get_insight_4_session_outcomes, self._get_insight_5_payment_methods,
+                    self._get_insight_6_top_users, self._get_insight_7_monthly_revenue,
+                    self._get_insight_8_avg_duration)
+        keys = {get_insight: self._insight_key(get_insight) for get_insight in insights}
+        cached = {
+            get_insight: entry for get_insight, key in keys.items()
+            if key is not None and (entry := self.cache.load(self._stage_name(get_insight), key)) is not None
+        }
+
+        # Rollups where they can serve an aggregate, otherwise one read and one
+        # groupby per grouping of each fact table, shared by all insights
+        needed = {name for get_insight in insights if get_insight not in cached
+                  for name in INSIGHT_INPUTS[self._insight_name(get_insight)][0]}
+        engine = AggregationEngine(rollups=ROLLUPS)
+        for aggregate in INSIGHT_AGGREGATES:
+            if aggregate.name in needed:
+                engine.register(aggregate)
+        if needed:
+            with stage("insights.aggregates"):
+                self._aggregates = engine.run(
+                    lambda table, columns: self._load_data(table, is_fact=True, columns=columns)
+                )
+            print(f"  Aggregates computed from: {engine.sources}")
         
-        self._get_insight_1()
-        self._get_insight_2()
-        self._get_insight_3()
-        self._get_insight_4_session_outcomes()
-        self._get_insight_5_payment_methods()
-        self._get_insight_6_top_users()
-        self._get_insight_7_monthly_revenue()
-        self._get_insight_8_avg_duration()
+        for get_insight in insights:
+            stage_name = self._stage_name(get_insight)
+            with stage(stage_name):
+                if get_insight in cached:
+                    self.report_content.extend(cached[get_insight].extra["section"])
+                    continue
+                start = len(self.report_content)
+                get_insight()
+                if keys[get_insight] is not None:
+                    self.cache.store(stage_name, keys[get_insight],
+                                     extra={"section": self.report_content[start:]})
+        if cached:
+            print(f"  Reused {len(cached)} cached insights (inputs unchanged)")
         
         print("Insights generated.")
-        return self._save_report()
+        with stage("insights.save_report"):
+            return self._save_report()
+
+    def _insight_name(self, get_insight) -> str:
+        return get_insight.__name__.removeprefix("_get_")
+
+    def _stage_name(self, get_insight) -> str:
+        return f"insights.{self._insight_name(get_insight)}"
+
+    def _insight_key(self, get_insight):
+        """Cache key of an insight from the fingerprints of the tables it reads (None when not caching)."""
+        if self.cache is None:
+            return None
+        aggregate_names, dim_names = INSIGHT_INPUTS[self._insight_name(get_insight)]
+        tables = [aggregate.table for aggregate in INSIGHT_AGGREGATES if aggregate.name in aggregate_names]
+        return self.cache.key(self._stage_name(get_insight),
+                              {name: self.fingerprints.get(name) for name in [*tables, *dim_names]})
+
+    def _with_labels(self, result: pd.DataFrame, dim_name: str, key: str, labels: list) -> pd.DataFrame:
+        """Joins dimension labels onto an aggregated result (inner join, like the dimension merge)."""
+        dim_df = self._load_data(dim_name, columns=[key, *labels])
+        if dim_df.empty:
+            return pd.DataFrame()
+        return pd.merge(result, dim_df, on=key)
+
+    def _with_attributes(self, result: pd.DataFrame, dim_name: str, key: str, attributes: list) -> pd.DataFrame:
+        """
+        Joins descriptive attributes (see DIMENSION_ATTRIBUTES) onto a final,
+        small result such as a top-k. Only the result's rows are fetched from
+        the <dim>_attributes side table, and they are not kept afterwards.
+        """
+        name = f"{dim_name}_attributes"
+        keys = result[key].unique().tolist()
+        table = self._tables.get(name)
+        if table is not None:
+            dim_df = table.loc[table[key].isin(keys), [key, *attributes]]
+        else:
+            dim_df = self._read_table(name, False, [key, *attributes], filters=ds.field(key).isin(keys))
+        if dim_df.empty:
+            return pd.DataFrame()
+        return pd.merge(result, dim_df, on=key)
 
     def _get_insight_1(self):
         """[cite: 14] How many play sessions took place Online vs on the Mobile App?"""
-        fact_play = self._load_data("fact_play_session", is_fact=True)
-        dim_channel = self._load_data("dim_channel")
-        
-        if fact_play.empty or dim_channel.empty:
+        sessions = self._aggregates["sessions_by_channel"]
+        if sessions.empty:
             return
 
-        merged = pd.merge(fact_play, dim_channel, on="channel_key")
-        result = merged.groupby("english_description")["play_session_id"].count().reset_index()
-        result = result.rename(columns={"english_description": "Channel", "play_session_id": "Total Sessions"})
+        result = self._with_labels(sessions, "dim_channel", "channel_key", ["english_description"])
+        if result.empty:
+            return
+        result = result.groupby("english_description")["sessions"].sum().reset_index()
+        result = result.rename(columns={"english_description": "Channel", "sessions": "Total Sessions"})
         
         self.report_content.append("## Insight 1: Play Sessions by Channel\n")
         self.report_content.append(result.to_markdown(index=False))
@@ -60,17 +231,16 @@ class InsightGenerator:
 
     def _get_insight_2(self):
         """[cite: 15] How many registered users opted for a onetime payment vs a subscription?"""
-        fact_sub = self._load_data("fact_subscription", is_fact=True)
-        dim_plan = self._load_data("dim_plan")
-
-        if fact_sub.empty or dim_plan.empty:
+        plans = self._aggregates["subscriptions_by_plan"]
+        if plans.empty:
             return
 
-        merged = pd.merge(fact_sub, dim_plan, on="plan_key")
-        
         # We count *distinct users* per plan type
-        result = merged.groupby("english_description")["user_key"].nunique().reset_index()
-        result = result.rename(columns={"english_description": "Plan Type", "user_key": "Unique Users"})
+        result = self._with_labels(plans, "dim_plan", "plan_key", ["english_description"])
+        if result.empty:
+            return
+        result = result.sort_values(by="english_description")[["english_description", "unique_users"]]
+        result = result.rename(columns={"english_description": "Plan Type", "unique_users": "Unique Users"})
 
         self.report_content.append("## Insight 2: Unique Users by Plan Type\n")
         self.report_content.append(result.to_markdown(index=False))
@@ -78,35 +248,35 @@ class InsightGenerator:
 
     def _get_insight_3(self):
         """[cite: 16] How much gross revenue was generated from the app?"""
-        fact_sub = self._load_data("fact_subscription", is_fact=True)
-        dim_plan = self._load_data("dim_plan")
-        
-        if fact_sub.empty:
+        plans = self._aggregates["billed_by_plan"]
+        if plans.empty:
             return
 
-        total_revenue = fact_sub["cost_amount"].sum()
+        total_revenue = plans["revenue"].sum()
         
-        merged = pd.merge(fact_sub, dim_plan, on="plan_key")
-        revenue_by_plan = merged.groupby("english_description")["cost_amount"].sum().reset_index()
-        revenue_by_plan = revenue_by_plan.rename(columns={"english_description": "Plan Type", "cost_amount": "Total Revenue"})
+        revenue_by_plan = self._with_labels(plans, "dim_plan", "plan_key", ["english_description"])
+        revenue_by_plan = revenue_by_plan.groupby("english_description")["revenue"].sum().reset_index()
+        revenue_by_plan = revenue_by_plan.rename(columns={"english_description": "Plan Type", "revenue": "Total Revenue"})
         
         self.report_content.append("## Insight 3: Gross Revenue\n")
-        self.report_content.append(f"**Total Gross Revenue (2024): ${total_revenue:,.2f}**\n")
+        self.report_content.append(f"**Total Gross Revenue (billed through {AS_OF_DATE}): ${total_revenue:,.2f}**\n")
+        self.report_content.append("Every billing period of each subscription up to the as-of date is counted, "
+                                   "as in the monthly trend of Insight 7.\n")
         self.report_content.append("\n### Revenue Breakdown by Plan Type\n")
         self.report_content.append(revenue_by_plan.to_markdown(index=False))
         self.report_content.append("\n")
 
     def _get_insight_4_session_outcomes(self):
         """Insight 4: What are the outcomes of all play sessions?"""
-        fact_play = self._load_data("fact_play_session", is_fact=True)
-        dim_status = self._load_data("dim_status")
-
-        if fact_play.empty or dim_status.empty:
+        sessions = self._aggregates["sessions_by_status"]
+        if sessions.empty:
             return
 
-        merged = pd.merge(fact_play, dim_status, on="status_key")
-        result = merged.groupby("english_description")["play_session_id"].count().reset_index()
-        result = result.rename(columns={"english_description": "Session Outcome", "play_session_id": "Total Sessions"})
+        result = self._with_labels(sessions, "dim_status", "status_key", ["english_description"])
+        if result.empty:
+            return
+        result = result.groupby("english_description")["sessions"].sum().reset_index()
+        result = result.rename(columns={"english_description": "Session Outcome", "sessions": "Total Sessions"})
         result = result.sort_values(by="Total Sessions", ascending=False)
         
         self.report_content.append("## Insight 4: Play Session Outcomes\n")
@@ -116,16 +286,16 @@ class InsightGenerator:
 
     def _get_insight_5_payment_methods(self):
         """Insight 5: What are the most popular payment methods?"""
-        fact_sub = self._load_data("fact_subscription", is_fact=True)
-        dim_payment = self._load_data("dim_payment_method")
-        
-        if fact_sub.empty or dim_payment.empty:
+        pairs = self._aggregates["payment_detail_users"]
+        if pairs.empty:
             return
             
-        merged = pd.merge(fact_sub, dim_payment, on="payment_detail_key")
-        
-        # We'll count distinct users per payment *type* (e.g., CREDIT_CARD vs MOBILE_PHONE_PLATFORM)
-        result = merged.groupby("payment_method_code")["user_key"].nunique().reset_index()
+        # Distinct (payment detail, user) pairs are labelled with their payment
+        # type, then we count distinct users per type (e.g., CREDIT_CARD vs MOBILE_PHONE_PLATFORM)
+        merged = self._with_labels(pairs, "dim_payment_method", "payment_detail_key", ["payment_method_code"])
+        if merged.empty:
+            return
+        result = merged.groupby("payment_method_code", observed=True)["user_key"].nunique().reset_index()
         result = result.rename(columns={"payment_method_code": "Payment Type", "user_key": "Unique Users"})
         result = result.sort_values(by="Unique Users", ascending=False)
 
@@ -136,21 +306,18 @@ class InsightGenerator:
 
     def _get_insight_6_top_users(self):
         """Insight 6: Who are the most engaged users (Top 10 by Score)?"""
-        fact_play = self._load_data("fact_play_session", is_fact=True)
-        dim_user = self._load_data("dim_user")
-
-        if fact_play.empty or dim_user.empty:
+        top_users = self._aggregates["top_users_by_score"]
+        if top_users.empty:
             return
 
-        # Sum total score per user
-        user_scores = fact_play.groupby("user_key")["total_score"].sum().reset_index()
-        
-        # Join with user info to get names
-        merged = pd.merge(user_scores, dim_user, on="user_key")
+        # Fetch names for just the ten winners
+        merged = self._with_attributes(top_users, "dim_user", "user_key", ["username", "first_name", "last_name"])
+        if merged.empty:
+            return
         
         # Select and rename
         result = merged[["username", "first_name", "last_name", "total_score"]]
-        result = result.sort_values(by="total_score", ascending=False).head(10)
+        result = result.sort_values(by="total_score", ascending=False)
 
         self.report_content.append("## Insight 6: Top 10 Users by Total Score\n")
         self.report_content.append("Identifying top players is key for marketing, rewards, and community building.\n")
@@ -159,21 +326,20 @@ class InsightGenerator:
 
     def _get_insight_7_monthly_revenue(self):
         """Insight 7: What is the monthly revenue trend for 2024?"""
-        fact_sub = self._load_data("fact_subscription", is_fact=True)
-        dim_date = self._load_data("dim_date")
+        revenue = self._aggregates["revenue_by_month"]
+        dim_date = self._load_data("dim_date", columns=["date_key", "year", "month", "month_name"])
 
-        if fact_sub.empty or dim_date.empty:
+        if revenue.empty or dim_date.empty:
             return
 
-        # Join with DimDate on the subscription's start date
-        merged = pd.merge(fact_sub, dim_date, left_on="start_date_key", right_on="date_key")
+        # One label row per calendar month of DimDate
+        months = dim_date.drop_duplicates(["year", "month"])[["year", "month", "month_name"]]
+        months = months.assign(period_month_key=months["year"] * 100 + months["month"])
+        merged = pd.merge(revenue, months, on="period_month_key")
         
-        # Group by month and sum the revenue
         # We only care about 2024 data as per the prompt
-        revenue_2024 = merged[merged["year"] == 2024]
-        result = revenue_2024.groupby(["year", "month", "month_name"])["cost_amount"].sum().reset_index()
-        result = result.sort_values(by="month")
-        result = result[["month_name", "cost_amount"]].rename(columns={"cost_amount": "Total Revenue"})
+        result = merged[merged["year"] == 2024].sort_values(by="month")
+        result = result[["month_name", "revenue"]].rename(columns={"revenue": "Total Revenue"})
 
         self.report_content.append("## Insight 7: Monthly Revenue Trend (2024)\n")
         self.report_content.append("Understanding monthly revenue is critical for forecasting and identifying seasonal trends.\n")
@@ -182,15 +348,15 @@ class InsightGenerator:
 
     def _get_insight_8_avg_duration(self):
         """Insight 8: What is the average play session duration by channel?"""
-        fact_play = self._load_data("fact_play_session", is_fact=True)
-        dim_channel = self._load_data("dim_channel")
-
-        if fact_play.empty or dim_channel.empty:
+        sessions = self._aggregates["sessions_by_channel"]
+        if sessions.empty:
             return
 
-        merged = pd.merge(fact_play, dim_channel, on="channel_key")
-        result = merged.groupby("english_description")["duration_minutes"].mean().reset_index()
-        result = result.rename(columns={"english_description": "Channel", "duration_minutes": "Avg. Duration (Minutes)"})
+        result = self._with_labels(sessions, "dim_channel", "channel_key", ["english_description"])
+        if result.empty:
+            return
+        result = result.sort_values(by="english_description")[["english_description", "avg_duration"]]
+        result = result.rename(columns={"english_description": "Channel", "avg_duration": "Avg. Duration (Minutes)"})
         
         # Format the duration to 2 decimal places
         result["Avg. Duration (Minutes)"] = result["Avg. Duration (Minutes)"].round(2)
@@ -202,7 +368,7 @@ class InsightGenerator:
 
     def _save_report(self):
         """Saves the generated insights to analysis_report.md."""
-        report_path = BASE_DIR / "analysis_report.md"
+        report_path = self.report_path
         final_report = "\n".join(self.report_content)
         
         with open(report_path, "w") as f:
@@ -0,0 +1,204 @@
+# src/instrumentation.py
+import cProfile
+import json
+import platform
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from src.config import RUN_MANIFEST_DIR, PROFILE_STAGES
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Recorder of the run in progress (see RunRecorder.activate); stages are no-ops without one
+_active_recorder = None
+
+
+def _peak_rss_mb():
+    """Peak resident set size of the process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class StageRecord:
+    """Measurements of one stage of a run."""
+    def __init__(self, name: str, rows_in: int = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.thread = threading.current_thread().name
+        self.started_at = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        # Growth of the process' peak RSS while the stage ran (0 if it stayed below an earlier peak)
+        self.peak_rss_delta_mb = None
+        self.peak_rss_mb = None
+        self.status = "running"
+        self.profile_path = None
+
+    def add_rows(self, rows_in: int = 0, rows_out: int = 0):
+        if rows_in:
+            self.rows_in = (self.rows_in or 0) + int(rows_in)
+        if rows_out:
+            self.rows_out = (self.rows_out or 0) + int(rows_out)
+
+    def to_dict(self) -> dict:
+        return {key: value for key, value in vars(self).items()}
+
+
+class RunRecorder:
+    """
+    Records wall time, CPU time, peak-RSS growth and row counts for every
+    stage of a pipeline run, and writes them to a JSON run manifest.
+
+    Stages are opened with the module-level stage() context manager from
+    anywhere in the pipeline while the recorder is active. Stage names are dotted paths ("transform.dim_user",
+    "save.fact_play_session"), so stages recorded on loader threads still
+    sort under their parent. CPU time is process-wide, so stages that run
+    concurrently on threads overlap in it.
+
+    Stages listed in PROFILE_STAGES are also run under cProfile, and the
+    stats are dumped next to the manifest (open with pstats or snakeviz).
+    """
+    def __init__(self, manifest_dir=RUN_MANIFEST_DIR, profile_stages=PROFILE_STAGES, run_info: dict = None):
+        self.manifest_dir = manifest_dir
+        self.profile_stages = set(profile_stages or [])
+        self.run_info = run_info or {}
+        self.run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.stages = []
+        self.status = "running"
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = None
+
+    @contextmanager
+    def activate(self):
+        """Makes this the recorder that stage() reports to, for the duration of a run."""
+        global _active_recorder
+        previous, _active_recorder = _active_recorder, self
+        self._started = datetime.now(timezone.utc)
+        try:
+            yield self
+            self.status = "ok"
+        except Exception:
+            self.status = "error"
+            raise
+        except BaseException:
+            self.status = "aborted"
+            raise
+        finally:
+            _active_recorder = previous
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_stage(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        record = StageRecord(name, rows_in)
+        with self._lock:
+            self.stages.append(record)
+        self._stack().append(record)
+
+        profiler = cProfile.Profile() if name in self.profile_stages else None
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError: # another profiler is already running
+                profiler = None
+
+        peak_before = _peak_rss_mb()
+        record.started_at = datetime.now(timezone.utc).isoformat()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+            record.status = "ok"
+        except Exception:
+            record.status = "error"
+            raise
+        except BaseException:
+            record.status = "aborted"
+            raise
+        finally:
+            record.wall_seconds = round(time.perf_counter() - wall_start, 6)
+            record.cpu_seconds = round(time.process_time() - cpu_start, 6)
+            record.peak_rss_mb = _peak_rss_mb()
+            if peak_before is not None:
+                record.peak_rss_delta_mb = round(record.peak_rss_mb - peak_before, 3)
+            self._stack().pop()
+            if profiler is not None:
+                profiler.disable()
+                self.manifest_dir.mkdir(parents=True, exist_ok=True)
+                path = self.manifest_dir / f"run_{self.run_id}.{name}.prof"
+                profiler.dump_stats(path)
+                record.profile_path = str(path)
+
+    def manifest(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "status": self.status,
+            "started_at": self._started.isoformat() if self._started else None,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "run_info": self.run_info,
+            "environment": {
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+            },
+            "stages": [record.to_dict() for record in self.stages],
+        }
+
+    def write_manifest(self):
+        """Writes the run manifest to RUN_MANIFEST_DIR/run_<run_id>.json and returns its path."""
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        path = self.manifest_dir / f"run_{self.run_id}.json"
+        with open(path, "w") as f:
+            json.dump(self.manifest(), f, indent=2, default=str)
+        print(f"Run manifest saved to: {path}")
+        return path
+
+    def print_summary(self, max_depth: int = 1):
+        """Prints the stages up to max_depth dotted levels (e.g. 1 = "load", "dq", ...)."""
+        print("\n--- Stage Timings ---")
+        for record in self.stages:
+            if record.name.count(".") >= max_depth:
+                continue
+            rss = "" if record.peak_rss_delta_mb is None else f", peak RSS +{record.peak_rss_delta_mb:.1f} MB"
+            rows = "" if record.rows_out is None else f", {record.rows_out} rows out"
+            print(f"  {record.name:<12} {record.wall_seconds:8.3f}s wall, {record.cpu_seconds:8.3f}s CPU{rss}{rows}")
+        print("---------------------\n")
+
+
+@contextmanager
+def stage(name: str, rows_in: int = None):
+    """Records a stage of the active run; does nothing when no RunRecorder is active."""
+    recorder = _active_recorder
+    if recorder is None:
+        yield None
+        return
+    with recorder.stage(name, rows_in) as record:
+        yield record
+
+
+def add_rows(rows_in: int = 0, rows_out: int = 0):
+    """Adds row counts to the innermost stage open on this thread, if any."""
+    recorder = _active_recorder
+    record = recorder.current_stage() if recorder is not None else None
+    if record is not None:
+        record.add_rows(rows_in, rows_out)
@@ -0,0 +1,88 @@
+# src/key_maps.py
+import numpy as np
+import pandas as pd
+from src.config import UNKNOWN_KEY
+
+# Integer natural keys whose value range is at most this many times the number
+# of keys are resolved through a dense array instead of a hash index.
+_DENSE_SPAN_FACTOR = 4
+
+
+class KeyMap:
+    """
+    Resolves a dimension's natural key values to its surrogate keys.
+
+    Built once per dimension and natural key. Integer keys with a compact range
+    (IDs) are resolved by indexing a dense NumPy array; anything else goes
+    through a pandas hash index. Either way a lookup is a vectorized take with
+    no join, and values without a dimension row resolve to UNKNOWN_KEY.
+    """
+    def __init__(self, natural_keys, surrogate_keys):
+        natural_keys = pd.Series(natural_keys).reset_index(drop=True)
+        self._surrogate_keys = np.asarray(surrogate_keys)
+
+        # Rows without a natural key (e.g. unregistered users) can never match
+        present = natural_keys.notna().to_numpy()
+        natural_keys = natural_keys[present]
+        self._row_ids = np.flatnonzero(present)
+
+        if natural_keys.duplicated().any():
+            raise ValueError("Natural keys must be unique to build a KeyMap.")
+
+        self._dense = None
+        self._index = pd.Index(natural_keys.to_numpy())
+        if pd.api.types.is_integer_dtype(natural_keys) and len(natural_keys) > 0:
+            self._min = int(natural_keys.min())
+            span = int(natural_keys.max()) - self._min + 1
+            if span <= _DENSE_SPAN_FACTOR * len(natural_keys):
+                self._dense = np.full(span, -1, dtype=np.int64)
+                self._dense[natural_keys.to_numpy() - self._min] = self._row_ids
+
+    @classmethod
+    def from_dimension(cls, dim_df: pd.DataFrame, natural_key: str, surrogate_key: str):
+        """Builds the map from a dimension table's natural and surrogate key columns."""
+        if dim_df.empty:
+            return cls([], np.array([], dtype=np.int64))
+        return cls(dim_df[natural_key], dim_df[surrogate_key].to_numpy())
+
+    def __len__(self):
+        return len(self._surrogate_keys)
+
+    def positions(self, values) -> np.ndarray:
+        """Dimension row positions for each value, -1 where there is no match."""
+        values = pd.Series(values)
+        if len(self._row_ids) == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Resolve each category once, then broadcast through the codes;
+            # the trailing -1 is what missing values (code -1) pick up
+            category_positions = np.append(self.positions(values.cat.categories), -1)
+            return category_positions[values.cat.codes.to_numpy()]
+
+        if self._dense is not None and pd.api.types.is_integer_dtype(values):
+            offsets = values.to_numpy().astype(np.int64) - self._min
+            in_range = (offsets >= 0) & (offsets < len(self._dense))
+            positions = np.full(len(offsets), -1, dtype=np.int64)
+            positions[in_range] = self._dense[offsets[in_range]]
+            return positions
+
+        positions = self._index.get_indexer(values.to_numpy())
+        return np.where(positions >= 0, self._row_ids[positions], -1)
+
+    def lookup(self, values):
+        """
+        Returns (surrogate_keys, unmatched_count) for the given natural key values.
+        Unmatched values get UNKNOWN_KEY, so the result is always an int32 array.
+        """
+        positions = self.positions(values)
+        matched = positions >= 0
+        keys = np.full(len(positions), UNKNOWN_KEY, dtype=np.int32)
+        keys[matched] = self._surrogate_keys[positions[matched]]
+        return keys, int((~matched).sum())
+
+    def take(self, values, column) -> np.ndarray:
+        """Fetches a numeric dimension column for each value (NaN where unmatched)."""
+        positions = self.positions(values)
+        column = np.asarray(column, dtype=np.float64)
+        return np.where(positions >= 0, column[np.maximum(positions, 0)], np.nan)
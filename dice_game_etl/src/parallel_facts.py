@@ -0,0 +1,104 @@
+# src/parallel_facts.py
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from src.aggregation import ROLLUPS
+from src.data_loader import csv_byte_ranges, read_csv_range
+from src.storage import write_partitioned
+from src.transformations import play_session_fact_rows
+
+FACT_NAME = "fact_play_session"
+
+# Per-process state of a worker, set once by _init_worker
+_worker_key_maps = None
+
+
+class FactShard:
+    """What a worker hands back for one byte range of the play-session file."""
+    def __init__(self, rows_in: int, rows_out: int, max_session_id, unmatched: dict, rollups: dict, fact_df,
+                 source_rows=None):
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.max_session_id = max_session_id
+        # {"fact_play_session.<surrogate key>": rows with no dimension row}
+        self.unmatched = unmatched
+        # {rollup name: rollup of this shard's fact rows}
+        self.rollups = rollups
+        # The shard's fact rows, or None when the worker wrote them itself
+        self.fact_df = fact_df
+        # The requested source columns of every parsed row (before the watermark filter), for DQ checks
+        self.source_rows = source_rows
+
+
+def _init_worker(key_maps: dict):
+    global _worker_key_maps
+    _worker_key_maps = key_maps
+
+
+def _resolve_key(unmatched: dict, surrogate_key: str, dim_name: str, natural_key: str, values):
+    keys, count = _worker_key_maps[dim_name][natural_key].lookup(values)
+    if count:
+        counter = f"{FACT_NAME}.{surrogate_key}"
+        unmatched[counter] = unmatched.get(counter, 0) + count
+    return keys
+
+
+def _build_shard(path, start: int, end: int, watermark, dataset_path, part_id: str,
+                 source_columns: list = None) -> FactShard:
+    """Runs in a worker: parses one byte range, builds its fact rows and rolls them up."""
+    raw = read_csv_range(path, start, end, "play_session")
+    rows_in = len(raw)
+    source_rows = raw[source_columns] if source_columns else None
+    if watermark is not None:
+        raw = raw[raw["play_session_id"] > watermark]
+    unmatched = {}
+    fact_df = play_session_fact_rows(raw, partial(_resolve_key, unmatched))
+    rollups = {
+        rollup.name: rollup.aggregate(fact_df)
+        for rollup in ROLLUPS if rollup.table == FACT_NAME and not fact_df.empty
+    }
+    max_session_id = fact_df["play_session_id"].max() if not fact_df.empty else None
+    if dataset_path is not None and not fact_df.empty:
+        write_partitioned(fact_df, dataset_path, FACT_NAME, part_id=part_id)
+        shard_df = None
+    else:
+        shard_df = fact_df
+    return FactShard(rows_in, len(fact_df), max_session_id, unmatched, rollups, shard_df, source_rows)
+
+
+def build_play_session_shards(path, key_maps: dict, watermark, dataset_path, processes: int, shard_bytes: int,
+                              run_id: str = None, source_columns: list = None):
+    """
+    Builds fact_play_session from user_play_session.csv on a process pool.
+
+    The file is split into byte ranges of about shard_bytes (at least one
+    per process), so each worker parses, type-converts and transforms its
+    own rows and the parent never parses the file. The dimension key maps
+    are sent to each worker once, when it starts. With a dataset_path
+    (partitioned Parquet output) workers write their fact rows as their own
+    part files, named part-{run_id}-*; otherwise the rows come back in the
+    shards. With source_columns, each shard also brings back those columns
+    of its parsed rows, so the source can be checked without parsing it
+    again.
+
+    Workers are spawned rather than forked, since the build runs alongside
+    other threads and a forked child could inherit their held locks.
+
+    Yields:
+        FactShard: One per byte range, in file order.
+    """
+    ranges = csv_byte_ranges(path, shard_bytes, min_ranges=processes)
+    run_id = run_id or uuid.uuid4().hex[:12]
+    with ProcessPoolExecutor(max_workers=min(processes, max(len(ranges), 1)), mp_context=get_context("spawn"),
+                             initializer=_init_worker, initargs=(key_maps,)) as pool:
+        futures = [
+            pool.submit(_build_shard, path, start, end, watermark, dataset_path, f"{run_id}-{i}", source_columns)
+            for i, (start, end) in enumerate(ranges)
+        ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
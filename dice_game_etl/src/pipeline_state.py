@@ -0,0 +1,75 @@
+# src/pipeline_state.py
+import json
+import numpy as np
+import pandas as pd
+from src.config import STATE_DIR, UNKNOWN_KEY
+from src.key_maps import KeyMap
+
+
+class PipelineState:
+    """
+    Persists what earlier runs have processed, so later runs can be incremental.
+
+    Two things are kept under STATE_DIR:
+      * a surrogate-key registry per dimension (natural key -> surrogate key),
+        so a natural key keeps the same surrogate key in every run;
+      * a high-water mark per source (e.g. the largest play_session_id loaded
+        into the facts), so the next run only processes rows beyond it.
+
+    Changes are held in memory until save() is called, which the pipeline
+    does only after all outputs have been written.
+    """
+    def __init__(self, state_dir=STATE_DIR):
+        self.state_dir = state_dir
+        self.watermarks = {}
+        self.key_registries = {}
+
+        watermark_path = self.state_dir / "watermarks.json"
+        if watermark_path.exists():
+            with open(watermark_path) as f:
+                self.watermarks = json.load(f)
+
+        registry_dir = self.state_dir / "key_registry"
+        if registry_dir.exists():
+            for path in registry_dir.glob("*.parquet"):
+                self.key_registries[path.stem] = pd.read_parquet(path)
+        print(f"PipelineState loaded ({len(self.key_registries)} key registries, "
+              f"watermarks: {self.watermarks or 'none'}).")
+
+    def get_watermark(self, source_name: str):
+        return self.watermarks.get(source_name)
+
+    def set_watermark(self, source_name: str, value):
+        # JSON cannot hold NumPy scalars
+        self.watermarks[source_name] = value.item() if isinstance(value, np.generic) else value
+
+    def assign_keys(self, dim_name: str, natural_keys: pd.Series) -> np.ndarray:
+        """
+        Returns the registered surrogate key for each natural key, registering
+        unseen natural keys with the next free keys (in order of appearance).
+        """
+        registry = self.key_registries.get(
+            dim_name, pd.DataFrame({"natural_key": [], "surrogate_key": np.array([], dtype=np.int32)})
+        )
+        natural_keys = pd.Series(natural_keys.to_numpy())
+        keys, unmatched = KeyMap(registry["natural_key"], registry["surrogate_key"]).lookup(natural_keys)
+
+        if unmatched:
+            is_new = keys == UNKNOWN_KEY
+            next_key = int(registry["surrogate_key"].max()) + 1 if len(registry) else 1
+            keys[is_new] = np.arange(next_key, next_key + is_new.sum(), dtype=np.int32)
+            additions = pd.DataFrame({"natural_key": natural_keys[is_new].to_numpy(), "surrogate_key": keys[is_new]})
+            registry = additions if registry.empty else pd.concat([registry, additions], ignore_index=True)
+            self.key_registries[dim_name] = registry
+        return keys
+
+    def save(self):
+        """Writes the watermarks and key registries to STATE_DIR."""
+        registry_dir = self.state_dir / "key_registry"
+        registry_dir.mkdir(parents=True, exist_ok=True)
+        for dim_name, registry in self.key_registries.items():
+            registry.to_parquet(registry_dir / f"{dim_name}.parquet", index=False)
+
+        with open(self.state_dir / "watermarks.json", "w") as f:
+            json.dump(self.watermarks, f, indent=2)
+        print(f"  Saved pipeline state to {self.state_dir}")
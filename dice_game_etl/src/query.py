@@ -0,0 +1,202 @@
+# src/query.py
+import pandas as pd
+import pyarrow.dataset as ds
+from src.aggregation import MEASURE_FUNCTIONS
+from src.config import DIM_DIR, FACT_DIR, FACT_PARTITION_DATE_KEYS
+from src.storage import date_range_filter, read_table
+
+# Dimensions each fact references: {fact: {dimension: (fact column, dimension key)}}.
+# A dimension's <dim>_attributes side table is reached through the same key.
+FACT_REFERENCES = {
+    "fact_play_session": {
+        "dim_user": ("user_key", "user_key"),
+        "dim_channel": ("channel_key", "channel_key"),
+        "dim_status": ("status_key", "status_key"),
+        "dim_date": ("start_date_key", "date_key"),
+    },
+    "fact_subscription": {
+        "dim_user": ("user_key", "user_key"),
+        "dim_plan": ("plan_key", "plan_key"),
+        "dim_payment_method": ("payment_detail_key", "payment_detail_key"),
+        "dim_date": ("start_date_key", "date_key"),
+    },
+    "fact_subscription_period": {
+        "dim_user": ("user_key", "user_key"),
+        "dim_plan": ("plan_key", "plan_key"),
+        "dim_payment_method": ("payment_detail_key", "payment_detail_key"),
+        "dim_date": ("period_start_date_key", "date_key"),
+    },
+    "fact_user_engagement": {
+        "dim_user": ("user_key", "user_key"),
+        "dim_date": ("date_key", "date_key"),
+    },
+}
+
+# How a measure computed per surrogate key is combined once keys are replaced by labels
+_RECOMBINE_FUNCTIONS = {"count": "sum", "sum": "sum", "min": "min", "max": "max"}
+
+
+class Query:
+    """
+    An ad-hoc aggregate over one fact table, answered by QueryEngine.run.
+
+    Args:
+        fact (str): Fact table to aggregate (a key of FACT_REFERENCES).
+        measures (dict): {output_column: (fact_column, function)} with
+                         function one of MEASURE_FUNCTIONS.
+        group_by (list): Fact columns, or attributes of the dimensions the
+                         fact references written "<dimension>.<column>",
+                         e.g. "dim_channel.english_description" or
+                         "dim_user_attributes.username". Output columns are
+                         named as given.
+        date_range (tuple): Optional (start_date_key, end_date_key), inclusive,
+                            on the fact's date key in FACT_PARTITION_DATE_KEYS.
+        where (dict): Optional {fact column or "<dimension>.<column>": values}
+                      keeping rows whose value is one of values.
+        order_by (str): Optional output column to sort on.
+        ascending (bool): Sort order for order_by.
+        limit (int): Optional number of rows to keep (after sorting).
+    """
+    def __init__(self, fact: str, measures: dict, group_by: list = None, date_range: tuple = None,
+                 where: dict = None, order_by: str = None, ascending: bool = False, limit: int = None):
+        if fact not in FACT_REFERENCES:
+            raise ValueError(f"Unknown fact table '{fact}'.")
+        for column, function in measures.values():
+            if function not in MEASURE_FUNCTIONS:
+                raise ValueError(f"Unsupported measure function '{function}'.")
+        self.fact = fact
+        self.measures = measures
+        self.group_by = list(group_by or [])
+        self.date_range = date_range
+        self.where = where or {}
+        self.order_by = order_by
+        self.ascending = ascending
+        self.limit = limit
+        # Validates every dimension attribute up front
+        for spec in [*self.group_by, *self.where]:
+            self.fact_column(spec)
+
+    def reference(self, dim_name: str) -> tuple:
+        """(fact column, dimension key) linking the fact to a dimension or its attribute table."""
+        references = FACT_REFERENCES[self.fact]
+        base_name = dim_name.removesuffix("_attributes")
+        if base_name not in references:
+            raise ValueError(f"{self.fact} does not reference {dim_name}.")
+        return references[base_name]
+
+    def fact_column(self, spec: str) -> str:
+        """Fact column a group-by or filter spec is resolved on (the surrogate key for attributes)."""
+        if "." in spec:
+            return self.reference(spec.split(".", 1)[0])[0]
+        return spec
+
+
+class QueryEngine:
+    """
+    Answers Queries from the warehouse files in dim_dir and fact_dir.
+
+    The fact is read with only the columns the query uses, and the date
+    range and filters are pushed down to the reader as one dataset
+    expression, so partitions and row groups outside them are skipped.
+    Filters on dimension attributes are first turned into the surrogate keys
+    they select. The fact is then grouped on surrogate keys; dimension
+    labels are read afterwards, for the keys in that small result only, and
+    groups sharing a label are merged.
+    """
+    def __init__(self, dim_dir=DIM_DIR, fact_dir=FACT_DIR):
+        self.dim_dir = dim_dir
+        self.fact_dir = fact_dir
+
+    def run(self, query: Query) -> pd.DataFrame:
+        key_columns = list(dict.fromkeys(query.fact_column(spec) for spec in query.group_by))
+        # Distinct counts cannot be merged across keys, so their column is grouped on too
+        key_columns += [c for c, f in query.measures.values() if f == "nunique" and c not in key_columns]
+        columns = [*key_columns, *(c for c, _ in query.measures.values())]
+        columns += [query.fact_column(spec) for spec in query.where]
+        if query.date_range is not None:
+            columns.append(FACT_PARTITION_DATE_KEYS[query.fact])
+        fact_df = read_table(self.fact_dir, query.fact, columns=list(dict.fromkeys(columns)),
+                             filters=self._filters(query))
+
+        partial = self._aggregate_keys(fact_df, key_columns, query.measures)
+        partial = self._with_labels(partial, query)
+        result = self._combine(partial, query)
+        if query.order_by is not None:
+            result = result.sort_values(query.order_by, ascending=query.ascending, kind="stable")
+        if query.limit is not None:
+            result = result.head(query.limit)
+        return result.reset_index(drop=True)
+
+    def _filters(self, query: Query):
+        """The query's date range and filters as one dataset expression (None if it has neither)."""
+        conditions = []
+        if query.date_range is not None:
+            conditions.append(date_range_filter(query.fact, *query.date_range))
+        for spec, values in query.where.items():
+            values = list(values)
+            if "." in spec:
+                dim_name, attribute = spec.split(".", 1)
+                fact_column, dim_key = query.reference(dim_name)
+                dim_df = read_table(self.dim_dir, dim_name, columns=[dim_key, attribute])
+                values = dim_df.loc[dim_df[attribute].isin(values), dim_key].tolist()
+                spec = fact_column
+            conditions.append(ds.field(spec).isin(values))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def _aggregate_keys(self, fact_df: pd.DataFrame, key_columns: list, measures: dict) -> pd.DataFrame:
+        """Measures per combination of surrogate keys, in a form _combine can merge further."""
+        partial_measures = {}
+        for output, (column, function) in measures.items():
+            if function == "mean":
+                partial_measures[f"{output}.sum"] = (column, "sum")
+                partial_measures[f"{output}.count"] = (column, "count")
+            elif function != "nunique":
+                partial_measures[output] = (column, function)
+        if not key_columns:
+            return pd.DataFrame({
+                output: [fact_df[column].agg(function)] for output, (column, function) in partial_measures.items()
+            })
+        grouped = fact_df.groupby(key_columns, observed=True, dropna=False)
+        if not partial_measures:
+            return grouped.size().reset_index()[key_columns]
+        return grouped.agg(**partial_measures).reset_index()
+
+    def _with_labels(self, partial: pd.DataFrame, query: Query) -> pd.DataFrame:
+        """Joins the dimension attributes grouped on, reading only the rows of keys in the result."""
+        attributes = {}
+        for spec in query.group_by:
+            if "." in spec:
+                dim_name, attribute = spec.split(".", 1)
+                attributes.setdefault(dim_name, []).append(attribute)
+        for dim_name, names in attributes.items():
+            fact_column, dim_key = query.reference(dim_name)
+            keys = partial[fact_column].dropna().unique().tolist()
+            labels = read_table(self.dim_dir, dim_name, columns=[dim_key, *names],
+                                filters=ds.field(dim_key).isin(keys))
+            labels = labels.drop_duplicates(dim_key).rename(
+                columns={dim_key: fact_column, **{name: f"{dim_name}.{name}" for name in names}}
+            )
+            # Keys without a dimension row (UNKNOWN_KEY) keep a missing label
+            partial = partial.merge(labels, on=fact_column, how="left")
+        return partial
+
+    def _combine(self, partial: pd.DataFrame, query: Query) -> pd.DataFrame:
+        """Merges the per-key measures into one row per group_by value."""
+        group_by = query.group_by
+        if not group_by:
+            partial = partial.assign(_all=0)
+            group_by = ["_all"]
+        grouped = partial.groupby(group_by, observed=True, dropna=False, sort=True)
+        combined = {}
+        for output, (column, function) in query.measures.items():
+            if function == "mean":
+                combined[output] = grouped[f"{output}.sum"].sum() / grouped[f"{output}.count"].sum()
+            elif function == "nunique":
+                combined[output] = grouped[column].nunique()
+            else:
+                combined[output] = grouped[output].agg(_RECOMBINE_FUNCTIONS[function])
+        result = pd.DataFrame(combined).reset_index()
+        return result.drop(columns=["_all"]) if not query.group_by else result
@@ -0,0 +1,101 @@
+# src/scheduler.py
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src.instrumentation import stage
+
+
+class Task:
+    """
+    One step of a TaskGraph.
+
+    Args:
+        name (str): Unique task name, also used as its instrumentation stage.
+        fn: Callable run with no arguments.
+        inputs (list): Names of the data the task reads. Names that no task
+                       in the graph outputs (e.g. raw sources) count as
+                       already available.
+        outputs (list): Names of the data the task produces.
+    """
+    def __init__(self, name: str, fn, inputs: list = None, outputs: list = None):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs or [])
+        self.outputs = list(outputs or [])
+
+    def run(self):
+        with stage(self.name):
+            return self.fn()
+
+
+class TaskGraph:
+    """
+    Runs tasks in dependency order, with independent tasks running
+    concurrently on a thread pool.
+
+    A task becomes ready once every task producing one of its inputs has
+    finished. Ready tasks start in the order they were added. The builds
+    scheduled here spend most of their time in pandas/NumPy kernels and
+    Parquet writes, which release the GIL, so threads overlap one task's
+    writes with another's computation without copying frames between
+    processes.
+
+    If a task fails, no further tasks are started, the running ones are
+    allowed to finish, and the first error is raised.
+    """
+    def __init__(self, tasks: list = None):
+        self.tasks = {}
+        self._producers = {}
+        for task in tasks or []:
+            self.add(task)
+
+    def add(self, task: Task):
+        if task.name in self.tasks:
+            raise ValueError(f"Task {task.name} is already in the graph.")
+        for output in task.outputs:
+            if output in self._producers:
+                raise ValueError(f"{output} is produced by both {self._producers[output]} and {task.name}.")
+            self._producers[output] = task.name
+        self.tasks[task.name] = task
+
+    def _dependencies(self, task: Task) -> set:
+        return {self._producers[i] for i in task.inputs if i in self._producers}
+
+    def order(self) -> list:
+        """Task names in a valid sequential order (ties keep insertion order); raises on cycles."""
+        done, ordered = set(), []
+        remaining = list(self.tasks.values())
+        while remaining:
+            ready = [t for t in remaining if self._dependencies(t) <= done]
+            if not ready:
+                raise ValueError(f"Tasks {[t.name for t in remaining]} have circular dependencies.")
+            done.add(ready[0].name)
+            ordered.append(ready[0].name)
+            remaining.remove(ready[0])
+        return ordered
+
+    def run(self, max_workers: int = 1):
+        """Runs every task; with max_workers=1 they run one after another on this thread."""
+        order = self.order()
+        if max_workers <= 1:
+            for name in order:
+                self.tasks[name].run()
+            return
+
+        pending = [self.tasks[name] for name in order]
+        finished, running, errors = set(), {}, []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                if not errors:
+                    for task in [t for t in pending if self._dependencies(t) <= finished]:
+                        pending.remove(task)
+                        running[pool.submit(task.run)] = task
+                if not running:
+                    break
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    task = running.pop(future)
+                    if future.exception() is not None:
+                        errors.append(future.exception())
+                    else:
+                        finished.add(task.name)
+        if errors:
+            raise errors[0]
@@ -0,0 +1,126 @@
+# src/sketches.py
+import numpy as np
+import pandas as pd
+
+_LN2 = np.log(2)
+
+
+def hash_keys(keys) -> np.ndarray:
+    """
+    64-bit hashes of key values (a Series, or a DataFrame for composite keys).
+    Integer keys are widened first, so int32 and int64 columns holding the
+    same IDs hash alike.
+    """
+    if isinstance(keys, pd.Series) and pd.api.types.is_integer_dtype(keys) \
+            and not isinstance(keys.dtype, pd.CategoricalDtype):
+        keys = keys.astype("int64")
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+class BloomFilter:
+    """
+    Set membership in a fixed-size bit array. may_contain() never misses a
+    value that was added, but answers True for values that were not added with
+    probability ~false_positive_rate.
+    """
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01):
+        capacity = max(int(capacity), 1)
+        self.num_bits = int(np.ceil(-capacity * np.log(false_positive_rate) / _LN2 ** 2))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * _LN2)))
+        self._bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # Double hashing: the k bit positions are h1 + i * h2 for i in 0..k-1
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        i = np.arange(self.num_hashes, dtype=np.uint64)
+        return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.num_bits)
+
+    def add(self, hashes: np.ndarray):
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self._bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def may_contain(self, hashes: np.ndarray) -> np.ndarray:
+        positions = self._positions(hashes)
+        bits = (self._bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
+
+
+class HyperLogLog:
+    """
+    Distinct-count estimate in 2**precision one-byte registers, with a
+    relative standard error of about 1.04 / sqrt(2**precision).
+    """
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self._registers = np.zeros(self.num_registers, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(self.num_registers)
+
+    def add(self, hashes: np.ndarray):
+        remaining_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remaining_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << remaining_bits) - 1)
+        # Rank = position of the leftmost 1 bit in the remaining bits (exact in
+        # float64, since the remaining bits fit in its 53-bit mantissa)
+        with np.errstate(divide="ignore"):
+            bit_length = np.where(rest > 0, np.floor(np.log2(rest.astype(np.float64))) + 1, 0)
+        rank = (remaining_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self._registers, index, rank)
+
+    def estimate(self) -> float:
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self._registers.astype(np.float64)))
+        zero_registers = int((self._registers == 0).sum())
+        if raw <= 2.5 * m and zero_registers:
+            # Small-range correction (linear counting)
+            return m * np.log(m / zero_registers)
+        return float(raw)
+
+
+class ReservoirSample:
+    """
+    Uniform random sample of at most `size` rows from a stream of DataFrame
+    chunks (Algorithm R, vectorized per chunk).
+    """
+    def __init__(self, size: int, seed: int = None):
+        self.size = size
+        self.rows_seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._sample = None
+
+    def add(self, chunk: pd.DataFrame):
+        chunk = chunk.reset_index(drop=True)
+        if self._sample is None:
+            self._sample = chunk.iloc[:0]
+        fill = min(max(self.size - len(self._sample), 0), len(chunk))
+        if fill:
+            self._sample = pd.concat([self._sample, chunk.iloc[:fill]], ignore_index=True)
+        # Row t of the stream (0-based) replaces a random slot with probability size / (t + 1)
+        stream_positions = self.rows_seen + np.arange(fill, len(chunk))
+        slots = (self._rng.random(len(stream_positions)) * (stream_positions + 1)).astype(np.int64)
+        accepted = slots < self.size
+        if accepted.any():
+            # Later rows overwrite earlier ones for the same slot, as in the sequential
+            # algorithm. Slot order carries no meaning, so replaced rows are dropped and
+            # the replacements appended (keeping column dtypes intact).
+            replacements = pd.DataFrame({"slot": slots[accepted], "row": np.arange(fill, len(chunk))[accepted]})
+            replacements = replacements.drop_duplicates("slot", keep="last")
+            keep = np.ones(len(self._sample), dtype=bool)
+            keep[replacements["slot"].to_numpy()] = False
+            self._sample = pd.concat([self._sample[keep], chunk.iloc[replacements["row"].to_numpy()]],
+                                     ignore_index=True)
+        self.rows_seen += len(chunk)
+
+    @property
+    def sample(self) -> pd.DataFrame:
+        return self._sample if self._sample is not None else pd.DataFrame()
@@ -0,0 +1,222 @@
+# src/stage_cache.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import src.config as config
+from src.config import STAGE_CACHE_DIR, STAGE_CACHE_MAX_BYTES, STAGE_CACHE_MAX_ENTRIES
+
+# Settings that change what a stage outputs (or where and how it is written);
+# their values are part of every stage fingerprint
+FINGERPRINT_SETTINGS = [
+    "SOURCE_SCHEMAS", "DATETIME_FORMAT", "OUTPUT_FORMAT", "PARTITION_FACTS", "FACT_PARTITION_DATE_KEYS",
+    "PARQUET_COMPRESSION", "PARQUET_ROW_GROUP_SIZE", "FEATHER_COMPRESSION", "DATE_DIM_START", "DATE_DIM_END",
+    "UNKNOWN_KEY", "OPEN_ENDED_YEAR", "OPEN_ENDED_DATE_KEY", "UNKNOWN_DATE_KEY",
+    "ENGAGEMENT_WINDOW_DAYS", "ENGAGEMENT_CHURN_DAYS", "DIMENSION_ATTRIBUTES", "ATTRIBUTE_DICTIONARY_MAX_RATIO",
+    "AS_OF_DATE", "BILLING_PERIOD_MONTHS",
+]
+_SOURCE_DIR = Path(__file__).resolve().parent
+_HASH_BLOCK_BYTES = 1024 ** 2
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def code_version() -> str:
+    """Hash of the pipeline's source code (every module in src/)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(_SOURCE_DIR.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of a DataFrame's columns, dtypes and values (not its index)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(column, str(dtype)) for column, dtype in df.dtypes.items()]).encode())
+    if len(df.columns):
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _touch(path: Path):
+    """Sets a file's mtime to now at full precision (the LRU order of entries)."""
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def output_signature(path: Path):
+    """(size, mtime) of an output file, or of every file of a partitioned dataset; None if missing."""
+    if path.is_dir():
+        return sorted(
+            [file.relative_to(path).as_posix(), file.stat().st_size, file.stat().st_mtime_ns]
+            for file in path.rglob("*") if file.is_file()
+        )
+    if path.exists():
+        return [path.stat().st_size, path.stat().st_mtime_ns]
+    return None
+
+
+class CacheEntry:
+    """A cached stage result: tables, JSON-able extras, and the outputs it wrote."""
+    def __init__(self, path: Path, meta: dict):
+        self.path = path
+        self.extra = meta["extra"]
+        # {table name: [output path, signature when the entry was stored]}
+        self.outputs = meta["outputs"]
+        self._table_names = meta["tables"]
+        self._tables = None
+
+    @property
+    def tables(self) -> dict:
+        if self._tables is None:
+            self._tables = {
+                name: pq.read_table(self.path / f"{name}.parquet").to_pandas() for name in self._table_names
+            }
+        return self._tables
+
+    def stale_outputs(self) -> list:
+        """Outputs that were rewritten, moved or deleted since the entry was stored."""
+        return [
+            name for name, (path, signature) in self.outputs.items()
+            if output_signature(Path(path)) != signature
+        ]
+
+
+class StageCache:
+    """
+    Caches stage results under cache_dir, keyed on a fingerprint of the
+    stage's inputs.
+
+    A stage key hashes the stage name, the code version, the settings in
+    FINGERPRINT_SETTINGS and the fingerprints of the stage's inputs: content
+    hashes of raw source files, or fingerprints of upstream tables. A stage
+    whose key has an entry can reuse it instead of running again. Entries live in cache_dir/<stage>/<key>/ and are evicted
+    least recently used first once there are more than max_entries of them
+    or they take more than max_bytes.
+    """
+    def __init__(self, cache_dir=STAGE_CACHE_DIR, max_bytes: int = STAGE_CACHE_MAX_BYTES,
+                 max_entries: int = STAGE_CACHE_MAX_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.code_version = code_version()
+        self.settings = {name: getattr(config, name) for name in FINGERPRINT_SETTINGS}
+        self._lock = threading.Lock()
+        # {file path: [size, mtime_ns, content hash]}, so unchanged files are not rehashed
+        self._hash_index_path = self.cache_dir / "file_hashes.json"
+        self._hash_index = {}
+        if self._hash_index_path.exists():
+            with open(self._hash_index_path) as f:
+                self._hash_index = json.load(f)
+
+    def file_fingerprint(self, path: Path):
+        """
+        Content hash of a file (None if it does not exist). The file is only
+        read again when its size or mtime differs from when it was last hashed.
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        stat = path.stat()
+        with self._lock:
+            known = self._hash_index.get(str(path))
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while block := f.read(_HASH_BLOCK_BYTES):
+                digest.update(block)
+        fingerprint = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        with self._lock:
+            self._hash_index[str(path)] = fingerprint
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = self._hash_index_path.with_name(f"file_hashes.{uuid.uuid4().hex[:12]}.tmp")
+            with open(temp_path, "w") as f:
+                json.dump(self._hash_index, f)
+            os.replace(temp_path, self._hash_index_path)
+        return fingerprint[2]
+
+    def key(self, stage_name: str, inputs: dict):
+        """Stage key for the given input fingerprints; None if any input has no fingerprint."""
+        if any(fingerprint is None for fingerprint in inputs.values()):
+            return None
+        return _digest(json.dumps({
+            "stage": stage_name, "code": self.code_version, "settings": self.settings, "inputs": inputs,
+        }, sort_keys=True, default=str).encode())
+
+    def _entry_path(self, stage_name: str, key: str) -> Path:
+        return self.cache_dir / stage_name / key
+
+    def load(self, stage_name: str, key: str):
+        """The stage's cached entry for key, or None."""
+        path = self._entry_path(stage_name, key)
+        meta_path = path / "meta.json"
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            _touch(meta_path)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(path, meta)
+
+    def store(self, stage_name: str, key: str, tables: dict = None, extra: dict = None, outputs: dict = None):
+        """
+        Stores a stage result: tables (saved as Parquet), JSON-able extras and
+        {table name: output path} of outputs written by the stage, whose
+        current signatures are recorded. Replaces an existing entry.
+        """
+        tables = tables or {}
+        meta = {
+            "stage": stage_name,
+            "tables": list(tables),
+            "extra": extra or {},
+            "outputs": {name: [str(path), output_signature(Path(path))] for name, path in (outputs or {}).items()},
+        }
+        path = self._entry_path(stage_name, key)
+        temp_path = path.with_name(f"{key}.{uuid.uuid4().hex[:12]}.tmp")
+        old_path = path.with_name(f"{key}.{uuid.uuid4().hex[:12]}.old")
+        try:
+            temp_path.mkdir(parents=True)
+            for name, df in tables.items():
+                pq.write_table(pa.Table.from_pandas(df, preserve_index=False), temp_path / f"{name}.parquet")
+            with open(temp_path / "meta.json", "w") as f:
+                json.dump(meta, f)
+            _touch(temp_path / "meta.json")
+            if path.exists():
+                os.replace(path, old_path)
+            os.replace(temp_path, path)
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            shutil.rmtree(old_path, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until both limits hold."""
+        with self._lock:
+            entries = []
+            for meta_path in self.cache_dir.glob("*/*/meta.json"):
+                if "." in meta_path.parent.name:
+                    # An entry still being stored (<key>.<id>.tmp)
+                    continue
+                try:
+                    used = meta_path.stat().st_mtime_ns
+                    size = sum(file.stat().st_size for file in meta_path.parent.iterdir())
+                except OSError:
+                    continue
+                entries.append((used, size, meta_path.parent))
+            entries.sort(reverse=True)
+            total_bytes = 0
+            for count, (_, size, path) in enumerate(entries, start=1):
+                total_bytes += size
+                if count > self.max_entries or total_bytes > self.max_bytes:
+                    shutil.rmtree(path, ignore_errors=True)
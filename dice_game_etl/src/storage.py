@@ -0,0 +1,394 @@
+# src/storage.py
+import os
+import queue
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from src.config import (
+    OUTPUT_FORMAT,
+    PARTITION_FACTS,
+    FACT_PARTITION_DATE_KEYS,
+    PARQUET_COMPRESSION,
+    PARQUET_ROW_GROUP_SIZE,
+    FEATHER_COMPRESSION,
+    OUTPUT_WRITER_THREADS,
+    OUTPUT_QUEUE_SIZE
+)
+from src.instrumentation import stage
+
+# Hive-style partition columns derived from a fact's date key
+PARTITION_COLUMNS = ["year", "month"]
+_PARTITIONING = ds.partitioning(pa.schema([("year", pa.int16()), ("month", pa.int8())]), flavor="hive")
+
+
+def output_path(dir: Path, name: str) -> Path:
+    """Location of a table; a directory for partitioned facts, a single file otherwise."""
+    return dir / f"{name}.{OUTPUT_FORMAT}"
+
+
+def is_partitioned(name: str) -> bool:
+    return OUTPUT_FORMAT == "parquet" and PARTITION_FACTS and name in FACT_PARTITION_DATE_KEYS
+
+
+def _ipc_write_options() -> pa.ipc.IpcWriteOptions:
+    compression = None if FEATHER_COMPRESSION == "uncompressed" else FEATHER_COMPRESSION
+    return pa.ipc.IpcWriteOptions(compression=compression)
+
+
+def remove_output(path: Path):
+    """Deletes a previous output, whether it was written as a file or as a partitioned dataset."""
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def write_partitioned(df: pd.DataFrame, path: Path, name: str, part_id: str = None):
+    """
+    Adds the rows of df to the partitioned dataset at path.
+
+    Rows are sorted by the table's date key and split into year=/month=
+    directories, so both partition pruning and row-group min/max statistics
+    can skip data for date-scoped reads. Every call writes new files named
+    after part_id, which is what makes appending to a dataset cheap.
+    """
+    date_key = FACT_PARTITION_DATE_KEYS[name]
+    df = df.sort_values(date_key, kind="stable")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.append_column("year", pa.array((df[date_key] // 10000).to_numpy(), pa.int16()))
+    table = table.append_column("month", pa.array((df[date_key] // 100 % 100).to_numpy(), pa.int8()))
+
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=_PARTITIONING,
+        basename_template=f"part-{part_id or uuid.uuid4().hex[:12]}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=ds.ParquetFileFormat().make_write_options(
+            compression=PARQUET_COMPRESSION, write_statistics=True
+        ),
+        min_rows_per_group=PARQUET_ROW_GROUP_SIZE,
+        max_rows_per_group=PARQUET_ROW_GROUP_SIZE,
+    )
+
+
+def write_output(data, dir: Path, name: str, append: bool = False):
+    """
+    Writes a whole table (DataFrame or pyarrow Table) as `name` in dir.
+
+    The new output is written under a temporary name next to the old one
+    and renamed over it, so readers see either the previous table or the
+    complete new one, never a partly written file. Appends go through
+    ChunkedOutputWriter (new part files, or a rewritten copy swapped in).
+    """
+    df = data.to_pandas() if isinstance(data, pa.Table) else data
+    dir.mkdir(parents=True, exist_ok=True)
+    path = output_path(dir, name)
+    if append:
+        writer = ChunkedOutputWriter(dir, name, append=True)
+        try:
+            writer.write(df)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        return
+
+    temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:12]}.tmp")
+    try:
+        if is_partitioned(name):
+            write_partitioned(df, temp_path, name)
+        elif OUTPUT_FORMAT in ("parquet", "feather"):
+            table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+            if OUTPUT_FORMAT == "parquet":
+                pq.write_table(table, temp_path, compression=PARQUET_COMPRESSION)
+            else:
+                with pa.ipc.new_file(temp_path, table.schema, options=_ipc_write_options()) as writer:
+                    writer.write_table(table)
+        else:
+            df.to_csv(temp_path, index=False)
+        replace_output(temp_path, path)
+    finally:
+        remove_output(temp_path)
+
+
+def replace_output(temp_path: Path, path: Path):
+    """Moves a fully written output (file or partitioned dataset) from temp_path over path."""
+    if path.is_dir() or temp_path.is_dir():
+        # Directories cannot be renamed over: move the old one aside first
+        old_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:12]}.old")
+        if path.exists():
+            os.replace(path, old_path)
+        os.replace(temp_path, path)
+        remove_output(old_path)
+    else:
+        os.replace(temp_path, path)
+
+
+class OutputWriteError(RuntimeError):
+    """Raised by AsyncOutputWriter.wait() and barrier() when queued writes failed."""
+
+
+class AsyncOutputWriter:
+    """
+    Writes tables on background threads, so a build step hands its result
+    off and moves on to the next transform while the previous one is
+    encoded and written.
+
+    submit() puts the frame (not a copy: it must not be modified afterwards)
+    on a queue of at most max_pending writes and blocks while the queue is
+    full, which bounds the memory held by unwritten tables. Writer threads
+    start on the first submit and write each table with write_output.
+
+    Every write is tracked by a Future. wait(name) blocks until the writes
+    queued for one table are done, for build steps that read back a table
+    written earlier in the run, and raises an OutputWriteError if one of them
+    failed. Other errors do not stop the build: they are collected and
+    raised together at barrier(), which waits until every submitted write is
+    done and stops the threads. barrier() must only be called once no other
+    thread submits, i.e. after the build's task graph has finished. With
+    threads=0 tables are written inline by submit().
+    """
+    def __init__(self, threads: int = OUTPUT_WRITER_THREADS, max_pending: int = OUTPUT_QUEUE_SIZE):
+        self.threads = threads
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._workers = []
+        self._errors = []
+        # {table name: Futures of its writes not yet waited for}
+        self._writes = {}
+        self._lock = threading.Lock()
+
+    def submit(self, data, dir: Path, name: str, append: bool = False) -> Future:
+        future = Future()
+        job = (data, dir, name, append, future)
+        with self._lock:
+            self._writes.setdefault(name, []).append(future)
+        if self.threads <= 0:
+            self._write(job)
+            return future
+        with self._lock:
+            if not self._workers:
+                self._workers = [
+                    threading.Thread(target=self._run, name=f"output-writer-{i}", daemon=True)
+                    for i in range(self.threads)
+                ]
+                for worker in self._workers:
+                    worker.start()
+        self._queue.put(job)
+        return future
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(job)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, job):
+        data, dir, name, append, future = job
+        try:
+            with stage(f"save.{name}", rows_in=len(data)):
+                write_output(data, dir, name, append=append)
+            print(f"  Saved {name}.{OUTPUT_FORMAT} to {dir}")
+        except Exception as e:
+            with self._lock:
+                self._errors.append((name, e))
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+
+    def wait(self, name: str):
+        """Waits for the submitted writes of one table, then raises OutputWriteError if one of them failed."""
+        with self._lock:
+            futures = list(self._writes.get(name, []))
+        errors = [e for e in (future.exception() for future in futures) if e is not None]
+        with self._lock:
+            self._writes[name] = [future for future in self._writes.get(name, []) if future not in futures]
+            # Reported here, so not again by barrier()
+            self._errors = [(n, e) for n, e in self._errors if not any(e is error for error in errors)]
+        if errors:
+            raise OutputWriteError(f"Could not save {name} (" + "; ".join(str(e) for e in errors) + ")")
+
+    def barrier(self):
+        """Waits for all submitted writes, then raises OutputWriteError if any of them failed."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+            self._writes = {}
+        if errors:
+            raise OutputWriteError("Could not save " + "; ".join(f"{name} ({e})" for name, e in errors))
+
+
+def date_range_filter(name: str, start_key: int, end_key: int) -> ds.Expression:
+    """
+    Filter selecting rows of a fact whose partition date key is within
+    [start_key, end_key]. On partitioned datasets the month predicate lets
+    the reader skip whole year=/month= directories.
+    """
+    date_key = ds.field(FACT_PARTITION_DATE_KEYS[name])
+    expression = (date_key >= start_key) & (date_key <= end_key)
+    if is_partitioned(name):
+        month = ds.field("year").cast(pa.int32()) * 100 + ds.field("month").cast(pa.int32())
+        expression = expression & (month >= start_key // 100) & (month <= end_key // 100)
+    return expression
+
+
+def read_table(dir: Path, name: str, columns: list = None, filters: ds.Expression = None) -> pd.DataFrame:
+    """
+    Reads a processed table, loading only `columns` (all columns if None) and
+    only rows matching `filters` (a pyarrow dataset expression).
+
+    Feather tables are memory-mapped: only the pages of the columns read are
+    touched, and numeric columns without nulls of uncompressed files are
+    handed to pandas without a copy. Such columns are read-only views of the
+    file, so copy a frame before modifying it in place.
+    """
+    path = output_path(dir, name)
+    if OUTPUT_FORMAT == "feather":
+        table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        if filters is not None:
+            table = ds.dataset(table).to_table(columns=columns, filter=filters)
+        elif columns is not None:
+            table = table.select(columns)
+        return table.to_pandas(split_blocks=True)
+    if OUTPUT_FORMAT != "parquet":
+        df = pd.read_csv(path, usecols=columns)
+        if filters is not None:
+            df = pa.Table.from_pandas(df, preserve_index=False).filter(filters).to_pandas()
+        return df
+
+    if path.is_dir():
+        dataset = ds.dataset(path, format="parquet", partitioning=_PARTITIONING)
+        if columns is None:
+            columns = [c for c in dataset.schema.names if c not in PARTITION_COLUMNS]
+    else:
+        dataset = ds.dataset(path, format="parquet")
+    return dataset.to_table(columns=columns, filter=filters).to_pandas()
+
+
+class ChunkedOutputWriter:
+    """
+    Writes a table from a sequence of DataFrame chunks.
+
+    Partitioned facts get new part files per chunk. Otherwise the chunks go to
+    a single Parquet, Feather or CSV file whose schema is fixed by the first
+    chunk, so that every later chunk is written with identical column types.
+
+    A new table is written under a temporary name (write_path) and swapped
+    in on close, like write_output, so readers keep seeing the previous
+    table until it is complete. With append=True the chunks are added to an
+    existing table: partitioned datasets and CSV files are appended in place,
+    while a single Parquet or Feather file (which cannot be appended to) is
+    rewritten to a temporary file by copying its record batches, then
+    swapped in on close.
+
+    close() must only be called once every chunk was written; on failure
+    call abort() instead, which leaves the table as it was before.
+    """
+    def __init__(self, dir: Path, name: str, append: bool = False):
+        dir.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        self.file_path = output_path(dir, name)
+        self.append = append and self.file_path.exists()
+        self.partitioned = is_partitioned(name)
+        self.rows_written = 0
+        # Part files of partitioned datasets are named part-{run_id}-*
+        self.run_id = uuid.uuid4().hex[:12]
+        self._chunks_written = 0
+        self._file_writer = None
+        self._schema = None
+        self._temp_path = None
+        if not self.append:
+            self._temp_path = self.file_path.with_name(f"{self.file_path.name}.{self.run_id}.tmp")
+        # Size of a CSV file appended to, for abort()
+        self._appended_size = self.file_path.stat().st_size if self.append and self.file_path.is_file() else None
+
+    @property
+    def write_path(self) -> Path:
+        """Where chunks are written: the temporary output of a new table, or the table appended to."""
+        return self._temp_path or self.file_path
+
+    def _new_file_writer(self, path: Path):
+        if OUTPUT_FORMAT == "parquet":
+            return pq.ParquetWriter(path, self._schema, compression=PARQUET_COMPRESSION)
+        return pa.ipc.new_file(path, self._schema, options=_ipc_write_options())
+
+    def _open_file_writer(self, schema: pa.Schema):
+        if not self.append:
+            self._schema = schema
+            self._file_writer = self._new_file_writer(self._temp_path)
+            return
+        if OUTPUT_FORMAT == "parquet":
+            existing = pq.ParquetFile(self.file_path)
+            self._schema = existing.schema_arrow
+            batches = existing.iter_batches()
+        else:
+            existing = pa.ipc.open_file(pa.memory_map(str(self.file_path), "r"))
+            self._schema = existing.schema
+            batches = (existing.get_batch(i) for i in range(existing.num_record_batches))
+        self._temp_path = self.file_path.with_name(f"{self.file_path.name}.{self.run_id}.tmp")
+        self._file_writer = self._new_file_writer(self._temp_path)
+        for batch in batches:
+            self._file_writer.write_batch(batch)
+
+    def write(self, df: pd.DataFrame):
+        if self.partitioned:
+            write_partitioned(df, self.write_path, self.name, part_id=f"{self.run_id}-{self._chunks_written}")
+        elif OUTPUT_FORMAT in ("parquet", "feather"):
+            if self._file_writer is None:
+                self._open_file_writer(pa.Table.from_pandas(df, preserve_index=False).schema)
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if OUTPUT_FORMAT == "parquet":
+                self._file_writer.write_table(table, row_group_size=PARQUET_ROW_GROUP_SIZE)
+            else:
+                self._file_writer.write_table(table)
+        else:
+            first_write = self.rows_written == 0 and not self.append
+            df.to_csv(self.write_path, mode="w" if first_write else "a",
+                      header=first_write, index=False)
+        self._chunks_written += 1
+        self.rows_written += len(df)
+
+    def close(self):
+        if self._file_writer is not None:
+            self._file_writer.close()
+            self._file_writer = None
+        if self._temp_path is None:
+            return
+        if self._temp_path.exists():
+            replace_output(self._temp_path, self.file_path)
+        elif not self.append:
+            # Nothing was written: the new table is empty, so the previous one must not stay current
+            remove_output(self.file_path)
+
+    def abort(self):
+        """Discards what was written so far: the temporary output, or the rows appended in place."""
+        if self._file_writer is not None:
+            try:
+                self._file_writer.close()
+            except Exception:
+                pass
+            self._file_writer = None
+        if self._temp_path is not None:
+            remove_output(self._temp_path)
+        elif self.partitioned:
+            for part in self.file_path.rglob(f"part-{self.run_id}-*"):
+                part.unlink()
+        elif self._appended_size is not None:
+            with open(self.file_path, "r+b") as f:
+                f.truncate(self._appended_size)
@@ -1,54 +1,456 @@
 # src/transformations.py
+from functools import partial
+from pathlib import Path
+import numpy as np
 import pandas as pd
 from src.config import (
     DIM_DIR, 
     FACT_DIR, 
+    AGG_DIR,
     OUTPUT_FORMAT, 
     DATE_DIM_START, 
-    DATE_DIM_END
+    DATE_DIM_END,
+    UNKNOWN_KEY,
+    UNKNOWN_DATE_KEY,
+    OPEN_ENDED_DATE_KEY,
+    ENGAGEMENT_WINDOW_DAYS,
+    ENGAGEMENT_CHURN_DAYS,
+    DIMENSION_ATTRIBUTES,
+    ATTRIBUTE_DICTIONARY_MAX_RATIO,
+    AS_OF_DATE,
+    BILLING_PERIOD_MONTHS,
+    BUILD_MAX_WORKERS,
+    FACT_BUILD_PROCESSES,
+    FACT_SHARD_BYTES,
+    RAW_DATA_DIR,
+    SOURCE_FILES
 )
+from src.aggregation import ROLLUPS
+from src.date_keys import date_key_days, date_string_key, days_to_date_key, to_date_key
+from src.instrumentation import add_rows
+from src.key_maps import KeyMap
+from src.pipeline_state import PipelineState
+from src.scheduler import Task, TaskGraph
+from src.stage_cache import StageCache, frame_fingerprint
+from src.storage import (
+    AsyncOutputWriter, ChunkedOutputWriter, output_path, read_table
+)
+
+# Natural -> surrogate key columns of each dimension (keys are assigned on the first natural key)
+DIMENSION_KEYS = {
+    "dim_channel": [("play_session_channel_code", "channel_key")],
+    "dim_status": [("play_session_status_code", "status_key")],
+    "dim_plan": [("plan_id", "plan_key")],
+    "dim_payment_method": [("payment_detail_id", "payment_detail_key")],
+    "dim_user": [("user_id", "user_key"), ("user_registration_id", "user_key")],
+}
+
+# Fingerprinted inputs of each fact: raw sources, "<dim>.keys" for dimensions
+# it only resolves keys in, and whole dimensions it reads other columns of
+FACT_INPUTS = {
+    "fact_play_session": ["play_session", "dim_user.keys", "dim_channel.keys", "dim_status.keys"],
+    "fact_subscription": ["user_plan", "dim_user.keys", "dim_plan", "dim_payment_method.keys"],
+    "fact_user_engagement": ["agg_play_session_user_daily"],
+    "fact_subscription_period": ["fact_subscription", "dim_plan"],
+}
+
+# Rollup fact_user_engagement is derived from
+ENGAGEMENT_ROLLUP = "agg_play_session_user_daily"
+
+
+def play_session_fact_rows(df: pd.DataFrame, resolve_key) -> pd.DataFrame:
+    """
+    Maps a batch of raw play-session rows onto fact_play_session rows.
+
+    resolve_key(surrogate_key, dim_name, natural_key, values) returns the
+    surrogate keys for a column of natural keys (see StarSchemaBuilder._resolve_key).
+    """
+    # Date/Time transformations (no-ops when the loader already parsed them)
+    start_datetime = pd.to_datetime(df["start_datetime"])
+    end_datetime = pd.to_datetime(df["end_datetime"])
+
+    # Build the fact table column by column; surrogate keys come from the
+    # dimension key maps rather than merges that copy the whole frame
+    return pd.DataFrame({
+        "play_session_id": df["play_session_id"].to_numpy(),
+        "user_key": resolve_key("user_key", "dim_user", "user_id", df["user_id"]),
+        "channel_key": resolve_key("channel_key", "dim_channel", "play_session_channel_code", df["channel_code"]),
+        "status_key": resolve_key("status_key", "dim_status", "play_session_status_code", df["status_code"]),
+        # Date Keys for joining to DimDate
+        "start_date_key": to_date_key(start_datetime).to_numpy(),
+        "end_date_key": to_date_key(end_datetime).to_numpy(),
+        "total_score": df["total_score"].to_numpy(),
+        # New measure: duration
+        "duration_minutes": ((end_datetime - start_datetime).dt.total_seconds() / 60).to_numpy(),
+    })
+
+
+def _dictionary_encodes(values: pd.Series) -> bool:
+    """Whether a string column repeats enough values to be stored as a categorical."""
+    return pd.api.types.is_string_dtype(values) and \
+        values.nunique() <= ATTRIBUTE_DICTIONARY_MAX_RATIO * len(values)
+
+
+def _active_user_days(daily: pd.DataFrame) -> pd.DataFrame:
+    """Rows of the per-user daily rollup with a known user and a real date."""
+    dated = ~daily["start_date_key"].isin([UNKNOWN_DATE_KEY, OPEN_ENDED_DATE_KEY])
+    return daily[dated & (daily["user_key"] != UNKNOWN_KEY)]
+
+
+def churn_flags(date_keys, days_to_next_active: pd.Series, as_of_key: int) -> np.ndarray:
+    """
+    Whether a user went more than ENGAGEMENT_CHURN_DAYS without a session
+    after each active day: the next active day came later than that, or
+    there is none yet and as_of_key (the latest day with data) is.
+    """
+    days_to_next = days_to_next_active.to_numpy(dtype="float64", na_value=np.nan)
+    days_to_as_of = date_key_days([as_of_key])[0] - date_key_days(date_keys)
+    return np.where(np.isnan(days_to_next), days_to_as_of, days_to_next) > ENGAGEMENT_CHURN_DAYS
+
+
+def user_engagement_rows(daily: pd.DataFrame, as_of_key: int) -> pd.DataFrame:
+    """
+    Builds fact_user_engagement rows from agg_play_session_user_daily rows:
+    one row per user and active day, with the gaps to the user's previous
+    and next active days, the streak of consecutive active days, totals
+    over the trailing ENGAGEMENT_WINDOW_DAYS and the churn flag as of
+    as_of_key.
+
+    The rows are sorted once by (user_key, start_date_key); every column is
+    then a shift or a cumulative sum over that order, with no per-user groupby.
+    """
+    daily = _active_user_days(daily).sort_values(["user_key", "start_date_key"], ignore_index=True)
+    users = daily["user_key"].to_numpy()
+    days = date_key_days(daily["start_date_key"])
+    rows = np.arange(len(daily))
+    new_user = np.ones(len(daily), dtype=bool)
+    new_user[1:] = users[1:] != users[:-1]
+    last_of_user = np.ones(len(daily), dtype=bool)
+    last_of_user[:-1] = new_user[1:]
+
+    gap = np.diff(days, prepend=days[:1])
+    days_since_last = pd.array(gap, dtype="Int32")
+    days_since_last[new_user] = pd.NA
+    next_gap = np.zeros_like(gap)
+    next_gap[:-1] = gap[1:]
+    days_to_next = pd.array(next_gap, dtype="Int32")
+    days_to_next[last_of_user] = pd.NA
+    # Row where the user's history, and the current run of consecutive days, starts
+    user_start = np.maximum.accumulate(np.where(new_user, rows, 0))
+    streak_start = np.maximum.accumulate(np.where(new_user | (gap != 1), rows, 0))
+
+    # First row of the trailing window: (user, day) packed into one sorted
+    # integer, searched for day - (window - 1) within the same user
+    position = users.astype("int64") << 32 | days
+    window_start = np.searchsorted(position, position - (ENGAGEMENT_WINDOW_DAYS - 1))
+    def window_sum(values):
+        totals = np.concatenate([[0], np.cumsum(values)])
+        return totals[rows + 1] - totals[window_start]
+
+    session_count = daily["session_count"].to_numpy()
+    score_sum = daily["score_sum"].to_numpy()
+    return pd.DataFrame({
+        "user_key": users,
+        "date_key": daily["start_date_key"].to_numpy(),
+        "session_count": session_count,
+        "score_sum": score_sum,
+        "duration_sum": daily["duration_sum"].to_numpy(),
+        "active_day_number": (rows - user_start + 1).astype("int32"),
+        "days_since_last_active": days_since_last,
+        "days_to_next_active": days_to_next,
+        "streak_days": (rows - streak_start + 1).astype("int32"),
+        "window_active_days": (rows - window_start + 1).astype("int32"),
+        "window_session_count": window_sum(session_count),
+        "window_score_sum": window_sum(score_sum),
+        "is_churned": churn_flags(daily["start_date_key"], days_to_next, as_of_key),
+    })
+
+
+def _month_days(months: np.ndarray) -> np.ndarray:
+    """Day numbers of the first day of months counted from 1970-01."""
+    return months.astype("datetime64[M]").astype("datetime64[D]").astype("int64")
+
+
+def _days_in_month(months: np.ndarray) -> np.ndarray:
+    return _month_days(months + 1) - _month_days(months)
+
+
+def subscription_period_rows(fact_df: pd.DataFrame, period_months, as_of_key: int) -> pd.DataFrame:
+    """
+    Expands fact_subscription rows into fact_subscription_period rows, one
+    per billing period: every period_months months from the start date
+    (on the same day of the month, or the month's last day), or one period
+    where period_months is 0. Periods are billed if they start before the
+    subscription ends and on or before as_of_key, which is also where
+    open-ended subscriptions stop. Rows with a missing date are not billed.
+
+    Each subscription's period count is computed from month numbers first;
+    the rows are then repeated that many times and every period's dates
+    derived from its position, without a loop over subscriptions.
+    """
+    start_key = fact_df["start_date_key"].to_numpy().astype("int64")
+    end_key = fact_df["end_date_key"].to_numpy().astype("int64")
+    step = np.asarray(period_months, dtype="int64")
+    billable = (start_key != UNKNOWN_DATE_KEY) & (end_key != UNKNOWN_DATE_KEY)
+    start_key = np.where(billable, start_key, as_of_key)
+    bounded = billable & (end_key != OPEN_ENDED_DATE_KEY)
+
+    # Periods must start before the cap: the end date, or the day after the as-of date
+    cap = np.full(len(fact_df), date_key_days([as_of_key])[0] + 1)
+    cap = np.where(bounded, np.minimum(date_key_days(np.where(bounded, end_key, as_of_key)), cap), cap)
+    cap_month = cap.astype("datetime64[D]").astype("datetime64[M]").astype("int64")
+    cap_day = cap - _month_days(cap_month) + 1
+    start_month = (start_key // 10000 - 1970) * 12 + start_key // 100 % 100 - 1
+    start_day = start_key % 100
+    # Largest number of months after the start that still falls before the cap
+    months_before_cap = cap_month - start_month - (np.minimum(start_day, _days_in_month(cap_month)) >= cap_day)
+    count = np.where(step > 0, months_before_cap // np.maximum(step, 1) + 1, 1)
+    count = np.where(billable & (cap > date_key_days(start_key)), count, 0)
+
+    rows = np.repeat(np.arange(len(fact_df)), count)
+    number = np.arange(len(rows)) - np.repeat(np.cumsum(count) - count, count)
+    def period_start_key(numbers):
+        month = start_month[rows] + numbers * step[rows]
+        return days_to_date_key(_month_days(month) + np.minimum(start_day[rows], _days_in_month(month)) - 1)
+    # A period ends when the next one starts, or with the subscription
+    end_key = end_key[rows]
+    period_end_key = np.where(step[rows] > 0, np.minimum(period_start_key(number + 1), end_key), end_key)
+    return pd.DataFrame({
+        "user_key": fact_df["user_key"].to_numpy()[rows],
+        "plan_key": fact_df["plan_key"].to_numpy()[rows],
+        "payment_detail_key": fact_df["payment_detail_key"].to_numpy()[rows],
+        "period_number": (number + 1).astype("int32"),
+        "period_start_date_key": period_start_key(number),
+        "period_end_date_key": period_end_key.astype("int32"),
+        "billed_amount": fact_df["cost_amount"].to_numpy()[rows],
+    })
+
 
 class StarSchemaBuilder:
     """
     Transforms raw DataFrames into a star schema (Dimensions and Facts).
+
+    Each dimension, fact and the rollups are declared as a Task with the
+    tables it reads and writes (see _dimension_tasks/_fact_tasks), and run
+    by a TaskGraph on max_workers threads: the dimensions build side by
+    side, and each fact starts as soon as the dimensions it looks keys up
+    in exist.
+
+    With a StageCache, a build whose inputs (see DIMENSION_KEYS/FACT_INPUTS)
+    have the same fingerprint as in an earlier run reuses that run's result:
+    dimensions and rollups are restored from the cache (and only rewritten
+    if their output was changed since), and a fact is skipped entirely as
+    long as its output is still the one written then. Facts appended to by
+    incremental runs are always rebuilt.
     """
-    def __init__(self, raw_data: dict):
+    # Whether the two facts may build at the same time (see DuckDBStarSchemaBuilder)
+    concurrent_facts = True
+
+    def __init__(self, raw_data: dict, state: PipelineState = None, incremental: bool = False,
+                 max_workers: int = BUILD_MAX_WORKERS, fact_processes: int = FACT_BUILD_PROCESSES,
+                 raw_data_dir=RAW_DATA_DIR, cache: StageCache = None, check_play_sessions=None,
+                 check_columns: list = None):
+        """
+        Args:
+            raw_data (dict): Raw source DataFrames keyed by source name.
+            state (PipelineState): Optional persisted state. When given,
+                                   surrogate keys come from its key registry
+                                   and stay stable between runs.
+            incremental (bool): Only load play sessions beyond the state's
+                                watermark and append them to fact_play_session.
+                                Requires a state.
+            max_workers (int): Threads running independent builds (1 = sequential).
+            fact_processes (int): With more than 1, fact_play_session is built
+                                  by this many worker processes straight from
+                                  user_play_session.csv in raw_data_dir (see
+                                  src.parallel_facts), and not kept in self.facts.
+            cache (StageCache): Optional cache of earlier runs' build results.
+                                Fingerprints are taken of the source files in
+                                raw_data_dir, so raw_data must be their contents.
+            check_play_sessions: Optional function passing an iterator of raw
+                                 play-session frames through data quality
+                                 checks, e.g. a partial of
+                                 DataQualityValidator.checked_chunks. Used by
+                                 parallel builds, whose workers parse the file:
+                                 they send back its check_columns, so the file
+                                 is parsed only once. Streamed builds get
+                                 checked chunks from the caller instead.
+        """
+        if incremental and state is None:
+            raise ValueError("Incremental runs need a PipelineState.")
         self.raw_data = raw_data
+        self.state = state
+        self.incremental = incremental
+        self.max_workers = max_workers
+        self.fact_processes = fact_processes
+        self.raw_data_dir = raw_data_dir
+        self.cache = cache
+        self.check_play_sessions = check_play_sessions
+        self.check_columns = check_columns
+        # {table name: fingerprint} of the tables built or restored so far, when caching
+        self.fingerprints = {}
+        # Cache entries to store once the outputs they describe are written
+        self._cache_updates = []
+        # Dimensions, and the <dim>_attributes side tables split off them
         self.dimensions = {}
         self.facts = {}
+        # Rollup tables (see src.aggregation.ROLLUPS), always complete
+        self.aggregates = {}
+        # {rollup name: [rollups of each fact batch built in this run]}
+        self._rollup_partials = {}
+        # {rollup name: rollup of just this run's rows}, for rollups of appended facts
+        self._appended_rollups = {}
+        # {dim_name: {natural_key: KeyMap}}, filled as each dimension is built
+        self.key_maps = {}
+        # {"fact.surrogate_key": rows whose natural key had no dimension row}
+        self.unmatched_keys = {}
+        # Facts whose self.facts entry is only the rows appended in this run
+        self._appended_facts = set()
+        # Writes outputs in the background; create_dimensions/create_facts/build wait for it
+        self.outputs = AsyncOutputWriter()
         print("StarSchemaBuilder initialized.")
 
-    def _save_output(self, df: pd.DataFrame, dir: Path, name: str):
-        """Helper to save DataFrame to the specified format (Parquet or CSV)."""
-        dir.mkdir(parents=True, exist_ok=True)
-        file_path = dir / f"{name}.{OUTPUT_FORMAT}"
-        
-        try:
-            if OUTPUT_FORMAT == "parquet":
-                df.to_parquet(file_path, index=False)
-            else:
-                df.to_csv(file_path, index=False)
-            print(f"  Saved {name}.{OUTPUT_FORMAT} to {dir}")
-        except Exception as e:
-            print(f"  ERROR saving {name}: {e}")
+    def _save_output(self, df: pd.DataFrame, dir: Path, name: str, append: bool = False):
+        """
+        Hands a table to the background writer, to be saved in the specified
+        format (Parquet or CSV). Facts listed in FACT_PARTITION_DATE_KEYS are
+        written as year=/month= partitioned Parquet datasets. df must not be
+        modified afterwards; write errors are raised by self.outputs.wait(name)
+        or self.outputs.barrier().
+        """
+        self.outputs.submit(df, dir, name, append=append)
 
     def create_dimensions(self):
         """Orchestrator method to create all dimensions."""
         print("Creating dimensions...")
-        self._create_dim_date()
-        self._create_dim_channel()
-        self._create_dim_status()
-        self._create_dim_plan()
-        self._create_dim_payment_method()
-        self._create_dim_user()
+        TaskGraph(self._dimension_tasks()).run(self.max_workers)
+        self._finish_outputs()
         print("All dimensions created.")
         return self.dimensions
 
+    def build(self, play_session_chunks=None):
+        """
+        Creates all dimensions and facts in one task graph, so each fact can
+        start before unrelated dimensions are done. Takes the same arguments
+        as create_facts.
+        """
+        print("Creating dimensions and fact tables...")
+        graph = TaskGraph(self._dimension_tasks() + self._fact_tasks(play_session_chunks))
+        graph.run(self.max_workers if self.concurrent_facts else 1)
+        self._finish_outputs()
+        print("All dimensions and fact tables created.")
+        return self.facts
+
+    def _dimension_tasks(self) -> list:
+        """Dimension builds; inputs are the raw sources each one reads."""
+        return [
+            self._dimension_task(self._create_dim_date, []),
+            self._dimension_task(self._create_dim_channel, ["channel"]),
+            self._dimension_task(self._create_dim_status, ["status"]),
+            self._dimension_task(self._create_dim_plan, ["plan", "payment_frequency"]),
+            self._dimension_task(self._create_dim_payment_method, ["payment_detail"]),
+            self._dimension_task(self._create_dim_user, ["user", "registration"]),
+        ]
+
+    def _dimension_task(self, create_dim, inputs: list) -> Task:
+        dim_name = create_dim.__name__.removeprefix("_create_")
+        return Task(f"transform.{dim_name}", self._build_dimension(create_dim, inputs), inputs, [dim_name])
+
+    def _finish_outputs(self):
+        """Waits for the queued writes, then caches the results whose outputs they were."""
+        self.outputs.barrier()
+        updates, self._cache_updates = self._cache_updates, []
+        for stage_name, key, tables, extra, outputs in updates:
+            self.cache.store(stage_name, key, tables, extra, outputs)
+
+    def _fingerprint(self, name: str):
+        """Fingerprint of a raw source file, or of a table built earlier in this run."""
+        if name in SOURCE_FILES:
+            return self.cache.file_fingerprint(self.raw_data_dir / SOURCE_FILES[name])
+        return self.fingerprints.get(name)
+
+    def _stage_key(self, stage_name: str, inputs: list, **values):
+        """Cache key of a build from its inputs' fingerprints (None when not caching)."""
+        if self.cache is None:
+            return None
+        return self.cache.key(stage_name, {**{name: self._fingerprint(name) for name in inputs}, **values})
+
+    def _rewrite_stale_outputs(self, entry, dir: Path) -> list:
+        """Writes again the cached tables whose outputs changed since they were cached; returns their names."""
+        stale = entry.stale_outputs()
+        for name in stale:
+            self._save_output(entry.tables[name], dir, name)
+        return stale
+
+    def _build_dimension(self, create_dim, inputs: list):
+        dim_name = create_dim.__name__.removeprefix("_create_")
+        stage_name = f"transform.{dim_name}"
+        def build():
+            key = self._stage_key(stage_name, inputs)
+            entry = self.cache.load(stage_name, key) if key else None
+            if entry is not None and self._restore_dimension(dim_name, entry.tables):
+                if self._rewrite_stale_outputs(entry, DIM_DIR):
+                    self._cache_updates.append(self._dimension_cache_update(stage_name, key, dim_name))
+                print(f"  Reused cached {dim_name} (inputs unchanged)")
+            else:
+                create_dim()
+                if key:
+                    self._cache_updates.append(self._dimension_cache_update(stage_name, key, dim_name))
+            if self.cache is not None:
+                for table_name in self._dimension_tables(dim_name):
+                    self.fingerprints[table_name] = frame_fingerprint(self.dimensions[table_name])
+                dim_df = self.dimensions[dim_name]
+                key_columns = list(dict.fromkeys(c for pair in DIMENSION_KEYS.get(dim_name, []) for c in pair))
+                self.fingerprints[f"{dim_name}.keys"] = frame_fingerprint(dim_df[key_columns])
+            add_rows(rows_out=len(self.dimensions[dim_name]))
+        return build
+
+    def _dimension_tables(self, dim_name: str) -> list:
+        """A dimension and, if it has one, its attribute side table."""
+        return [name for name in (dim_name, f"{dim_name}_attributes") if name in self.dimensions]
+
+    def _dimension_cache_update(self, stage_name: str, key: str, dim_name: str) -> tuple:
+        names = self._dimension_tables(dim_name)
+        return (stage_name, key, {name: self.dimensions[name] for name in names}, {},
+                {name: output_path(DIM_DIR, name) for name in names})
+
+    def _restore_dimension(self, dim_name: str, tables: dict) -> bool:
+        """
+        Makes a cached dimension (and its attribute table) this run's, unless
+        its surrogate keys no longer agree with the key registry (e.g. the
+        registry was reset), in which case the dimension has to be rebuilt.
+        """
+        df = tables[dim_name]
+        if dim_name in DIMENSION_KEYS:
+            natural_key, surrogate_key = DIMENSION_KEYS[dim_name][0]
+            keys = self._surrogate_keys(dim_name, df, natural_key)
+            if not (pd.Series(keys).to_numpy() == df[surrogate_key].to_numpy()).all():
+                return False
+        self.dimensions.update(tables)
+        self._register_key_maps(dim_name)
+        return True
+
+    def _split_attributes(self, dim_name: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Moves a dimension's DIMENSION_ATTRIBUTES columns into its
+        <dim>_attributes side table, keyed on the surrogate key and saved next
+        to it, and returns the dimension without them. Repetitive attribute
+        columns are dictionary-encoded (see ATTRIBUTE_DICTIONARY_MAX_RATIO).
+        """
+        columns = [c for c in DIMENSION_ATTRIBUTES.get(dim_name, []) if c in df.columns]
+        surrogate_key = DIMENSION_KEYS[dim_name][0][1]
+        attributes = df[[surrogate_key, *columns]]
+        attributes = attributes.astype({c: "category" for c in columns if _dictionary_encodes(attributes[c])})
+        attributes_name = f"{dim_name}_attributes"
+        self.dimensions[attributes_name] = attributes
+        self._save_output(attributes, DIM_DIR, attributes_name)
+        return df.drop(columns=columns)
+
     def _create_dim_date(self):
         df = pd.DataFrame(
             {"date": pd.date_range(start=DATE_DIM_START, end=DATE_DIM_END)}
         )
-        df["date_key"] = df["date"].dt.strftime("%Y%m%d").astype(int)
+        df["date_key"] = to_date_key(df["date"])
         df["full_date"] = df["date"].dt.date
         df["year"] = df["date"].dt.year
         df["quarter"] = df["date"].dt.quarter
@@ -62,20 +464,24 @@ class StarSchemaBuilder:
 
     def _create_dim_channel(self):
         df = self.raw_data["channel"].copy()
-        df["channel_key"] = range(1, len(df) + 1)
+        df["channel_key"] = self._surrogate_keys("dim_channel", df, "play_session_channel_code")
         self.dimensions["dim_channel"] = df
+        self._register_key_maps("dim_channel")
         self._save_output(df, DIM_DIR, "dim_channel")
 
     def _create_dim_status(self):
         df = self.raw_data["status"].copy()
-        df["status_key"] = range(1, len(df) + 1)
+        df["status_key"] = self._surrogate_keys("dim_status", df, "play_session_status_code")
         self.dimensions["dim_status"] = df
+        self._register_key_maps("dim_status")
         self._save_output(df, DIM_DIR, "dim_status")
         
     def _create_dim_payment_method(self):
         df = self.raw_data["payment_detail"].copy()
-        df["payment_detail_key"] = range(1, len(df) + 1)
+        df["payment_detail_key"] = self._surrogate_keys("dim_payment_method", df, "payment_detail_id")
+        df = self._split_attributes("dim_payment_method", df)
         self.dimensions["dim_payment_method"] = df
+        self._register_key_maps("dim_payment_method")
         self._save_output(df, DIM_DIR, "dim_payment_method")
 
     def _create_dim_plan(self):
@@ -83,14 +489,18 @@ class StarSchemaBuilder:
         df_plan = self.raw_data["plan"].copy()
         df_freq = self.raw_data["payment_frequency"].copy()
         
-        df = pd.merge(
-            df_plan,
-            df_freq,
-            on="payment_frequency_code",
-            how="left"
-        )
-        df["plan_key"] = range(1, len(df) + 1)
+        if df_plan.empty or df_freq.empty:
+            df = df_plan
+        else:
+            df = pd.merge(
+                df_plan,
+                df_freq,
+                on="payment_frequency_code",
+                how="left"
+            )
+        df["plan_key"] = self._surrogate_keys("dim_plan", df, "plan_id")
         self.dimensions["dim_plan"] = df
+        self._register_key_maps("dim_plan")
         self._save_output(df, DIM_DIR, "dim_plan")
 
     def _create_dim_user(self):
@@ -105,82 +515,416 @@ class StarSchemaBuilder:
             how="left",
             suffixes=("_account", "_profile")
         )
-        df["user_key"] = range(1, len(df) + 1)
+        df["user_key"] = self._surrogate_keys("dim_user", df, "user_id")
+        df = self._split_attributes("dim_user", df)
         self.dimensions["dim_user"] = df
+        self._register_key_maps("dim_user")
         self._save_output(df, DIM_DIR, "dim_user")
 
-    def create_facts(self):
-        """Orchestrator method to create all fact tables."""
+    def in_memory_tables(self) -> dict:
+        """
+        Dimensions, facts and rollups whose complete contents are held in memory, for
+        consumers that can skip reading the warehouse back from disk. Streamed
+        facts and facts that only hold this run's appended rows are left out.
+        """
+        tables = dict(self.dimensions)
+        tables.update({
+            name: df for name, df in self.facts.items() if name not in self._appended_facts
+        })
+        tables.update(self.aggregates)
+        return tables
+
+    def _surrogate_keys(self, dim_name: str, df: pd.DataFrame, natural_key: str):
+        """Surrogate keys for a dimension: registry-backed when a state is present, else 1..n."""
+        if self.state is None or df.empty:
+            return range(1, len(df) + 1)
+        return self.state.assign_keys(dim_name, df[natural_key])
+
+    def _register_key_maps(self, dim_name: str):
+        """Indexes a dimension's natural keys once so facts can resolve surrogate keys without merges."""
+        for natural_key, surrogate_key in DIMENSION_KEYS.get(dim_name, []):
+            key_map = KeyMap.from_dimension(self.dimensions[dim_name], natural_key, surrogate_key)
+            self.key_maps.setdefault(dim_name, {})[natural_key] = key_map
+
+    def _resolve_key(self, fact_name: str, surrogate_key: str, dim_name: str,
+                     natural_key: str, values: pd.Series):
+        """Looks up surrogate keys for a fact column and tallies values with no dimension row."""
+        keys, unmatched = self.key_maps[dim_name][natural_key].lookup(values)
+        if unmatched:
+            counter = f"{fact_name}.{surrogate_key}"
+            self.unmatched_keys[counter] = self.unmatched_keys.get(counter, 0) + unmatched
+        return keys
+
+    def _report_unmatched_keys(self, fact_name: str):
+        for counter, count in self.unmatched_keys.items():
+            if counter.startswith(f"{fact_name}."):
+                print(f"  WARNING: {count} {fact_name} rows have no matching dimension row for "
+                      f"{counter.split('.')[1]} (set to {UNKNOWN_KEY})")
+
+    def create_facts(self, play_session_chunks=None):
+        """
+        Orchestrator method to create all fact tables.
+
+        Args:
+            play_session_chunks: Optional iterable of raw play-session chunks
+                                 (see DataLoader.iter_source_chunks). When given,
+                                 fact_play_session is built and written one chunk
+                                 at a time instead of from raw_data["play_session"].
+        """
         if not self.dimensions:
             print("ERROR: Dimensions must be created before facts.")
             return
 
         print("Creating fact tables...")
-        self._create_fact_play_session()
-        self._create_fact_subscription()
+        TaskGraph(self._fact_tasks(play_session_chunks)).run(self.max_workers if self.concurrent_facts else 1)
+        self._finish_outputs()
         print("All fact tables created.")
         return self.facts
 
-    def _create_fact_play_session(self):
-        df = self.raw_data["play_session"].copy()
-        
-        # Add surrogate keys from dimensions
-        df = pd.merge(df, self.dimensions["dim_user"][["user_id", "user_key"]], on="user_id", how="left")
-        df = pd.merge(df, self.dimensions["dim_channel"][["channel_code", "channel_key"]], on="channel_code", how="left")
-        df = pd.merge(df, self.dimensions["dim_status"][["play_session_status_code", "status_key"]], 
-                      left_on="status_code", right_on="play_session_status_code", how="left")
-        
-        # Date/Time transformations
-        df["start_datetime"] = pd.to_datetime(df["start_datetime"])
-        df["end_datetime"] = pd.to_datetime(df["end_datetime"])
-        
-        # Create Date Keys for joining to DimDate
-        df["start_date_key"] = df["start_datetime"].dt.strftime("%Y%m%d").astype(int)
-        df["end_date_key"] = df["end_datetime"].dt.strftime("%Y%m%d").astype(int)
-        
-        # Calculate new measure: duration
-        df["duration_minutes"] = (df["end_datetime"] - df["start_datetime"]).dt.total_seconds() / 60
-        
-        # Select and rename columns for the final fact table
-        fact_df = df[[
-            "play_session_id", "user_key", "channel_key", "status_key",
-            "start_date_key", "end_date_key", "total_score", "duration_minutes"
-        ]]
-        
-        self.facts["fact_play_session"] = fact_df
-        self._save_output(fact_df, FACT_DIR, "fact_play_session")
+    def _fact_tasks(self, play_session_chunks=None) -> list:
+        """Fact builds; inputs are the dimensions whose key maps each fact resolves keys with."""
+        return [
+            Task("transform.fact_play_session",
+                 lambda: self._build_fact("fact_play_session", self._create_fact_play_session, play_session_chunks),
+                 ["play_session", "dim_user", "dim_channel", "dim_status"], ["fact_play_session"]),
+            Task("transform.fact_subscription",
+                 lambda: self._build_fact("fact_subscription", self._create_fact_subscription),
+                 ["user_plan", "dim_user", "dim_plan", "dim_payment_method"], ["fact_subscription"]),
+            Task("transform.fact_subscription_period",
+                 lambda: self._build_fact("fact_subscription_period", self._create_fact_subscription_period),
+                 ["fact_subscription", "dim_plan"], ["fact_subscription_period"]),
+            Task("transform.rollups", self._build_rollups,
+                 ["fact_play_session", "fact_subscription", "fact_subscription_period"],
+                 [rollup.name for rollup in ROLLUPS]),
+            Task("transform.fact_user_engagement",
+                 lambda: self._build_fact("fact_user_engagement", self._create_fact_user_engagement),
+                 [ENGAGEMENT_ROLLUP], ["fact_user_engagement"]),
+        ]
+
+    def _build_fact(self, fact_name: str, create_fact, *args):
+        stage_name = f"transform.{fact_name}"
+        key = self._fact_stage_key(stage_name, fact_name)
+        entry = self.cache.load(stage_name, key) if key else None
+        if entry is not None and not entry.stale_outputs():
+            self._restore_fact(fact_name, entry)
+        else:
+            create_fact(*args)
+            if fact_name in self.facts:
+                add_rows(rows_out=len(self.facts[fact_name]))
+            if key:
+                self._cache_updates.append(self._fact_cache_update(stage_name, key, fact_name))
+        if key:
+            self.fingerprints[fact_name] = key
+
+    def _fact_stage_key(self, stage_name: str, fact_name: str):
+        if self.incremental and fact_name == "fact_play_session":
+            # Appended to, so its output is never the result of this run's inputs alone
+            return None
+        return self._stage_key(stage_name, FACT_INPUTS[fact_name])
+
+    def _fact_cache_update(self, stage_name: str, key: str, fact_name: str) -> tuple:
+        """
+        A fact's cache entry: its rollups (combined into one partial each),
+        unmatched-key counts and watermark. The fact itself is not copied;
+        its output in FACT_DIR is what a later run reuses.
+        """
+        rollups = {}
+        for rollup in ROLLUPS:
+            if rollup.table == fact_name and self._rollup_partials.get(rollup.name):
+                rollups[rollup.name] = rollup.combine(self._rollup_partials[rollup.name])
+                self._rollup_partials[rollup.name] = [rollups[rollup.name]]
+        extra = {
+            "unmatched": {counter: count for counter, count in self.unmatched_keys.items()
+                          if counter.startswith(f"{fact_name}.")},
+            "watermark": self.state.get_watermark("play_session")
+                         if self.state is not None and fact_name == "fact_play_session" else None,
+        }
+        return stage_name, key, rollups, extra, {fact_name: output_path(FACT_DIR, fact_name)}
+
+    def _restore_fact(self, fact_name: str, entry):
+        """Takes a fact's rollups, unmatched-key counts and watermark from the run that wrote its output."""
+        for rollup_name, df in entry.tables.items():
+            self._rollup_partials.setdefault(rollup_name, []).append(df)
+        for counter, count in entry.extra["unmatched"].items():
+            self.unmatched_keys[counter] = self.unmatched_keys.get(counter, 0) + count
+        self._report_unmatched_keys(fact_name)
+        self._advance_watermark(None, entry.extra["watermark"])
+        print(f"  Reused {fact_name}.{OUTPUT_FORMAT} in {FACT_DIR} (inputs unchanged)")
+
+    def _build_rollups(self):
+        stage_name = "transform.rollups"
+        key = self._stage_key(stage_name, ["fact_play_session", "fact_subscription", "fact_subscription_period"])
+        entry = self.cache.load(stage_name, key) if key else None
+        if entry is not None:
+            for rollup in ROLLUPS:
+                self._rollup_partials.pop(rollup.name, None)
+                self.aggregates[rollup.name] = entry.tables[rollup.name]
+            if self._rewrite_stale_outputs(entry, AGG_DIR):
+                self._cache_updates.append(self._rollups_cache_update(stage_name, key))
+            print("  Reused cached rollups (inputs unchanged)")
+        else:
+            self._create_rollups()
+            if key:
+                self._cache_updates.append(self._rollups_cache_update(stage_name, key))
+        if key:
+            self.fingerprints.update({rollup.name: key for rollup in ROLLUPS})
+
+    def _rollups_cache_update(self, stage_name: str, key: str) -> tuple:
+        return (stage_name, key, dict(self.aggregates), {},
+                {rollup.name: output_path(AGG_DIR, rollup.name) for rollup in ROLLUPS})
+
+    def _accumulate_rollups(self, fact_name: str, fact_df: pd.DataFrame):
+        """Rolls up a batch of fact rows; the partial rollups are combined in _create_rollups."""
+        if fact_df.empty:
+            return
+        for rollup in ROLLUPS:
+            if rollup.table == fact_name:
+                self._rollup_partials.setdefault(rollup.name, []).append(rollup.aggregate(fact_df))
+
+    def _create_rollups(self):
+        """
+        Builds the agg_* summary tables from this run's fact rows. For facts
+        that were appended to, the new rows' rollup is added onto the stored
+        rollup, so it keeps covering the whole fact without rereading it.
+        """
+        for rollup in ROLLUPS:
+            partials = self._rollup_partials.pop(rollup.name, [])
+            if rollup.table in self._appended_facts:
+                self._appended_rollups[rollup.name] = rollup.combine(partials)
+                if output_path(AGG_DIR, rollup.name).exists():
+                    partials.insert(0, read_table(AGG_DIR, rollup.name))
+                else:
+                    # No stored rollup yet (e.g. a warehouse built before rollups
+                    # existed): roll up the whole fact, which already holds the new rows
+                    # once its queued append is written
+                    self.outputs.wait(rollup.table)
+                    fact_df = read_table(FACT_DIR, rollup.table, columns=rollup.source_columns())
+                    partials = [rollup.aggregate(fact_df)]
+            df = rollup.combine(partials)
+            add_rows(rows_out=len(df))
+            self.aggregates[rollup.name] = df
+            self._save_output(df, AGG_DIR, rollup.name)
+
+    def _create_fact_user_engagement(self):
+        """
+        Derives fact_user_engagement from the per-user daily rollup (see
+        user_engagement_rows). When fact_play_session was appended to, only
+        users with new sessions get their rows rebuilt; the other users keep
+        their stored rows, of which only the churn flag can change.
+        """
+        fact_name = "fact_user_engagement"
+        daily = _active_user_days(self.aggregates[ENGAGEMENT_ROLLUP])
+        add_rows(rows_in=len(daily))
+        as_of_key = daily["start_date_key"].max() if not daily.empty else UNKNOWN_DATE_KEY
+        new_days = self._appended_rollups.get(ENGAGEMENT_ROLLUP)
+        if new_days is not None and output_path(FACT_DIR, fact_name).exists():
+            stored = read_table(FACT_DIR, fact_name)
+            active_users = new_days["user_key"].unique()
+            fact_df = pd.concat([
+                stored[~stored["user_key"].isin(active_users)],
+                user_engagement_rows(daily[daily["user_key"].isin(active_users)], as_of_key),
+            ], ignore_index=True)
+            fact_df["is_churned"] = churn_flags(fact_df["date_key"], fact_df["days_to_next_active"], as_of_key)
+            print(f"  Rebuilt {fact_name} rows of {len(active_users)} users with new sessions")
+        else:
+            fact_df = user_engagement_rows(daily, as_of_key)
+        self.facts[fact_name] = fact_df
+        self._save_output(fact_df, FACT_DIR, fact_name)
+
+    def _create_fact_play_session(self, chunks=None):
+        # Incremental runs only process sessions beyond the persisted watermark
+        # and append them to the existing fact table (self.facts then holds
+        # just the newly added rows).
+        watermark = self.state.get_watermark("play_session") if self.incremental else None
+        append = watermark is not None
+        max_session_id = None
+
+        if self.fact_processes > 1:
+            if chunks is not None:
+                raise ValueError("Parallel fact builds read user_play_session.csv themselves; pass no chunks.")
+            max_session_id = self._create_fact_play_session_parallel(watermark, append)
+        elif chunks is None:
+            new_sessions = self._after_watermark(self.raw_data["play_session"], watermark)
+            fact_df = self._transform_play_session(new_sessions)
+            self.facts["fact_play_session"] = fact_df
+            self._accumulate_rollups("fact_play_session", fact_df)
+            if append:
+                self._appended_facts.add("fact_play_session")
+            if append and fact_df.empty:
+                print("  No new play sessions since the last run.")
+            else:
+                self._save_output(fact_df, FACT_DIR, "fact_play_session", append=append)
+            if not fact_df.empty:
+                max_session_id = fact_df["play_session_id"].max()
+        else:
+            # Streaming mode: only one chunk (and its fact rows) is alive at a time,
+            # so the fact table is not kept in self.facts.
+            fact_chunks = (self._transform_play_session(self._after_watermark(chunk, watermark))
+                           for chunk in chunks)
+            max_session_id = self._write_fact_chunks("fact_play_session", fact_chunks, append,
+                                                     max_column="play_session_id")
+
+        self._report_unmatched_keys("fact_play_session")
+        self._advance_watermark(watermark, max_session_id)
+
+    def _create_fact_play_session_parallel(self, watermark, append: bool):
+        """
+        Builds fact_play_session on fact_processes worker processes, each
+        parsing and transforming its own byte range of the CSV. Partitioned
+        Parquet shards are written by the workers themselves; other formats
+        are written here in file order. Returns the largest play_session_id.
+        """
+        # Imported here: the worker module imports play_session_fact_rows from this one
+        from src.parallel_facts import build_play_session_shards
+
+        fact_name = "fact_play_session"
+        writer = ChunkedOutputWriter(FACT_DIR, fact_name, append=append)
+        if append:
+            self._appended_facts.add(fact_name)
+        shards = build_play_session_shards(
+            self.raw_data_dir / SOURCE_FILES["play_session"], self.key_maps, watermark,
+            writer.write_path if writer.partitioned else None, self.fact_processes, FACT_SHARD_BYTES,
+            writer.run_id, self.check_columns if self.check_play_sessions is not None else None,
+        )
+        checked_shards = self._checked_shards(shards)
+        max_session_id, rows_in, rows_out, empty_fact = None, 0, 0, None
+        try:
+            for shard in checked_shards:
+                rows_in += shard.rows_in
+                rows_out += shard.rows_out
+                for counter, count in shard.unmatched.items():
+                    self.unmatched_keys[counter] = self.unmatched_keys.get(counter, 0) + count
+                for rollup_name, partial_rollup in shard.rollups.items():
+                    self._rollup_partials.setdefault(rollup_name, []).append(partial_rollup)
+                if shard.max_session_id is not None:
+                    max_session_id = shard.max_session_id if max_session_id is None \
+                        else max(max_session_id, shard.max_session_id)
+                if shard.fact_df is None:
+                    continue
+                if shard.fact_df.empty:
+                    empty_fact = shard.fact_df
+                else:
+                    writer.write(shard.fact_df)
+            if rows_out == 0 and empty_fact is not None and not append:
+                # Still write an empty table with the fact's columns
+                writer.write(empty_fact)
+        except BaseException:
+            # Stops the workers first, so none writes a part file after abort() removed them
+            checked_shards.close()
+            shards.close()
+            writer.abort()
+            raise
+        writer.close()
+        add_rows(rows_in=rows_in, rows_out=rows_out)
+        print(f"  Saved {fact_name}.{OUTPUT_FORMAT} to {FACT_DIR} "
+              f"({rows_out} rows built by {self.fact_processes} processes)")
+        return max_session_id
+
+    def _checked_shards(self, shards):
+        """Yields each shard once its source rows passed self.check_play_sessions (all of them without one)."""
+        if self.check_play_sessions is None:
+            yield from shards
+            return
+        pending = []
+        def source_rows():
+            for shard in shards:
+                pending.append(shard)
+                yield shard.source_rows
+        for _ in self.check_play_sessions(source_rows()):
+            yield pending.pop()
+
+    def _advance_watermark(self, watermark, max_session_id):
+        """Records the largest play_session_id now loaded into fact_play_session."""
+        if self.state is not None and max_session_id is not None:
+            self.state.set_watermark("play_session", max_session_id if watermark is None
+                                     else max(watermark, max_session_id))
+
+    def _write_fact_chunks(self, fact_name: str, fact_chunks, append: bool = False, max_column: str = None):
+        """
+        Writes a fact from an iterable of fact-row chunks, rolling up each chunk
+        as it goes. Returns the largest value of max_column seen (or None).
+        """
+        writer = ChunkedOutputWriter(FACT_DIR, fact_name, append=append)
+        if append:
+            self._appended_facts.add(fact_name)
+        max_value = None
+        try:
+            for fact_chunk in fact_chunks:
+                writer.write(fact_chunk)
+                self._accumulate_rollups(fact_name, fact_chunk)
+                if max_column is not None and not fact_chunk.empty:
+                    chunk_max = fact_chunk[max_column].max()
+                    max_value = chunk_max if max_value is None else max(max_value, chunk_max)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        add_rows(rows_out=writer.rows_written)
+        print(f"  Saved {fact_name}.{OUTPUT_FORMAT} to {FACT_DIR} "
+              f"({writer.rows_written} rows {'appended' if append else 'streamed'})")
+        return max_value
+
+    def _after_watermark(self, df: pd.DataFrame, watermark):
+        """Play-session rows not yet loaded into the fact table (all rows when there is no watermark)."""
+        if watermark is None:
+            return df
+        return df[df["play_session_id"] > watermark]
+
+    def _transform_play_session(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Maps a batch of raw play-session rows onto fact_play_session rows."""
+        add_rows(rows_in=len(df))
+        return play_session_fact_rows(df, partial(self._resolve_key, "fact_play_session"))
 
     def _create_fact_subscription(self):
-        df = self.raw_data["user_plan"].copy()
-        
-        # Get user_key
-        df = pd.merge(df, self.dimensions["dim_user"][["user_registration_id", "user_key"]], 
-                      on="user_registration_id", how="left")
-        
-        # Get plan_key and cost_amount
-        df = pd.merge(df, self.dimensions["dim_plan"][["plan_id", "plan_key", "cost_amount"]], 
-                      on="plan_id", how="left")
-                      
-        # Get payment_detail_key
-        df = pd.merge(df, self.dimensions["dim_payment_method"][["payment_detail_id", "payment_detail_key"]],
-                      on="payment_detail_id", how="left")
+        df = self.raw_data["user_plan"]
+        fact = "fact_subscription"
+        add_rows(rows_in=len(df))
+        plan_map = self.key_maps["dim_plan"]["plan_id"]
 
         # Date/Time transformations
-        df["start_date"] = pd.to_datetime(df["start_date"], utc=True)
-        df["end_date"] = pd.to_datetime(df["end_date"], utc=True)
+        start_date_key = to_date_key(pd.to_datetime(df["start_date"], utc=True)).to_numpy()
+        end_date_key = to_date_key(pd.to_datetime(df["end_date"], utc=True)).to_numpy()
+        as_of_key = date_string_key(AS_OF_DATE)
 
-        # Create Date Keys
-        df["start_date_key"] = df["start_date"].dt.strftime("%Y%m%d").astype(int)
-        df["end_date_key"] = df["end_date"].dt.strftime("%Y%m%d").astype(int)
-        
-        # Create new measure: is_active
-        df["is_active"] = df["end_date"] > pd.Timestamp.now(tz='utc')
-        
-        # Select and rename
-        fact_df = df[[
-            "user_key", "plan_key", "payment_detail_key", "start_date_key",
-            "end_date_key", "cost_amount", "is_active"
-        ]]
+        fact_df = pd.DataFrame({
+            "user_key": self._resolve_key(fact, "user_key", "dim_user",
+                                          "user_registration_id", df["user_registration_id"]),
+            "plan_key": self._resolve_key(fact, "plan_key", "dim_plan", "plan_id", df["plan_id"]),
+            "payment_detail_key": self._resolve_key(fact, "payment_detail_key", "dim_payment_method",
+                                                    "payment_detail_id", df["payment_detail_id"]),
+            # Date Keys
+            "start_date_key": start_date_key,
+            "end_date_key": end_date_key,
+            "cost_amount": plan_map.take(df["plan_id"], self.dimensions["dim_plan"]["cost_amount"]),
+            # New measure: is_active, as of AS_OF_DATE (not the day the pipeline runs)
+            "is_active": (start_date_key <= as_of_key) & (end_date_key > as_of_key),
+        })
         
         self.facts["fact_subscription"] = fact_df
-        self._save_output(fact_df, FACT_DIR, "fact_subscription")
\ No newline at end of file
+        self._accumulate_rollups("fact_subscription", fact_df)
+        self._save_output(fact_df, FACT_DIR, "fact_subscription")
+        self._report_unmatched_keys("fact_subscription")
+
+    def _create_fact_subscription_period(self):
+        """Expands fact_subscription into billing periods (see subscription_period_rows)."""
+        fact_name = "fact_subscription_period"
+        subscriptions = self.facts.get("fact_subscription")
+        if subscriptions is None:
+            # Not in memory (reused from the cache, or streamed by the DuckDB builder)
+            self.outputs.wait("fact_subscription")
+            subscriptions = read_table(FACT_DIR, "fact_subscription", columns=[
+                "user_key", "plan_key", "payment_detail_key", "start_date_key", "end_date_key", "cost_amount",
+            ])
+        add_rows(rows_in=len(subscriptions))
+
+        dim_plan = self.dimensions["dim_plan"]
+        period_months = pd.Series(0, index=subscriptions.index)
+        if "payment_frequency_code" in dim_plan.columns:
+            plan_months = dim_plan["payment_frequency_code"].astype(object).map(BILLING_PERIOD_MONTHS)
+            plan_months = pd.Series(plan_months.fillna(0).to_numpy(), index=dim_plan["plan_key"])
+            period_months = subscriptions["plan_key"].map(plan_months).fillna(0)
+
+        fact_df = subscription_period_rows(subscriptions, period_months, date_string_key(AS_OF_DATE))
+        self.facts[fact_name] = fact_df
+        self._accumulate_rollups(fact_name, fact_df)
+        self._save_output(fact_df, FACT_DIR, fact_name)
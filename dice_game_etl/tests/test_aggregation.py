@@ -0,0 +1,99 @@
+# tests/test_aggregation.py
+import pandas as pd
+import pytest
+from src.aggregation import Aggregate, AggregationEngine, Rollup
+from src.config import UNKNOWN_KEY
+
+@pytest.fixture
+def fact_play():
+    return pd.DataFrame({
+        "play_session_id": [1, 2, 3, 4],
+        "user_key": [1, 2, 2, UNKNOWN_KEY],
+        "channel_key": [1, 1, 2, 2],
+        "start_date_key": [20240105, 20240210, 20240211, 20240301],
+        "total_score": [10, 20, 30, 100],
+    })
+
+def test_run_loads_each_table_once(fact_play):
+    loads = []
+    def load_table(name, columns):
+        loads.append((name, columns))
+        return fact_play[columns]
+
+    engine = AggregationEngine()
+    engine.register(Aggregate("by_channel", "fact_play_session", ["channel_key"],
+                              {"sessions": ("play_session_id", "count")}))
+    engine.register(Aggregate("score_by_channel", "fact_play_session", ["channel_key"],
+                              {"score": ("total_score", "sum"), "users": ("user_key", "nunique")}))
+    results = engine.run(load_table)
+
+    assert loads == [("fact_play_session", ["channel_key", "play_session_id", "total_score", "user_key"])]
+    assert results["by_channel"].to_dict("list") == {"channel_key": [1, 2], "sessions": [2, 2]}
+    assert results["score_by_channel"]["score"].tolist() == [30, 130]
+    assert results["score_by_channel"]["users"].tolist() == [2, 2]
+
+def test_top_k_skips_unknown_members(fact_play):
+    engine = AggregationEngine()
+    engine.register(Aggregate("top_users", "fact_play_session", ["user_key"],
+                              {"total_score": ("total_score", "sum")}, top_k=("total_score", 1)))
+    result = engine.run(lambda name, columns: fact_play[columns])["top_users"]
+    assert result.to_dict("list") == {"user_key": [2], "total_score": [50]}
+
+def test_derived_group_key(fact_play):
+    engine = AggregationEngine()
+    engine.register(Aggregate("by_month", "fact_play_session", ["month_key"],
+                              {"score": ("total_score", "sum")},
+                              derive={"month_key": ("start_date_key", lambda keys: keys // 100)}))
+    result = engine.run(lambda name, columns: fact_play[columns])["by_month"]
+    assert result.to_dict("list") == {"month_key": [202401, 202402, 202403], "score": [10, 50, 100]}
+
+def test_rejects_unknown_measure():
+    with pytest.raises(ValueError):
+        Aggregate("bad", "fact_play_session", ["user_key"], {"x": ("total_score", "median_ish")})
+
+@pytest.fixture
+def daily_rollup():
+    return Rollup("agg_daily", "fact_play_session", ["start_date_key", "channel_key", "user_key"],
+                  {"sessions": ("play_session_id", "count"), "score": ("total_score", "sum")})
+
+def test_rollup_combines_partials(fact_play, daily_rollup):
+    partials = [daily_rollup.aggregate(fact_play[:2]), daily_rollup.aggregate(fact_play[2:])]
+    combined = daily_rollup.combine(partials)
+    pd.testing.assert_frame_equal(combined, daily_rollup.aggregate(fact_play))
+
+def test_engine_answers_from_rollup(fact_play, daily_rollup):
+    aggregates = [
+        Aggregate("by_channel", "fact_play_session", ["channel_key"],
+                  {"sessions": ("play_session_id", "count"), "avg_score": ("total_score", "mean"),
+                   "users": ("user_key", "nunique")}),
+        Aggregate("by_month", "fact_play_session", ["month_key"], {"score": ("total_score", "sum")},
+                  derive={"month_key": ("start_date_key", lambda keys: keys // 100)}),
+        Aggregate("top_users", "fact_play_session", ["user_key"],
+                  {"total_score": ("total_score", "sum")}, top_k=("total_score", 1)),
+    ]
+    tables = {"fact_play_session": fact_play, "agg_daily": daily_rollup.aggregate(fact_play)}
+    from_fact, from_rollup = AggregationEngine(), AggregationEngine(rollups=[daily_rollup])
+    for aggregate in aggregates:
+        from_fact.register(aggregate)
+        from_rollup.register(aggregate)
+
+    expected = from_fact.run(lambda name, columns: tables[name][columns])
+    results = from_rollup.run(lambda name, columns: tables[name])
+
+    assert set(from_rollup.sources.values()) == {"agg_daily"}
+    for name, result in expected.items():
+        pd.testing.assert_frame_equal(results[name].reset_index(drop=True),
+                                      result.reset_index(drop=True), check_dtype=False)
+
+def test_rollup_cannot_answer_finer_or_non_additive(daily_rollup):
+    assert not daily_rollup.can_answer(Aggregate("by_status", "fact_play_session", ["status_key"],
+                                                 {"sessions": ("play_session_id", "count")}))
+    assert not daily_rollup.can_answer(Aggregate("max_score", "fact_play_session", ["channel_key"],
+                                                 {"best": ("total_score", "max")}))
+    assert not daily_rollup.can_answer(Aggregate("ids", "fact_play_session", ["channel_key"],
+                                                 {"ids": ("play_session_id", "nunique")}))
+
+def test_rollup_rejects_non_additive_measure():
+    with pytest.raises(ValueError):
+        Rollup("bad", "fact_play_session", ["user_key"],
+               {"sessions": ("play_session_id", "count"), "avg": ("total_score", "mean")})
@@ -0,0 +1,34 @@
+# tests/test_benchmarks.py
+import filecmp
+from benchmarks.bench_pipeline import compare
+from benchmarks.synthetic_data import generate
+from src.config import DQ_RULES, SOURCE_FILES
+from src.data_loader import DataLoader
+from src.data_quality import DataQualityValidator
+
+def test_synthetic_sources_pass_data_quality(tmp_path):
+    rows = generate(tmp_path, scale=2, seed=1)
+    loader = DataLoader()
+    loader.raw_data_path = tmp_path
+    raw_data = loader.load_all_sources()
+
+    assert loader.load_errors == {}
+    assert len(raw_data["play_session"]) == rows["play_session"] == 2 * 1872
+    assert DataQualityValidator().check_tables(raw_data, DQ_RULES)
+    assert raw_data["user_plan"]["end_date"].dt.year.eq(9999).mean() > 0.7
+    # Power-law skew: the busiest 10% of players have far more than 10% of the sessions
+    sessions_per_user = raw_data["play_session"]["user_id"].value_counts()
+    assert sessions_per_user.nlargest(len(sessions_per_user) // 10).sum() > 0.25 * rows["play_session"]
+
+def test_synthetic_sources_are_reproducible(tmp_path):
+    generate(tmp_path / "a", scale=1, seed=3)
+    generate(tmp_path / "b", scale=1, seed=3)
+    files = list(SOURCE_FILES.values())
+    assert filecmp.cmpfiles(tmp_path / "a", tmp_path / "b", files, shallow=False)[0] == files
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"10": {"facts": 1.0, "insights": 0.01, "peak_rss_mb": 200.0}}
+    results = {"10": {"facts": 1.5, "insights": 0.04, "peak_rss_mb": 210.0}, "100": {"facts": 9.0}}
+    regressions = compare(results, baseline, tolerance=0.25)
+    # insights tripled but by less than the noise floor; scale 100 has no baseline
+    assert regressions == ["scale 10 facts: 1.0 -> 1.5 (+50%)"]
@@ -0,0 +1,62 @@
+# tests/test_data_loader.py
+import pandas as pd
+import pytest
+from src.data_loader import DataLoader, SchemaError, csv_byte_ranges, read_csv_range
+
+@pytest.fixture
+def loader(tmp_path):
+    """A loader pointed at a temporary raw directory with one missing file."""
+    pd.DataFrame({"user_id": [1, 2]}).to_csv(tmp_path / "user.csv", index=False)
+    pd.DataFrame({
+        "plan_id": [1], "payment_frequency_code": ["MONTHLY"], "cost_amount": [1.99]
+    }).to_csv(tmp_path / "plan.csv", index=False)
+    loader = DataLoader()
+    loader.raw_data_path = tmp_path
+    loader.source_files = {"user": "user.csv", "plan": "plan.csv", "status": "status_code.csv"}
+    return loader
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_load_all_sources_collects_errors(loader, max_workers, capsys):
+    raw_data = loader.load_all_sources(max_workers=max_workers)
+
+    # Messages come from the calling thread, in source order
+    messages = [line.strip() for line in capsys.readouterr().out.splitlines() if line.startswith("  ")]
+    assert messages[:2] == ["Successfully loaded user.csv", "Successfully loaded plan.csv"]
+    assert messages[2].startswith("ERROR: Could not load status_code.csv")
+    assert list(raw_data) == ["user", "plan"]
+    assert raw_data["user"]["user_id"].tolist() == [1, 2]
+    assert list(loader.load_errors) == ["status"]
+    assert isinstance(loader.load_errors["status"], FileNotFoundError)
+
+def test_load_all_sources_exclude(loader):
+    raw_data = loader.load_all_sources(exclude=["status"])
+    assert list(raw_data) == ["user", "plan"]
+    assert loader.load_errors == {}
+
+def test_load_source_applies_declared_schema(loader):
+    raw_data = loader.load_all_sources()
+    assert raw_data["user"]["user_id"].dtype == "int32"
+    assert raw_data["plan"]["plan_id"].dtype == "int16"
+    assert isinstance(raw_data["plan"]["payment_frequency_code"].dtype, pd.CategoricalDtype)
+
+def test_load_source_rejects_ids_wider_than_declared(loader, tmp_path):
+    pd.DataFrame({
+        "plan_id": [70000], "payment_frequency_code": ["MONTHLY"], "cost_amount": [1.99]
+    }).to_csv(tmp_path / "plan.csv", index=False)
+    with pytest.raises(SchemaError):
+        loader._read_source("plan")
+
+def test_load_source_rejects_missing_ids(loader, tmp_path):
+    pd.DataFrame({"user_id": [1, None]}).to_csv(tmp_path / "user.csv", index=False)
+    with pytest.raises(SchemaError, match="user.csv has missing values in integer column user_id"):
+        loader._read_source("user")
+
+def test_csv_byte_ranges_cover_every_row_once(tmp_path):
+    path = tmp_path / "user.csv"
+    pd.DataFrame({"user_id": range(1000), "email": [f"u{i}@example.com" for i in range(1000)]}).to_csv(path, index=False)
+
+    ranges = csv_byte_ranges(path, max_bytes=2000, min_ranges=3)
+    parts = [read_csv_range(path, start, end, "user") for start, end in ranges]
+    assert len(ranges) > 3
+    assert pd.concat(parts)["user_id"].tolist() == list(range(1000))
+    assert parts[0]["user_id"].dtype == "int32"
@@ -1,7 +1,7 @@
 # tests/test_data_quality.py
 import pandas as pd
 import pytest
-from src.data_quality import DataQualityValidator
+from src.data_quality import DataQualityValidator, DataQualityError, TableRules
 
 @pytest.fixture
 def dq_validator():
@@ -36,4 +36,165 @@ def test_referential_integrity_fail(dq_validator):
     parent_df = pd.DataFrame({"id": [1, 2]})
     child_df = pd.DataFrame({"fk_id": [1, 3]}) # 3 is an orphan key
     assert dq_validator.check_referential_integrity(parent_df, child_df, "id", "fk_id", "test_rel") == False
-    assert len(dq_validator.results["failed"]) == 1
\ No newline at end of file
+    assert len(dq_validator.results["failed"]) == 1
+
+def test_check_table_runs_all_rules_together(dq_validator):
+    users = pd.DataFrame({"user_id": [1, 2]})
+    sessions = pd.DataFrame({"session_id": [10, 11, 11, 12, 13],
+                             "user_id": [1, 3, 3, None, 4]})
+    rules = TableRules(unique=[["session_id"]], not_null=["user_id"],
+                       references={"user_id": ("user", "user_id")})
+    assert dq_validator.check_table(sessions, "session", rules, parents={"user": users}) == False
+
+    results = dq_validator.check_results
+    # The second row of key 11 fails, not the first
+    assert results["DQ_UNIQUE: session on ['session_id']"].failed_rows == 1
+    assert results["DQ_NULL: session on ['user_id']"].failed_rows == 1
+    orphans = results["DQ_REF_INTEGRITY: user->session"]
+    assert (orphans.failed_rows, orphans.failed_values) == (3, 2)
+    assert orphans.sample["user_id"].tolist() == [3, 3, 4]
+    assert len(dq_validator.results["failed"]) == 3
+
+def test_check_tables_skips_missing_tables(dq_validator):
+    rule_sets = {"user": {"unique": [["user_id"]]},
+                 "play_session": {"references": {"user_id": ("user", "user_id")}}}
+    assert dq_validator.check_tables({"user": pd.DataFrame({"user_id": [1, 2]})}, rule_sets) == True
+    assert dq_validator.results["passed"] == ["DQ_UNIQUE: user on ['user_id']"]
+
+def test_failure_sample_is_bounded(dq_validator):
+    parent_df = pd.DataFrame({"id": [1]})
+    child_df = pd.DataFrame({"fk_id": range(2, 1002)})
+    dq_validator.check_referential_integrity(parent_df, child_df, "id", "fk_id", "test_rel")
+    result = dq_validator.check_results["DQ_REF_INTEGRITY: test_rel"]
+    assert result.failed_values == 1000
+    assert len(result.sample) == 5
+
+@pytest.fixture
+def tables():
+    return {
+        "user": pd.DataFrame({"user_id": range(1000)}),
+        "play_session": pd.DataFrame({"session_id": range(5000),
+                                      "user_id": [i % 1000 for i in range(4990)] + [5000] * 10}),
+    }
+
+@pytest.mark.parametrize("mode", ["approximate", "sample"])
+def test_screen_tables_flags_orphans(dq_validator, tables, mode):
+    rule_sets = {"user": {"unique": [["user_id"]]},
+                 "play_session": {"unique": [["session_id"]], "references": {"user_id": ("user", "user_id")}}}
+    assert dq_validator.screen_tables(tables, rule_sets, mode=mode) == ["play_session"]
+    assert dq_validator.results["failed"] == []
+    [flag] = dq_validator.results["flagged"]
+    assert flag.endswith("REF_INTEGRITY: user->play_session")
+    assert dq_validator.check_results[flag].sample["user_id"].tolist()[0] == 5000
+
+def test_exact_check_replaces_screening_results(dq_validator, tables):
+    rule_sets = {"user": {"unique": [["user_id"]]},
+                 "play_session": {"unique": [["session_id"]], "references": {"user_id": ("user", "user_id")}}}
+    flagged = dq_validator.screen_tables(tables, rule_sets)
+    dq_validator.check_tables(tables, {name: rule_sets[name] for name in flagged})
+
+    assert dq_validator.results["flagged"] == []
+    assert dq_validator.results["failed"] == ["DQ_REF_INTEGRITY: user->play_session"]
+    assert dq_validator.results["passed"] == ["DQ_APPROX_UNIQUE: user on ['user_id']",
+                                              "DQ_UNIQUE: play_session on ['session_id']"]
+    assert len(dq_validator.check_results) == 3
+
+def test_screen_tables_flags_duplicates(dq_validator, tables):
+    tables["user"] = pd.DataFrame({"user_id": [i % 500 for i in range(1000)]})
+    assert dq_validator.screen_tables(tables, {"user": {"unique": [["user_id"]]}}) == ["user"]
+    duplicates = dq_validator.check_results["DQ_APPROX_UNIQUE: user on ['user_id']"].failed_rows
+    assert 450 < duplicates < 550
+
+def _chunks(df, size, consumed=None):
+    for start in range(0, len(df), size):
+        if consumed is not None:
+            consumed.append(start)
+        yield df.iloc[start:start + size]
+
+def test_checked_chunks_carries_state_across_chunks(dq_validator):
+    users = pd.DataFrame({"user_id": [1, 2]})
+    sessions = pd.DataFrame({"session_id": [1, 2, 3, 1, 5, 3], "user_id": [1, 2, 9, 1, None, 9]})
+    rules = TableRules(unique=[["session_id"]], not_null=["user_id"],
+                       references={"user_id": ("user", "user_id")})
+    chunks = dq_validator.checked_chunks(_chunks(sessions, 2), "session", rules,
+                                         parents={"user": users}, max_failed_rows=None)
+    assert pd.concat(chunks).equals(sessions)
+
+    results = dq_validator.check_results
+    # Rows repeating a key seen in an earlier chunk
+    assert results["DQ_UNIQUE: session on ['session_id']"].failed_rows == 2
+    assert results["DQ_NULL: session on ['user_id']"].failed_rows == 1
+    orphans = results["DQ_REF_INTEGRITY: user->session"]
+    assert (orphans.rows_checked, orphans.failed_rows, orphans.failed_values) == (6, 2, 1)
+
+def test_checked_chunks_fails_fast(dq_validator):
+    users = pd.DataFrame({"user_id": [1]})
+    sessions = pd.DataFrame({"user_id": [1] * 10 + [7] + [1] * 89})
+    rules = TableRules(references={"user_id": ("user", "user_id")})
+    consumed = []
+    with pytest.raises(DataQualityError):
+        for _ in dq_validator.checked_chunks(_chunks(sessions, 10, consumed), "session", rules,
+                                             parents={"user": users}, max_failed_rows=0):
+            pass
+    assert consumed == [0, 10]
+    assert dq_validator.check_results["DQ_REF_INTEGRITY: user->session"].rows_checked == 20
+    assert len(dq_validator.results["failed"]) == 1
+
+def test_checked_chunks_passes_clean_data_with_empty_chunks(dq_validator):
+    df = pd.DataFrame({"id": range(1000)})
+    chunks = [df.iloc[:0], *_chunks(df, 64), df.iloc[:0]]
+    assert sum(len(c) for c in dq_validator.checked_chunks(iter(chunks), "t", TableRules(unique=[["id"]]))) == 1000
+    assert dq_validator.results["passed"] == ["DQ_UNIQUE: t on ['id']"]
+
+def test_streamed_and_in_memory_checks_count_failures_alike():
+    users = {"user": pd.DataFrame({"user_id": [1, 2]})}
+    sessions = pd.DataFrame({"session_id": [1, 2, 2, 3, 2, 4, 4], "user_id": [1, 2, 9, 1, 9, 9, 8]})
+    rules = TableRules(unique=[["session_id"]], references={"user_id": ("user", "user_id")})
+    in_memory, streamed = DataQualityValidator(), DataQualityValidator()
+    in_memory.check_table(sessions, "session", rules, parents=users)
+    for _ in streamed.checked_chunks(_chunks(sessions, 2), "session", rules, parents=users, max_failed_rows=None):
+        pass
+
+    for name, result in in_memory.check_results.items():
+        counts = (result.failed_rows, result.failed_values)
+        assert (streamed.check_results[name].failed_rows, streamed.check_results[name].failed_values) == counts
+    assert in_memory.check_results["DQ_UNIQUE: session on ['session_id']"].failed_rows == 3
+    assert in_memory.check_results["DQ_REF_INTEGRITY: user->session"].failed_values == 2
+
+def test_streamed_failed_values_are_capped(dq_validator, monkeypatch):
+    monkeypatch.setattr("src.data_quality.DQ_MAX_FAILED_VALUES", 10)
+    sessions = pd.DataFrame({"user_id": range(100, 200)})
+    rules = TableRules(references={"user_id": ("user", "user_id")})
+    for _ in dq_validator.checked_chunks(_chunks(sessions, 8), "session", rules,
+                                         parents={"user": pd.DataFrame({"user_id": [1]})}, max_failed_rows=None):
+        pass
+    result = dq_validator.check_results["DQ_REF_INTEGRITY: user->session"]
+    assert (result.failed_rows, result.failed_values) == (100, None)
+
+@pytest.mark.parametrize("mode", ["approximate", "sample"])
+def test_screened_chunks_recheck_only_flagged_rules(dq_validator, tables, mode):
+    rules = TableRules(unique=[["session_id"]], references={"user_id": ("user", "user_id")})
+    rereads = []
+    def recheck():
+        rereads.append(1)
+        return _chunks(tables["play_session"], 1000)
+    chunks = dq_validator.screened_chunks(_chunks(tables["play_session"], 1000), "play_session", mode, rules,
+                                          parents=tables, recheck=recheck, max_failed_rows=None)
+    assert sum(len(chunk) for chunk in chunks) == 5000
+
+    assert rereads == [1]
+    assert dq_validator.results["flagged"] == []
+    assert dq_validator.results["failed"] == ["DQ_REF_INTEGRITY: user->play_session"]
+    assert dq_validator.check_results["DQ_REF_INTEGRITY: user->play_session"].failed_rows == 10
+    # The unique key passed the screen, so only its screening result is kept
+    assert [name for name in dq_validator.results["passed"] if "UNIQUE" in name] == \
+        ["DQ_APPROX_UNIQUE: play_session on ['session_id']"]
+
+def test_screened_chunks_pass_without_reading_again(dq_validator, tables):
+    sessions = tables["play_session"].iloc[:4990]
+    rules = TableRules(unique=[["session_id"]], references={"user_id": ("user", "user_id")})
+    chunks = dq_validator.screened_chunks(_chunks(sessions, 1000), "play_session", "approximate", rules,
+                                          parents=tables, recheck=lambda: pytest.fail("read again"))
+    assert sum(len(chunk) for chunk in chunks) == 4990
+    assert len(dq_validator.results["passed"]) == 2
+    assert dq_validator.results["failed"] == dq_validator.results["flagged"] == []
@@ -0,0 +1,26 @@
+# tests/test_date_keys.py
+import pandas as pd
+from src.date_keys import date_key_days, days_to_date_key, to_date_key
+from src.config import OPEN_ENDED_DATE_KEY, UNKNOWN_DATE_KEY
+
+def test_to_date_key_matches_strftime():
+    dates = pd.Series(pd.date_range("2024-01-01", "2025-12-31", freq="37h"))
+    expected = dates.dt.strftime("%Y%m%d").astype(int)
+    assert to_date_key(dates).tolist() == expected.tolist()
+
+def test_to_date_key_uses_wall_clock_date_of_offset():
+    ts = pd.Series(pd.to_datetime(["2024-01-01T22:00:00.000-06:00"]))
+    assert to_date_key(ts).tolist() == [20240101]
+    assert to_date_key(ts.dt.tz_convert("UTC")).tolist() == [20240102]
+
+def test_to_date_key_sentinels():
+    ts = pd.Series(pd.to_datetime(["2024-03-02T00:00:00.000-06:00", "9999-01-01T00:00:00.000-06:00", None]))
+    keys = to_date_key(ts)
+    assert keys.tolist() == [20240302, OPEN_ENDED_DATE_KEY, UNKNOWN_DATE_KEY]
+    assert keys.dtype == "int32"
+
+def test_date_key_days_inverts_to_date_key():
+    dates = pd.Series(pd.date_range("2023-12-25", "2025-03-05", freq="D"))
+    days = date_key_days(to_date_key(dates))
+    assert days.tolist() == (dates - pd.Timestamp("1970-01-01")).dt.days.tolist()
+    assert days_to_date_key(days).tolist() == to_date_key(dates).tolist()
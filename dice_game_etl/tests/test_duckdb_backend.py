@@ -0,0 +1,121 @@
+# tests/test_duckdb_backend.py
+import pandas as pd
+import pytest
+from src.config import SOURCE_FILES
+from src.data_loader import DataLoader
+from src.data_quality import DataQualityValidator, TableRules
+from src.pipeline_state import PipelineState
+from src.storage import read_table
+from src.transformations import StarSchemaBuilder
+
+pytest.importorskip("duckdb")
+from src.duckdb_backend import DuckDBQualityChecker, DuckDBStarSchemaBuilder
+
+@pytest.fixture
+def raw_dir(tmp_path):
+    """All nine sources as CSV files, including an orphan user and a missing plan."""
+    sources = {
+        "channel": pd.DataFrame({"play_session_channel_code": ["MOBILE", "BROWSER"],
+                                 "english_description": ["Mobile", "Browser"]}),
+        "status": pd.DataFrame({"play_session_status_code": ["COMPLETED"], "english_description": ["Completed"]}),
+        "plan": pd.DataFrame({"plan_id": [1, 2], "payment_frequency_code": ["MONTHLY", "ONETIME"],
+                              "cost_amount": [4.99, 19.99]}),
+        "payment_frequency": pd.DataFrame({"payment_frequency_code": ["MONTHLY", "ONETIME"],
+                                           "english_description": ["Monthly", "One time"]}),
+        "user": pd.DataFrame({"user_id": [1, 2], "ip_address": ["1.1.1.1", "2.2.2.2"]}),
+        "registration": pd.DataFrame({"user_registration_id": [101, 102], "user_id": [1, 2]}),
+        "payment_detail": pd.DataFrame({"payment_detail_id": [7], "payment_method_code": ["PAYPAL"]}),
+        "user_plan": pd.DataFrame({
+            "user_registration_id": [101, 102], "payment_detail_id": [7, 7], "plan_id": [1, 3],
+            "start_date": ["2024-03-31T23:00:00.000-06:00", "2024-01-01T00:00:00.000-06:00"],
+            "end_date": ["9999-01-01T00:00:00.000-06:00", "2024-02-01T00:00:00.000-06:00"],
+        }),
+        "play_session": pd.DataFrame({
+            "play_session_id": [1, 2, 3], "user_id": [1, 2, 99],
+            "start_datetime": ["2024-01-01T23:30:00.000-06:00", "2024-02-01T10:00:00.000-06:00",
+                               "2024-02-02T10:00:00.000-06:00"],
+            "end_datetime": ["2024-01-02T00:15:00.000-06:00", "2024-02-01T10:30:00.000-06:00",
+                             "2024-02-02T11:00:00.000-06:00"],
+            "channel_code": ["MOBILE", "BROWSER", "MOBILE"], "status_code": ["COMPLETED"] * 3,
+            "total_score": [10, 20, 30],
+        }),
+    }
+    for name, df in sources.items():
+        df.to_csv(tmp_path / SOURCE_FILES[name], index=False)
+    return tmp_path
+
+@pytest.fixture
+def raw_data(raw_dir):
+    loader = DataLoader()
+    loader.raw_data_path = raw_dir
+    return loader.load_all_sources(max_workers=1)
+
+@pytest.fixture
+def output_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.transformations.FACT_DIR", tmp_path / "facts")
+    monkeypatch.setattr("src.transformations.DIM_DIR", tmp_path / "dims")
+    monkeypatch.setattr("src.transformations.AGG_DIR", tmp_path / "aggregates")
+    monkeypatch.setattr("src.duckdb_backend.DUCKDB_TEMP_DIR", tmp_path / "duckdb_tmp")
+    return tmp_path
+
+def _read_sorted(dir, name):
+    df = read_table(dir, name)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+def test_facts_match_pandas_backend(raw_dir, raw_data, output_dirs):
+    tables = {}
+    for builder in (StarSchemaBuilder(raw_data), DuckDBStarSchemaBuilder(raw_data, raw_data_dir=raw_dir)):
+        builder.create_dimensions()
+        builder.create_facts()
+        tables[type(builder)] = {
+            name: _read_sorted(output_dirs / "facts", name) for name in ("fact_play_session", "fact_subscription")
+        }
+        tables[type(builder)]["agg_play_session_daily"] = _read_sorted(output_dirs / "aggregates",
+                                                                       "agg_play_session_daily")
+        tables[type(builder)]["unmatched"] = builder.unmatched_keys
+
+    expected, result = tables[StarSchemaBuilder], tables[DuckDBStarSchemaBuilder]
+    assert result["unmatched"] == expected["unmatched"] == {"fact_play_session.user_key": 1,
+                                                            "fact_subscription.plan_key": 1}
+    for name in ("fact_play_session", "fact_subscription", "agg_play_session_daily"):
+        pd.testing.assert_frame_equal(result[name], expected[name])
+
+def test_incremental_run_appends(raw_dir, raw_data, output_dirs):
+    state = PipelineState(output_dirs / "state")
+    full = DuckDBStarSchemaBuilder(raw_data, state=state, raw_data_dir=raw_dir)
+    full.create_dimensions()
+    full.create_facts()
+    assert state.get_watermark("play_session") == 3
+
+    sessions = pd.read_csv(raw_dir / SOURCE_FILES["play_session"])
+    pd.concat([sessions, sessions.tail(1).assign(play_session_id=4)]).to_csv(
+        raw_dir / SOURCE_FILES["play_session"], index=False)
+    delta = DuckDBStarSchemaBuilder(raw_data, state=state, incremental=True, raw_data_dir=raw_dir)
+    delta.create_dimensions()
+    delta.create_facts()
+
+    assert _read_sorted(output_dirs / "facts", "fact_play_session")["play_session_id"].tolist() == [1, 2, 3, 4]
+    assert read_table(output_dirs / "aggregates", "agg_play_session_user")["session_count"].sum() == 4
+    assert state.get_watermark("play_session") == 4
+
+def test_sql_checks_match_pandas_checks(raw_dir, raw_data, output_dirs):
+    sessions = raw_data["play_session"]
+    sessions = pd.concat([sessions, sessions.assign(user_id=[99, None, 98]).iloc[[0, 1, 1, 2]]])
+    sessions.to_csv(raw_dir / SOURCE_FILES["play_session"], index=False)
+    rules = TableRules(unique=[["play_session_id"]], not_null=["user_id"], references={"user_id": ("user", "user_id")})
+
+    expected = DataQualityValidator()
+    expected.check_table(sessions, "play_session", rules, parents=raw_data)
+    results = DuckDBQualityChecker(raw_data, raw_data_dir=raw_dir).check("play_session", rules)
+
+    assert [result.name for result in results] == list(expected.check_results)
+    for result in results:
+        counts = (result.rows_checked, result.failed_rows, result.failed_values)
+        want = expected.check_results[result.name]
+        assert counts == (want.rows_checked, want.failed_rows, want.failed_values)
+        assert len(result.sample) == len(want.sample) > 0
+
+def test_sql_checks_skip_empty_sources(raw_dir, raw_data, output_dirs):
+    raw_data["play_session"].iloc[:0].to_csv(raw_dir / SOURCE_FILES["play_session"], index=False)
+    checker = DuckDBQualityChecker(raw_data, raw_data_dir=raw_dir)
+    assert checker.check("play_session", TableRules(unique=[["play_session_id"]])) == []
@@ -0,0 +1,104 @@
+# tests/test_insights.py
+import pandas as pd
+import pytest
+import src.insights
+from src.insights import InsightGenerator
+from src.stage_cache import StageCache
+from src.storage import write_partitioned
+
+@pytest.fixture
+def warehouse():
+    """A tiny star schema with every table the report reads."""
+    return {
+        "dim_channel": pd.DataFrame({"channel_key": [1, 2], "english_description": ["Browser", "Mobile"],
+                                     "play_session_channel_code": ["BROWSER", "MOBILE"]}),
+        "dim_status": pd.DataFrame({"status_key": [1], "english_description": ["Completed"]}),
+        "dim_plan": pd.DataFrame({"plan_key": [1], "english_description": ["Monthly"]}),
+        "dim_payment_method": pd.DataFrame({"payment_detail_key": [1], "payment_method_code": ["PAYPAL"]}),
+        "dim_user_attributes": pd.DataFrame({"user_key": [1, 2], "username": ["a", "b"],
+                                             "first_name": ["A", "B"], "last_name": ["Aa", "Bb"]}),
+        "dim_date": pd.DataFrame({"date_key": [20240105], "year": [2024], "month": [1],
+                                  "month_name": ["January"]}),
+        "fact_play_session": pd.DataFrame({
+            "play_session_id": [1, 2, 3], "user_key": [1, 2, 2], "channel_key": [1, 2, 2],
+            "status_key": [1, 1, 1], "start_date_key": [20240105] * 3, "end_date_key": [20240105] * 3,
+            "total_score": [10, 20, 30], "duration_minutes": [5.0, 10.0, 20.0],
+        }),
+        "fact_subscription": pd.DataFrame({
+            "user_key": [1], "plan_key": [1], "payment_detail_key": [1], "start_date_key": [20240105],
+            "end_date_key": [99991231], "cost_amount": [1.99], "is_active": [True],
+        }),
+        "fact_subscription_period": pd.DataFrame({
+            "user_key": [1, 1], "plan_key": [1, 1], "payment_detail_key": [1, 1], "period_number": [1, 2],
+            "period_start_date_key": [20240105, 20240205], "period_end_date_key": [20240205, 20240305],
+            "billed_amount": [1.99, 1.99],
+        }),
+    }
+
+@pytest.fixture
+def disk_reads(monkeypatch):
+    """Records every table InsightGenerator reads from disk."""
+    reads = []
+    read_table = src.insights.read_table
+    def counting_read_table(dir, name, columns=None, filters=None):
+        reads.append((name, columns))
+        return read_table(dir, name, columns=columns, filters=filters)
+    monkeypatch.setattr("src.insights.read_table", counting_read_table)
+    return reads
+
+def test_seeded_tables_are_not_reread(warehouse, disk_reads, tmp_path):
+    analyzer = InsightGenerator(tables=warehouse)
+    analyzer.report_path = tmp_path / "report.md"
+    analyzer.generate_all_insights()
+
+    assert disk_reads == []
+    report = (tmp_path / "report.md").read_text()
+    assert "| Mobile    |                2 |" in report
+    # Gross revenue is billed revenue, the total of the monthly trend
+    assert "**Total Gross Revenue (billed through 2024-12-31): $3.98**" in report
+
+def test_each_table_read_once_with_needed_columns(warehouse, disk_reads, tmp_path):
+    for name, df in warehouse.items():
+        if name.startswith("fact_"):
+            write_partitioned(df, tmp_path / f"{name}.parquet", name)
+        else:
+            df.to_parquet(tmp_path / f"{name}.parquet", index=False)
+    analyzer = InsightGenerator()
+    analyzer.dim_path = analyzer.fact_path = tmp_path
+    analyzer.report_path = tmp_path / "report.md"
+    analyzer.generate_all_insights()
+
+    read_names = [name for name, _ in disk_reads]
+    assert sorted(read_names) == sorted(warehouse)
+    assert "play_session_channel_code" not in dict(disk_reads)["dim_channel"]
+
+def test_attributes_are_fetched_for_result_rows_only(warehouse, tmp_path):
+    attributes = pd.DataFrame({"user_key": [1, 2, 3], "username": ["a", "b", "c"]})
+    attributes.to_parquet(tmp_path / "dim_user_attributes.parquet", index=False)
+    analyzer = InsightGenerator()
+    analyzer.dim_path = tmp_path
+
+    top = pd.DataFrame({"user_key": [3, 1], "total_score": [30, 10]})
+    result = analyzer._with_attributes(top, "dim_user", "user_key", ["username"])
+    assert result["username"].tolist() == ["c", "a"]
+    assert "dim_user_attributes" not in analyzer._tables
+
+def test_cached_insights_only_rerun_when_their_tables_change(warehouse, disk_reads, tmp_path):
+    fingerprints = {name: f"{name}-v1" for name in warehouse}
+    cache = StageCache(tmp_path / "cache")
+    first = InsightGenerator(tables=warehouse, cache=cache, fingerprints=fingerprints)
+    first.report_path = tmp_path / "first.md"
+    first.generate_all_insights()
+
+    # Only the user labels changed: the report is reassembled from cached
+    # sections except insight 6, the only one computing an aggregate
+    warehouse["dim_user_attributes"]["username"] = ["x", "y"]
+    fingerprints["dim_user_attributes"] = "dim_user_attributes-v2"
+    second = InsightGenerator(tables=warehouse, cache=cache, fingerprints=fingerprints)
+    second.report_path = tmp_path / "second.md"
+    second.generate_all_insights()
+
+    assert disk_reads == []
+    assert list(second._aggregates) == ["top_users_by_score"]
+    expected = (tmp_path / "first.md").read_text().replace("| a ", "| x ").replace("| b ", "| y ")
+    assert (tmp_path / "second.md").read_text() == expected
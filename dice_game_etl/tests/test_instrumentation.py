@@ -0,0 +1,45 @@
+# tests/test_instrumentation.py
+import json
+import pstats
+import pytest
+from src.instrumentation import RunRecorder, add_rows, stage
+
+def test_stage_is_a_noop_without_active_recorder():
+    with stage("load") as record:
+        add_rows(rows_out=10)
+    assert record is None
+
+def test_stages_record_timings_and_rows(tmp_path):
+    recorder = RunRecorder(manifest_dir=tmp_path)
+    with recorder.activate():
+        with stage("transform", rows_in=5):
+            with stage("transform.dim_user"):
+                add_rows(rows_out=3)
+            add_rows(rows_out=2)
+    outer, inner = recorder.stages
+    assert (outer.name, outer.rows_in, outer.rows_out) == ("transform", 5, 2)
+    assert (inner.name, inner.rows_out) == ("transform.dim_user", 3)
+    assert outer.wall_seconds >= inner.wall_seconds >= 0
+    assert recorder.status == "ok"
+
+def test_manifest_records_failed_run(tmp_path):
+    recorder = RunRecorder(manifest_dir=tmp_path, run_info={"backend": "pandas"})
+    with pytest.raises(SystemExit):
+        with recorder.activate():
+            with stage("dq"):
+                raise SystemExit(1)
+    manifest = json.loads(recorder.write_manifest().read_text())
+    assert manifest["status"] == "aborted"
+    assert manifest["run_info"] == {"backend": "pandas"}
+    assert [(s["name"], s["status"]) for s in manifest["stages"]] == [("dq", "aborted")]
+
+def test_profiled_stage_dumps_stats(tmp_path):
+    recorder = RunRecorder(manifest_dir=tmp_path, profile_stages=["insights"])
+    with recorder.activate():
+        with stage("insights"):
+            sum(range(1000))
+        with stage("load"):
+            pass
+    profiled, plain = recorder.stages
+    assert pstats.Stats(profiled.profile_path).total_calls > 0
+    assert plain.profile_path is None
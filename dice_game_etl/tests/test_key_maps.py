@@ -0,0 +1,25 @@
+# tests/test_key_maps.py
+import numpy as np
+import pandas as pd
+from src.key_maps import KeyMap
+from src.config import UNKNOWN_KEY
+
+def test_lookup_dense_integer_keys():
+    key_map = KeyMap(pd.Series([10, 11, 13]), [1, 2, 3])
+    keys, unmatched = key_map.lookup(pd.Series([13, 10, 12, 99]))
+    assert keys.tolist() == [3, 1, UNKNOWN_KEY, UNKNOWN_KEY]
+    assert unmatched == 2
+    assert keys.dtype == np.int32
+
+def test_lookup_hashed_string_and_categorical_keys():
+    key_map = KeyMap(pd.Series(["BROWSER", "MOBILE"]), [1, 2])
+    values = pd.Series(["MOBILE", "TV", None, "BROWSER"])
+    expected = [2, UNKNOWN_KEY, UNKNOWN_KEY, 1]
+    assert key_map.lookup(values)[0].tolist() == expected
+    assert key_map.lookup(values.astype("category"))[0].tolist() == expected
+
+def test_lookup_skips_missing_natural_keys():
+    # e.g. dim_user.user_registration_id is empty for unregistered users
+    key_map = KeyMap(pd.Series([101.0, np.nan, 102.0]), [1, 2, 3])
+    assert key_map.lookup(pd.Series([102, 101]))[0].tolist() == [3, 1]
+    assert key_map.take(pd.Series([102, 5]), [9.5, 0.0, 7.5])[0] == 7.5
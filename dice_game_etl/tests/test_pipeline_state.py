@@ -0,0 +1,20 @@
+# tests/test_pipeline_state.py
+import pandas as pd
+from src.pipeline_state import PipelineState
+
+def test_assign_keys_is_stable_across_runs(tmp_path):
+    state = PipelineState(tmp_path)
+    assert state.assign_keys("dim_user", pd.Series([10, 20])).tolist() == [1, 2]
+    state.set_watermark("play_session", 1001)
+    state.save()
+
+    # A new run sees an unseen user and users in a different order
+    state = PipelineState(tmp_path)
+    assert state.assign_keys("dim_user", pd.Series([30, 20, 10])).tolist() == [3, 2, 1]
+    assert state.get_watermark("play_session") == 1001
+
+def test_assign_keys_string_natural_keys(tmp_path):
+    state = PipelineState(tmp_path)
+    codes = pd.Series(["MOBILE", "BROWSER"], dtype="category")
+    assert state.assign_keys("dim_channel", codes).tolist() == [1, 2]
+    assert state.assign_keys("dim_channel", pd.Series(["BROWSER"])).tolist() == [2]
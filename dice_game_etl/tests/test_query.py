@@ -0,0 +1,70 @@
+# tests/test_query.py
+import pandas as pd
+import pytest
+import src.query
+from src.config import UNKNOWN_KEY
+from src.query import Query, QueryEngine
+from src.storage import write_partitioned
+
+@pytest.fixture
+def warehouse(tmp_path):
+    """A small partitioned fact_play_session with its channel and user dimensions."""
+    pd.DataFrame({"channel_key": [1, 2, 3], "play_session_channel_code": ["BROWSER", "MOBILE", "TABLET"],
+                  "english_description": ["Browser", "Mobile", "Mobile"]}).to_parquet(
+        tmp_path / "dim_channel.parquet", index=False)
+    pd.DataFrame({"user_key": [1, 2, 3], "username": ["a", "b", "c"]}).to_parquet(
+        tmp_path / "dim_user_attributes.parquet", index=False)
+    write_partitioned(pd.DataFrame({
+        "play_session_id": [1, 2, 3, 4, 5],
+        "user_key": [1, 2, 2, 3, UNKNOWN_KEY],
+        "channel_key": [1, 2, 3, 2, 1],
+        "status_key": [1, 1, 1, 1, 1],
+        "start_date_key": [20240105, 20240210, 20240211, 20240301, 20240302],
+        "total_score": [10, 20, 30, 40, 50],
+        "duration_minutes": [1.0, 2.0, 4.0, 6.0, 8.0],
+    }), tmp_path / "fact_play_session.parquet", "fact_play_session")
+    return tmp_path
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Records (table, columns) of every read the query engine makes."""
+    reads = []
+    read_table = src.query.read_table
+    def recording_read_table(dir, name, columns=None, filters=None):
+        result = read_table(dir, name, columns=columns, filters=filters)
+        reads.append((name, columns, len(result)))
+        return result
+    monkeypatch.setattr("src.query.read_table", recording_read_table)
+    return reads
+
+def test_groups_by_label_after_aggregating_keys(warehouse, reads):
+    engine = QueryEngine(warehouse, warehouse)
+    result = engine.run(Query("fact_play_session",
+                              {"sessions": ("play_session_id", "count"), "avg_duration": ("duration_minutes", "mean"),
+                               "users": ("user_key", "nunique")},
+                              group_by=["dim_channel.english_description"]))
+
+    # Channels 2 and 3 share the label "Mobile"
+    assert result["dim_channel.english_description"].tolist() == ["Browser", "Mobile"]
+    assert result["sessions"].tolist() == [2, 3]
+    assert result["avg_duration"].tolist() == [4.5, 4.0]
+    assert result["users"].tolist() == [2, 2]
+    assert reads[0][:2] == ("fact_play_session", ["channel_key", "user_key", "play_session_id", "duration_minutes"])
+
+def test_pushes_date_range_and_dimension_filters_down(warehouse, reads):
+    engine = QueryEngine(warehouse, warehouse)
+    result = engine.run(Query("fact_play_session", {"score": ("total_score", "sum")},
+                              group_by=["dim_user_attributes.username"],
+                              date_range=(20240201, 20240331), where={"dim_channel.english_description": ["Mobile"]},
+                              order_by="score", limit=1))
+
+    assert result.to_dict("records") == [{"dim_user_attributes.username": "b", "score": 50}]
+    fact_read = next(read for read in reads if read[0] == "fact_play_session")
+    # Only the three February/March mobile sessions leave the reader
+    assert fact_read[2] == 3
+    # Labels are read for the users in the result only
+    assert ("dim_user_attributes", ["user_key", "username"], 2) in reads
+
+def test_rejects_unreferenced_dimension():
+    with pytest.raises(ValueError, match="does not reference dim_plan"):
+        Query("fact_play_session", {"sessions": ("play_session_id", "count")}, group_by=["dim_plan.english_description"])
@@ -0,0 +1,47 @@
+# tests/test_scheduler.py
+import threading
+import pytest
+from src.scheduler import Task, TaskGraph
+
+def test_tasks_run_after_their_inputs():
+    ran = []
+    graph = TaskGraph([
+        Task("fact", lambda: ran.append("fact"), ["dim_a", "dim_b"], ["fact"]),
+        Task("dim_a", lambda: ran.append("dim_a"), ["raw"], ["dim_a"]),
+        Task("dim_b", lambda: ran.append("dim_b"), [], ["dim_b"]),
+    ])
+    assert graph.order() == ["dim_a", "dim_b", "fact"]
+    graph.run(max_workers=1)
+    assert ran == ["dim_a", "dim_b", "fact"]
+
+def test_independent_tasks_run_concurrently():
+    # Both tasks must be inside the barrier at once, or it times out
+    barrier = threading.Barrier(2, timeout=5)
+    ran = []
+    graph = TaskGraph([
+        Task("dim_a", barrier.wait, outputs=["dim_a"]),
+        Task("dim_b", barrier.wait, outputs=["dim_b"]),
+        Task("fact", lambda: ran.append("fact"), ["dim_a", "dim_b"]),
+    ])
+    graph.run(max_workers=2)
+    assert ran == ["fact"]
+
+def test_failure_stops_dependent_tasks():
+    ran = []
+    def fail():
+        raise RuntimeError("dim failed")
+    graph = TaskGraph([
+        Task("dim", fail, outputs=["dim"]),
+        Task("fact", lambda: ran.append("fact"), ["dim"]),
+    ])
+    with pytest.raises(RuntimeError, match="dim failed"):
+        graph.run(max_workers=4)
+    assert ran == []
+
+def test_invalid_graphs_are_rejected():
+    graph = TaskGraph([Task("a", print, ["y"], ["x"])])
+    with pytest.raises(ValueError, match="produced by both"):
+        graph.add(Task("b", print, [], ["x"]))
+    graph.add(Task("c", print, ["x"], ["y"]))
+    with pytest.raises(ValueError, match="circular"):
+        graph.run()
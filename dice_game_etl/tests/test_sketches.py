@@ -0,0 +1,32 @@
+# tests/test_sketches.py
+import numpy as np
+import pandas as pd
+from src.sketches import BloomFilter, HyperLogLog, ReservoirSample, hash_keys
+
+def test_hash_keys_ignores_integer_width():
+    ids = pd.Series([1, 2, 3])
+    assert (hash_keys(ids.astype("int32")) == hash_keys(ids.astype("int64"))).all()
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(10_000, false_positive_rate=0.01)
+    bloom.add(hash_keys(pd.Series(np.arange(10_000))))
+    assert bloom.may_contain(hash_keys(pd.Series(np.arange(10_000)))).all()
+    assert bloom.may_contain(hash_keys(pd.Series(np.arange(10_000, 20_000)))).mean() < 0.02
+
+def test_hyperloglog_estimate_within_error():
+    hll = HyperLogLog(precision=12)
+    for start in range(0, 200_000, 50_000):
+        # Every value twice: duplicates must not count
+        values = pd.Series(np.arange(start, start + 50_000) % 100_000)
+        hll.add(hash_keys(values))
+    assert abs(hll.estimate() - 100_000) < 100_000 * 4 * hll.relative_error
+
+def test_reservoir_sample_is_bounded_and_spans_stream():
+    reservoir = ReservoirSample(500, seed=7)
+    for start in range(0, 100_000, 10_000):
+        reservoir.add(pd.DataFrame({"x": np.arange(start, start + 10_000)}))
+    sample = reservoir.sample
+    assert len(sample) == 500 and sample["x"].is_unique
+    assert reservoir.rows_seen == 100_000
+    # Roughly uniform: both halves of the stream are represented
+    assert 150 < (sample["x"] < 50_000).sum() < 350
@@ -0,0 +1,96 @@
+# tests/test_stage_cache.py
+import functools
+import pandas as pd
+import pytest
+from src.config import SOURCE_FILES
+from src.stage_cache import StageCache
+from src.transformations import StarSchemaBuilder
+
+@pytest.fixture
+def raw_data():
+    return {
+        "user": pd.DataFrame({"user_id": [1, 2]}),
+        "registration": pd.DataFrame({"user_registration_id": [101, 102], "user_id": [1, 2],
+                                      "username": ["user1", "user2"]}),
+        "play_session": pd.DataFrame({
+            "play_session_id": [1001, 1002], "user_id": [1, 2],
+            "start_datetime": ["2024-01-01T10:00:00.000-06:00"] * 2,
+            "end_datetime": ["2024-01-01T10:30:00.000-06:00"] * 2,
+            "channel_code": ["MOBILE", "BROWSER"], "status_code": ["COMPLETED"] * 2, "total_score": [150, 90],
+        }),
+        "channel": pd.DataFrame({"play_session_channel_code": ["MOBILE", "BROWSER"],
+                                 "english_description": ["Mobile", "Browser"]}),
+        "status": pd.DataFrame({"play_session_status_code": ["COMPLETED"], "english_description": ["Completed"]}),
+        "plan": pd.DataFrame({"plan_id": [1], "payment_frequency_code": ["MONTHLY"], "cost_amount": [1.99]}),
+        "payment_frequency": pd.DataFrame({"payment_frequency_code": ["MONTHLY"], "english_description": ["Monthly"]}),
+        "payment_detail": pd.DataFrame({"payment_detail_id": [7], "payment_method_code": ["PAYPAL"]}),
+        "user_plan": pd.DataFrame({
+            "user_registration_id": [101], "payment_detail_id": [7], "plan_id": [1],
+            "start_date": ["2024-01-01T00:00:00.000-06:00"], "end_date": ["9999-01-01T00:00:00.000-06:00"],
+        }),
+    }
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    for name in ["DIM_DIR", "FACT_DIR", "AGG_DIR"]:
+        monkeypatch.setattr(f"src.transformations.{name}", tmp_path / name.lower())
+    return tmp_path
+
+def write_sources(raw_data, raw_dir):
+    raw_dir.mkdir(exist_ok=True)
+    for name, df in raw_data.items():
+        df.to_csv(raw_dir / SOURCE_FILES[name], index=False)
+
+def build(raw_data, warehouse):
+    builder = StarSchemaBuilder(raw_data, raw_data_dir=warehouse / "raw", cache=StageCache(warehouse / "cache"))
+    builder.build()
+    return builder
+
+def test_file_fingerprint_depends_only_on_content(tmp_path):
+    cache = StageCache(tmp_path / "cache")
+    (tmp_path / "a.csv").write_text("id\n1\n")
+    (tmp_path / "b.csv").write_text("id\n1\n")
+    assert cache.file_fingerprint(tmp_path / "a.csv") == cache.file_fingerprint(tmp_path / "b.csv")
+    (tmp_path / "b.csv").write_text("id\n2\n")
+    assert cache.file_fingerprint(tmp_path / "a.csv") != cache.file_fingerprint(tmp_path / "b.csv")
+    assert cache.file_fingerprint(tmp_path / "missing.csv") is None
+    assert cache.key("stage", {"source": None}) is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = StageCache(tmp_path, max_entries=2)
+    table = pd.DataFrame({"id": [1, 2]})
+    cache.store("stage", "a", {"t": table})
+    cache.store("stage", "b", {"t": table})
+    cache.load("stage", "a")
+    cache.store("stage", "c", {"t": table}, extra={"rows": 2})
+
+    assert cache.load("stage", "b") is None
+    pd.testing.assert_frame_equal(cache.load("stage", "a").tables["t"], table)
+    assert cache.load("stage", "c").extra == {"rows": 2}
+
+def test_unchanged_stages_are_reused(raw_data, warehouse, monkeypatch):
+    write_sources(raw_data, warehouse / "raw")
+    first = build(raw_data, warehouse)
+
+    # A new label for a channel only rebuilds dim_channel; its keys, and so the facts, are unchanged
+    raw_data["channel"]["english_description"] = ["Mobile app", "Web browser"]
+    write_sources(raw_data, warehouse / "raw")
+    rebuilt = []
+    def spy(name, method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            rebuilt.append(name)
+            return method(self, *args)
+        return wrapper
+    for name in ["dim_date", "dim_channel", "dim_status", "dim_plan", "dim_payment_method", "dim_user",
+                 "fact_play_session", "fact_subscription", "rollups"]:
+        monkeypatch.setattr(StarSchemaBuilder, f"_create_{name}", spy(name, getattr(StarSchemaBuilder, f"_create_{name}")))
+    second = build(raw_data, warehouse)
+
+    assert rebuilt == ["dim_channel"]
+    assert second.dimensions["dim_channel"]["english_description"].tolist() == ["Mobile app", "Web browser"]
+    assert second.fingerprints["dim_channel"] != first.fingerprints["dim_channel"]
+    assert second.fingerprints["fact_play_session"] == first.fingerprints["fact_play_session"]
+    for name, df in first.aggregates.items():
+        pd.testing.assert_frame_equal(second.aggregates[name], df)
+    assert second.key_maps["dim_channel"]["play_session_channel_code"].lookup(pd.Series(["BROWSER"]))[0] == [2]
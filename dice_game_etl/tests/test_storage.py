@@ -0,0 +1,120 @@
+# tests/test_storage.py
+import pandas as pd
+import pytest
+import src.storage
+from src.storage import (
+    AsyncOutputWriter, ChunkedOutputWriter, OutputWriteError, date_range_filter, read_table, write_output,
+    write_partitioned
+)
+
+@pytest.fixture
+def fact_play():
+    return pd.DataFrame({
+        "play_session_id": [1, 2, 3, 4],
+        "start_date_key": [20240105, 20240320, 20240301, 20250101],
+        "total_score": [10, 20, 30, 40],
+    })
+
+def test_write_partitioned_layout(fact_play, tmp_path):
+    write_partitioned(fact_play, tmp_path / "fact_play_session.parquet", "fact_play_session")
+
+    partitions = sorted(p.parent.relative_to(tmp_path / "fact_play_session.parquet").as_posix()
+                        for p in tmp_path.rglob("*.parquet") if p.is_file())
+    assert partitions == ["year=2024/month=1", "year=2024/month=3", "year=2025/month=1"]
+
+    df = read_table(tmp_path, "fact_play_session")
+    assert list(df.columns) == ["play_session_id", "start_date_key", "total_score"]
+    assert sorted(df["play_session_id"]) == [1, 2, 3, 4]
+
+def test_read_table_date_range_and_columns(fact_play, tmp_path):
+    write_partitioned(fact_play, tmp_path / "fact_play_session.parquet", "fact_play_session")
+    df = read_table(tmp_path, "fact_play_session", columns=["play_session_id"],
+                    filters=date_range_filter("fact_play_session", 20240301, 20240331))
+    assert list(df.columns) == ["play_session_id"]
+    assert df["play_session_id"].tolist() == [3, 2]
+
+def test_chunked_writer_appends_to_dataset(fact_play, tmp_path):
+    for append in [False, True]:
+        writer = ChunkedOutputWriter(tmp_path, "fact_play_session", append=append)
+        writer.write(fact_play.iloc[:2])
+        writer.write(fact_play.iloc[2:])
+        writer.close()
+    assert len(read_table(tmp_path, "fact_play_session")) == 8
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather", "csv"])
+def test_chunked_writer_swaps_new_table_in_on_close(fact_play, tmp_path, monkeypatch, output_format):
+    monkeypatch.setattr("src.storage.OUTPUT_FORMAT", output_format)
+    write_output(fact_play, tmp_path, "fact_play_session")
+    writer = ChunkedOutputWriter(tmp_path, "fact_play_session")
+    writer.write(fact_play.iloc[:1])
+    # The previous table stays complete until the new one is
+    assert len(read_table(tmp_path, "fact_play_session")) == 4
+    writer.close()
+    assert read_table(tmp_path, "fact_play_session")["play_session_id"].tolist() == [1]
+    assert not list(tmp_path.glob("*.tmp"))
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather", "csv"])
+def test_chunked_writer_without_chunks_removes_previous_table(fact_play, tmp_path, monkeypatch, output_format):
+    monkeypatch.setattr("src.storage.OUTPUT_FORMAT", output_format)
+    write_output(fact_play, tmp_path, "fact_play_session")
+    ChunkedOutputWriter(tmp_path, "fact_play_session").close()
+    assert not list(tmp_path.iterdir())
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather", "csv"])
+@pytest.mark.parametrize("append", [False, True])
+def test_chunked_writer_abort_keeps_previous_table(fact_play, tmp_path, monkeypatch, output_format, append):
+    monkeypatch.setattr("src.storage.OUTPUT_FORMAT", output_format)
+    write_output(fact_play.iloc[:2], tmp_path, "fact_play_session")
+    writer = ChunkedOutputWriter(tmp_path, "fact_play_session", append=append)
+    writer.write(fact_play.iloc[2:3])
+    writer.write(fact_play.iloc[3:])
+    writer.abort()
+    assert read_table(tmp_path, "fact_play_session")["play_session_id"].tolist() == [1, 2]
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_async_writer_replaces_outputs_atomically(fact_play, tmp_path):
+    writer = AsyncOutputWriter(threads=2, max_pending=1)
+    for df in [fact_play, fact_play.iloc[:1]]:
+        writer.submit(df, tmp_path, "dim_user")
+        writer.submit(df, tmp_path, "fact_play_session")
+        writer.barrier()
+    assert len(read_table(tmp_path, "dim_user")) == 1
+    assert len(read_table(tmp_path, "fact_play_session")) == 1
+    assert not list(tmp_path.glob("*.tmp")) and not list(tmp_path.glob("*.old"))
+
+def test_async_writer_waits_for_one_table(fact_play, tmp_path, monkeypatch):
+    write_output = src.storage.write_output
+    def failing_write_output(data, dir, name, append=False):
+        if name == "dim_user":
+            raise OSError("disk full")
+        write_output(data, dir, name, append=append)
+    monkeypatch.setattr("src.storage.write_output", failing_write_output)
+
+    writer = AsyncOutputWriter(threads=2, max_pending=1)
+    writer.submit(fact_play, tmp_path, "dim_user")
+    writer.submit(fact_play, tmp_path, "fact_play_session")
+    # Another table's failure is not raised by wait()
+    writer.wait("fact_play_session")
+    assert len(read_table(tmp_path, "fact_play_session")) == 4
+    # Submitting after a wait() leaves the writer usable for barrier()
+    writer.submit(fact_play, tmp_path, "dim_date")
+    with pytest.raises(OutputWriteError, match=r"dim_user \(disk full\)"):
+        writer.barrier()
+    assert len(read_table(tmp_path, "dim_date")) == 4
+
+@pytest.mark.parametrize("compression", ["uncompressed", "lz4"])
+def test_feather_tables_are_memory_mapped(fact_play, tmp_path, monkeypatch, compression):
+    monkeypatch.setattr("src.storage.OUTPUT_FORMAT", "feather")
+    monkeypatch.setattr("src.storage.FEATHER_COMPRESSION", compression)
+    write_output(fact_play.iloc[:2], tmp_path, "fact_play_session")
+    writer = ChunkedOutputWriter(tmp_path, "fact_play_session", append=True)
+    writer.write(fact_play.iloc[2:])
+    writer.close()
+
+    df = read_table(tmp_path, "fact_play_session", columns=["play_session_id", "total_score"],
+                    filters=date_range_filter("fact_play_session", 20240301, 20240331))
+    assert (tmp_path / "fact_play_session.feather").is_file()
+    assert list(df.columns) == ["play_session_id", "total_score"]
+    assert df["play_session_id"].tolist() == [2, 3]
+    full = read_table(tmp_path, "fact_play_session")
+    pd.testing.assert_frame_equal(full, fact_play)
@@ -1,7 +1,13 @@
 # tests/test_transformations.py
+from functools import partial
 import pandas as pd
 import pytest
-from src.transformations import StarSchemaBuilder
+from src.transformations import StarSchemaBuilder, subscription_period_rows, user_engagement_rows
+from src.config import UNKNOWN_KEY, OPEN_ENDED_DATE_KEY, UNKNOWN_DATE_KEY
+from src.pipeline_state import PipelineState
+from src.data_loader import apply_schema
+from src.data_quality import DataQualityError, DataQualityValidator
+from src.storage import OutputWriteError, read_table
 
 @pytest.fixture
 def sample_raw_data():
@@ -27,19 +33,27 @@ def sample_raw_data():
     }
 
 @pytest.fixture
-def builder(sample_raw_data):
-    """Initializes the builder with mock data."""
+def builder(sample_raw_data, tmp_path, monkeypatch):
+    """Initializes the builder with mock data, writing its outputs under tmp_path."""
+    monkeypatch.setattr("src.transformations.FACT_DIR", tmp_path / "facts")
+    monkeypatch.setattr("src.transformations.DIM_DIR", tmp_path / "dims")
+    monkeypatch.setattr("src.transformations.AGG_DIR", tmp_path / "aggregates")
     return StarSchemaBuilder(sample_raw_data)
 
 def test_create_dim_user(builder):
+    builder.raw_data["user"]["ip_address"] = ["1.1.1.1", "1.1.1.1"]
     builder._create_dim_user()
     dim_user = builder.dimensions["dim_user"]
+    attributes = builder.dimensions["dim_user_attributes"]
     
     assert "user_key" in dim_user.columns
-    assert "username" in dim_user.columns
-    assert "ip_address" in dim_user.columns
+    assert "username" not in dim_user.columns
     assert len(dim_user) == 2
-    assert dim_user.loc[dim_user["user_id"] == 1, "username"].values[0] == "user1"
+    # Descriptive columns live in the side table, keyed on user_key
+    user_key = dim_user.loc[dim_user["user_id"] == 1, "user_key"].values[0]
+    assert attributes.loc[attributes["user_key"] == user_key, "username"].values[0] == "user1"
+    assert attributes["ip_address"].dtype == "category"
+    assert attributes["username"].dtype != "category"
 
 def test_create_fact_play_session_duration(builder):
     # Need to create dimensions first
@@ -52,4 +66,193 @@ def test_create_fact_play_session_duration(builder):
     assert "user_key" in fact_play.columns
     assert "channel_key" in fact_play.columns
     assert "status_key" in fact_play.columns
-    assert fact_play["start_date_key"].values[0] == 20240101
\ No newline at end of file
+    assert fact_play["start_date_key"].values[0] == 20240101
+
+def test_create_fact_play_session_streamed(builder, sample_raw_data, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.transformations.FACT_DIR", tmp_path)
+    builder.create_dimensions()
+
+    first = sample_raw_data["play_session"]
+    second = first.assign(play_session_id=[1002], user_id=[2], total_score=[90])
+    builder._create_fact_play_session(chunks=iter([first, second]))
+
+    fact_play = read_table(tmp_path, "fact_play_session").sort_values("play_session_id")
+    assert "fact_play_session" not in builder.facts
+    assert fact_play["play_session_id"].tolist() == [1001, 1002]
+    assert fact_play["user_key"].tolist() == [1, 2]
+    assert fact_play["duration_minutes"].tolist() == [30.0, 30.0]
+
+def test_failed_check_discards_streamed_fact(builder, sample_raw_data, tmp_path):
+    builder.create_dimensions()
+    builder._create_fact_play_session(chunks=iter([sample_raw_data["play_session"]]))
+
+    # The repeated session id fails the check once the stream ends
+    dq = DataQualityValidator()
+    chunks = [sample_raw_data["play_session"].assign(play_session_id=[1002]),
+              sample_raw_data["play_session"].assign(play_session_id=[1002])]
+    with pytest.raises(DataQualityError):
+        builder._create_fact_play_session(chunks=dq.checked_chunks(
+            iter(chunks), "play_session", max_failed_rows=None, raise_on_failure=True))
+
+    fact_play = read_table(tmp_path / "facts", "fact_play_session")
+    assert fact_play["play_session_id"].tolist() == [1001]
+    assert dq.results["failed"] == ["DQ_UNIQUE: play_session on ['play_session_id']"]
+
+def test_create_fact_play_session_unmatched_keys(builder, sample_raw_data):
+    sample_raw_data["play_session"]["user_id"] = [99]
+    builder.create_dimensions()
+    builder._create_fact_play_session()
+    fact_play = builder.facts["fact_play_session"]
+
+    assert fact_play["user_key"].tolist() == [UNKNOWN_KEY]
+    assert fact_play["user_key"].dtype == "int32"
+    assert builder.unmatched_keys == {"fact_play_session.user_key": 1}
+
+def test_incremental_run_appends_new_sessions(sample_raw_data, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.transformations.FACT_DIR", tmp_path / "facts")
+    monkeypatch.setattr("src.transformations.DIM_DIR", tmp_path / "dims")
+    monkeypatch.setattr("src.transformations.AGG_DIR", tmp_path / "aggregates")
+    sessions = sample_raw_data["play_session"]
+
+    state = PipelineState(tmp_path / "state")
+    full = StarSchemaBuilder(sample_raw_data, state=state)
+    full.create_dimensions()
+    full._create_fact_play_session()
+    full._create_rollups()
+    full._create_fact_user_engagement()
+    full.outputs.barrier()
+    state.save()
+
+    # Next run: user 2 is listed first and one new session arrives
+    sample_raw_data["user"] = sample_raw_data["user"].iloc[::-1]
+    sample_raw_data["play_session"] = pd.concat([
+        sessions, sessions.assign(play_session_id=[1002], user_id=[2])
+    ])
+    state = PipelineState(tmp_path / "state")
+    delta = StarSchemaBuilder(sample_raw_data, state=state, incremental=True)
+    delta.create_dimensions()
+    delta._create_fact_play_session()
+    delta._create_rollups()
+    delta._create_fact_user_engagement()
+    delta.outputs.barrier()
+
+    fact_play = read_table(tmp_path / "facts", "fact_play_session").sort_values("play_session_id")
+    assert delta.facts["fact_play_session"]["play_session_id"].tolist() == [1002]
+    assert fact_play["play_session_id"].tolist() == [1001, 1002]
+    assert fact_play["user_key"].tolist() == [1, 2]
+    assert state.get_watermark("play_session") == 1002
+    # The stored user rollup was updated with the new session only
+    user_rollup = read_table(tmp_path / "aggregates", "agg_play_session_user").sort_values("user_key")
+    assert user_rollup["user_key"].tolist() == [1, 2]
+    assert user_rollup["session_count"].tolist() == [1, 1]
+    # Only user 2's engagement rows were rebuilt, from the updated daily rollup
+    engagement = read_table(tmp_path / "facts", "fact_user_engagement").sort_values("user_key")
+    assert engagement["user_key"].tolist() == [1, 2]
+    assert engagement["session_count"].tolist() == [1, 1]
+
+def test_subscription_period_rows():
+    subscriptions = pd.DataFrame({
+        "user_key": [1, 2, 3, 4, 5, 6],
+        "plan_key": [1, 2, 3, 1, 1, 1],
+        "payment_detail_key": [1, 2, 3, 4, 5, 6],
+        "start_date_key": [20240131, 20230315, 20240210, 20240501, 20240110, 20240110],
+        "end_date_key": [OPEN_ENDED_DATE_KEY, 20241124, OPEN_ENDED_DATE_KEY, OPEN_ENDED_DATE_KEY, 20240210,
+                         UNKNOWN_DATE_KEY],
+        "cost_amount": [1.99, 9.99, 14.99, 1.99, 1.99, 1.99],
+    })
+    periods = subscription_period_rows(subscriptions, [1, 12, 0, 1, 1, 1], as_of_key=20240430)
+
+    # Monthly from Jan 31 lands on each month's last day, up to the as-of date;
+    # annual periods run until the subscription ends; one-time plans bill once;
+    # nothing is billed after the as-of date or for a missing end date
+    assert periods["user_key"].tolist() == [1, 1, 1, 1, 2, 2, 3, 5]
+    assert periods["period_number"].tolist() == [1, 2, 3, 4, 1, 2, 1, 1]
+    assert periods["period_start_date_key"].tolist() == [
+        20240131, 20240229, 20240331, 20240430, 20230315, 20240315, 20240210, 20240110]
+    assert periods["period_end_date_key"].tolist() == [
+        20240229, 20240331, 20240430, 20240531, 20240315, 20241124, OPEN_ENDED_DATE_KEY, 20240210]
+    assert periods["billed_amount"].sum() == pytest.approx(4 * 1.99 + 2 * 9.99 + 14.99 + 1.99)
+
+def test_user_engagement_rows():
+    daily = pd.DataFrame({
+        "user_key": [2, 1, 1, 1, 1, UNKNOWN_KEY],
+        "start_date_key": [20240110, 20240101, 20240102, 20240105, 20240301, 20240101],
+        "session_count": [1, 2, 1, 3, 1, 9],
+        "score_sum": [10, 20, 10, 30, 10, 90],
+        "duration_sum": [1.0, 2.0, 1.0, 3.0, 1.0, 9.0],
+    })
+    rows = user_engagement_rows(daily, as_of_key=20240315)
+
+    assert rows["user_key"].tolist() == [1, 1, 1, 1, 2]
+    assert rows["days_since_last_active"].tolist() == [pd.NA, 1, 3, 56, pd.NA]
+    assert rows["days_to_next_active"].tolist() == [1, 3, 56, pd.NA, pd.NA]
+    assert rows["streak_days"].tolist() == [1, 2, 1, 1, 1]
+    # Trailing 7 days: 2024-01-05 still covers 2024-01-01
+    assert rows["window_session_count"].tolist() == [2, 3, 6, 1, 1]
+    assert rows["window_score_sum"].tolist() == [20, 30, 60, 10, 10]
+    # Idle more than 30 days after: the 56-day gap, and user 2 since 2024-01-10
+    assert rows["is_churned"].tolist() == [False, False, True, False, True]
+
+def test_parallel_build_matches_sequential(sample_raw_data, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.transformations.FACT_DIR", tmp_path / "facts")
+    monkeypatch.setattr("src.transformations.DIM_DIR", tmp_path / "dims")
+    monkeypatch.setattr("src.transformations.AGG_DIR", tmp_path / "aggregates")
+    sample_raw_data.update({
+        "plan": pd.DataFrame({"plan_id": [1], "payment_frequency_code": ["MONTHLY"], "cost_amount": [1.99]}),
+        "payment_frequency": pd.DataFrame({"payment_frequency_code": ["MONTHLY"], "english_description": ["Monthly"]}),
+        "payment_detail": pd.DataFrame({"payment_detail_id": [7], "payment_method_code": ["PAYPAL"]}),
+        "user_plan": pd.DataFrame({
+            "user_registration_id": [101], "payment_detail_id": [7], "plan_id": [1],
+            "start_date": ["2024-01-01T00:00:00.000-06:00"], "end_date": ["9999-01-01T00:00:00.000-06:00"],
+        }),
+    })
+    sequential = StarSchemaBuilder(sample_raw_data, max_workers=1)
+    sequential.create_dimensions()
+    sequential.create_facts()
+    parallel = StarSchemaBuilder(sample_raw_data, max_workers=4)
+    parallel.build()
+
+    for name, df in sequential.in_memory_tables().items():
+        pd.testing.assert_frame_equal(parallel.in_memory_tables()[name], df)
+
+def test_fact_processes_build_play_sessions_from_csv(sample_raw_data, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.transformations.FACT_DIR", tmp_path / "facts")
+    monkeypatch.setattr("src.transformations.DIM_DIR", tmp_path / "dims")
+    monkeypatch.setattr("src.transformations.AGG_DIR", tmp_path / "aggregates")
+    # A few hundred bytes per shard, so the 40 sessions span several workers' shards
+    monkeypatch.setattr("src.transformations.FACT_SHARD_BYTES", 400)
+    sessions = pd.concat([sample_raw_data["play_session"]] * 40, ignore_index=True)
+    sessions["play_session_id"] = range(1, 41)
+    sessions.loc[sessions["play_session_id"] % 7 == 0, "user_id"] = 99
+    sessions.to_csv(tmp_path / "user_play_session.csv", index=False)
+
+    dq = DataQualityValidator()
+    check = partial(dq.checked_chunks, table_name="play_session", parents=sample_raw_data, max_failed_rows=None)
+    builder = StarSchemaBuilder(sample_raw_data, fact_processes=2, raw_data_dir=tmp_path,
+                                check_play_sessions=check, check_columns=["play_session_id", "user_id"])
+    builder.create_dimensions()
+    builder._create_fact_play_session()
+    # Checked from the columns the workers sent back, without parsing the file again
+    assert dq.check_results["DQ_UNIQUE: play_session on ['play_session_id']"].rows_checked == 40
+    assert dq.check_results["DQ_REF_INTEGRITY: user->play_session"].failed_rows == 5
+    # Read before the expected build below queues its own write of the fact
+    fact_play = read_table(tmp_path / "facts", "fact_play_session").sort_values("play_session_id")
+    expected = StarSchemaBuilder({**sample_raw_data, "play_session": apply_schema(sessions, "play_session")})
+    expected.create_dimensions()
+    expected._create_fact_play_session()
+
+    pd.testing.assert_frame_equal(fact_play.reset_index(drop=True), expected.facts["fact_play_session"])
+    assert builder.unmatched_keys == {"fact_play_session.user_key": 5}
+    assert sum(len(p) for p in builder._rollup_partials["agg_play_session_user"]) > 1
+
+def test_save_output_errors_surface_at_barrier(builder, tmp_path, monkeypatch):
+    monkeypatch.setattr("src.transformations.DIM_DIR", tmp_path)
+
+    def failing_write(data, dir, name, append=False):
+        raise OSError("disk full")
+    monkeypatch.setattr("src.storage.write_output", failing_write)
+    builder._create_dim_date()
+    with pytest.raises(OutputWriteError, match=r"dim_date \(disk full\)"):
+        builder.outputs.barrier()
+    # Errors are reported once
+    builder.outputs.barrier()